@@ -8,12 +8,20 @@ if sys.platform == 'win32':
     import io
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, ConfigDict
-from typing import Optional, List
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+from typing import Optional, List, Union
 import json
+import asyncio
+import contextvars
+import threading
 from dotenv import load_dotenv
 from contextlib import asynccontextmanager
+import importlib.util
+from utils.inference_executor import InferenceExecutor, ExecutorSaturated
+from utils.warmup import WarmupTracker
+from utils.instrumentation import InstrumentationMiddleware, metrics, span
 
 # Import Deepseek Agent
 try:
@@ -24,6 +32,11 @@ except Exception as e:
     print(f"[WARNING] Deepseek not available: {e}")
     HAS_DEEPSEEK = False
 
+# Product recommender is imported during background warm-up; only check it can be
+HAS_RECOMMENDER = importlib.util.find_spec("sentence_transformers") is not None
+if not HAS_RECOMMENDER:
+    print("[WARNING] Recommender not available: sentence_transformers is not installed")
+
 # Load environment variables
 load_dotenv()
 
@@ -33,13 +46,202 @@ deepseek_agent = None
 # Initialize recommender model early - lazy load
 recommender = None
 
+# Coalesces concurrent /recommend query encodes into batched model calls
+encode_batcher = None
+
+# Dedicated, bounded executor for CPU-bound inference (keeps the event loop free)
+inference_executor = None
+
+# Shared cache of deterministic agent replies
+response_cache = None
+
+# Batches concurrent trained-agent requests into shared forward passes (created on first use)
+generation_engine = None
+_generation_engine_lock = asyncio.Lock()
+
+# Remote inference API agent (only when an endpoint or token is configured)
+sales_agent = None
+
+# Picks the reply generator per request from its latency budget
+generation_router = None
+
+# Warm-up progress behind /health/ready; models load after the app starts serving
+warmup = WarmupTracker()
+warmup_task = None
+
+def _index_params_from_env():
+    """Approximate index knobs (only used when INDEX_BACKEND=ivf)"""
+    if os.getenv("INDEX_BACKEND", "exact") != "ivf":
+        return {}
+    params = {"nprobe": int(os.getenv("IVF_NPROBE", 8))}
+    if os.getenv("IVF_NLIST"):
+        params["nlist"] = int(os.getenv("IVF_NLIST"))
+    return params
+
+def _session_store_from_env():
+    """Per-session conversation state limits"""
+    from utils.session_store import SessionStore
+    return SessionStore(
+        max_turns=int(os.getenv("SESSION_MAX_TURNS", 20)),
+        idle_ttl_seconds=float(os.getenv("SESSION_IDLE_TTL", 1800)),
+        max_bytes=int(float(os.getenv("SESSION_MAX_MB", 64)) * 1024 * 1024)
+    )
+
+def _response_cache_from_env():
+    """Reply cache limits and the agent paths allowed to use it"""
+    from utils.response_cache import ResponseCache, RESPONSE_CACHE_PATHS
+    paths = os.getenv("RESPONSE_CACHE_PATHS")
+    return ResponseCache(
+        max_entries=int(os.getenv("RESPONSE_CACHE_ENTRIES", 4096)),
+        ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL")) if os.getenv("RESPONSE_CACHE_TTL") else None,
+        cacheable_paths=[p.strip() for p in paths.split(",") if p.strip()] if paths is not None else RESPONSE_CACHE_PATHS
+    )
+
+def _build_recommender():
+    """Load the embedding model, build the product index and run one warm encode"""
+    from models.recommender_model import RecommenderModel
+
+    if os.getenv("SHARED_WEIGHTS", "false").lower() == "true":
+        from utils.model_registry import enable_shared_weights
+        enable_shared_weights(os.getenv("SHARED_WEIGHTS_DIR", "shared_weights"))
+    model = RecommenderModel(
+        os.getenv("PRODUCTS_JSON", "products.json"),
+        cache_dir=os.getenv("EMBEDDING_CACHE_DIR", "embedding_cache") or None,
+        index_backend=os.getenv("INDEX_BACKEND", "exact"),
+        index_params=_index_params_from_env(),
+        engine_options={
+            "query_cache_bytes": int(float(os.getenv("QUERY_CACHE_MB", 8)) * 1024 * 1024),
+            "query_cache_ttl": float(os.getenv("QUERY_CACHE_TTL")) if os.getenv("QUERY_CACHE_TTL") else None
+        }
+    )
+    # First encode pays for lazy kernel / tokenizer setup; do it before traffic does
+    model.engine.encode_batch(["warm up"], lookup=False)
+    return model
+
+async def _warm_up():
+    """Load models in the background so the app can answer health checks meanwhile"""
+    global recommender, encode_batcher
+
+    # Build the product index once; every /recommend call shares it
+    if HAS_RECOMMENDER:
+        try:
+            with warmup.track("recommender"):
+                model = await asyncio.to_thread(_build_recommender)
+                print(f"[✓] Recommender index built for {len(model.products)} products")
+
+                from utils.micro_batcher import MicroBatcher
+                engine = model.engine
+                encode_batcher = MicroBatcher(
+                    lambda texts: engine.encode_batch(texts, lookup=False),
+                    max_batch_size=int(os.getenv("ENCODE_MAX_BATCH", 32)),
+                    max_wait_ms=float(os.getenv("ENCODE_BATCH_WINDOW_MS", 3)),
+                    lookup_fn=engine.cached,
+                    executor=inference_executor
+                )
+                await encode_batcher.start()
+                # Published last: routes treat recommender as the "ready" flag
+                recommender = model
+        except Exception as e:
+            print(f"[ERROR] Could not initialize recommender: {e}")
+
+    if os.getenv("WARMUP_TRAINED_MODEL", "false").lower() == "true":
+        try:
+            with warmup.track("trained_model"):
+                if await _get_generation_engine() is None:
+                    raise RuntimeError("Trained model not available")
+        except Exception as e:
+            print(f"[WARNING] Trained model warm-up failed: {e}")
+
+    from utils.memory_report import print_memory_report
+    print_memory_report("warm-up complete")
+
+def _build_generation_router():
+    """Tiers from most to least capable: remote LLM, local model, rules, keyword fallback"""
+    global sales_agent
+    from models.generation_router import GenerationRouter, GenerationTier, TierUnavailable
+    from models.trained_agent import contextual_response
+
+    available = {}
+    if os.getenv("HF_API_URL") or os.getenv("HUGGINGFACE_TOKEN"):
+        from models.sales_agent import AISalesAgent
+        from utils.http_client import CircuitOpen
+        sales_agent = AISalesAgent()
+
+        async def remote(message, session_id, context, timeout, cancel_event):
+            try:
+                return await sales_agent.generate_remote(message, context, deadline=timeout)
+            except CircuitOpen:
+                raise TierUnavailable("Inference API circuit is open")
+
+        available["remote"] = GenerationTier(
+            "remote", remote, model=sales_agent.model_name, enforces_deadline=True,
+            prior_ms=float(os.getenv("ROUTER_REMOTE_PRIOR_MS", 1500)),
+            max_concurrency=int(os.getenv("ROUTER_REMOTE_CONCURRENCY", 32))
+        )
+
+    async def trained(message, session_id, context, timeout, cancel_event):
+        # Served only once the model is loaded (warm-up or /chat/trained); never loads inline
+        if generation_engine is None:
+            raise TierUnavailable("Trained model not loaded")
+        return await generation_engine.generate(message, session_id, cancel_event=cancel_event)
+
+    def rules_reply(message, session_id, cancel_event):
+        # Still queued when the router gave up - the reply would be thrown away
+        if cancel_event.is_set():
+            raise TierUnavailable("Cancelled before it started")
+        # The router records the exchange, so the agent must not
+        return deepseek_agent.generate_response(message, session_id, record_history=False)
+
+    async def rules(message, session_id, context, timeout, cancel_event):
+        if deepseek_agent is None:
+            raise TierUnavailable("Agent not initialized")
+        return await inference_executor.run(rules_reply, message, session_id, cancel_event)
+
+    async def fallback(message, session_id, context, timeout, cancel_event):
+        return contextual_response(message)
+
+    available["trained"] = GenerationTier(
+        "trained", trained, model="trained_sales_agent",
+        prior_ms=float(os.getenv("ROUTER_TRAINED_PRIOR_MS", 400)),
+        max_concurrency=int(os.getenv("ROUTER_TRAINED_CONCURRENCY", 16))
+    )
+    available["rules"] = GenerationTier("rules", rules, model="deepseek_abfrl", prior_ms=1.0)
+    available["fallback"] = GenerationTier("fallback", fallback, model="contextual_fallback", prior_ms=0.1)
+
+    names = [n.strip() for n in os.getenv("ROUTER_TIERS", "remote,trained,rules,fallback").split(",") if n.strip()]
+    tiers = [available[name] for name in names if name in available]
+    if not tiers or tiers[-1].name != "fallback":
+        # The keyword fallback can't fail, so it always closes the chain
+        tiers.append(available["fallback"])
+    return GenerationRouter(
+        tiers,
+        default_budget_ms=float(os.getenv("ROUTER_BUDGET_MS", 800)),
+        sessions=deepseek_agent.sessions if deepseek_agent is not None else None
+    )
+
 # Lifespan context manager
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    global deepseek_agent
+    global deepseek_agent, inference_executor, response_cache, warmup_task, generation_router
+    warmup.register("deepseek_agent")
+    if HAS_RECOMMENDER:
+        warmup.register("recommender")
+    else:
+        warmup.skip("recommender", "sentence_transformers is not installed")
+    if os.getenv("WARMUP_TRAINED_MODEL", "false").lower() == "true":
+        warmup.register("trained_model", required=False)
+
+    inference_executor = InferenceExecutor(
+        max_workers=int(os.getenv("INFERENCE_WORKERS", 2)),
+        max_queue=int(os.getenv("INFERENCE_QUEUE", 64)),
+        retry_after=int(os.getenv("INFERENCE_RETRY_AFTER", 1))
+    )
+    response_cache = _response_cache_from_env()
+    warmup.start("deepseek_agent")
     try:
-        deepseek_agent = get_deepseek_agent()
+        deepseek_agent = get_deepseek_agent(_session_store_from_env(), response_cache)
+        warmup.finish("deepseek_agent")
         print("[✓] ABFRL Sales Agent (Deepseek) initialized successfully")
         print("[✓] Retail Genie Service Ready on http://localhost:8000")
     except Exception as e:
@@ -47,24 +249,63 @@ async def lifespan(app: FastAPI):
         # Still try to create a basic agent
         try:
             deepseek_agent = get_deepseek_agent()
-        except:
+            warmup.finish("deepseek_agent")
+        except Exception as e:
+            warmup.finish("deepseek_agent", "failed", str(e))
             print("[WARNING] Running without agent - using demo responses")
+
+    generation_router = _build_generation_router()
+    print(f"[OK] Generation tiers: {' > '.join(tier.name for tier in generation_router.tiers)}")
+
+    warmup_task = asyncio.create_task(_warm_up())
     yield
     # Shutdown
+    if not warmup_task.done():
+        warmup_task.cancel()
+    if encode_batcher is not None:
+        await encode_batcher.stop()
+    if generation_engine is not None:
+        await generation_engine.stop()
+    if sales_agent is not None:
+        await sales_agent.client.aclose()
+        sales_agent.client.close()
+    inference_executor.shutdown(wait=False, cancel_futures=True)
     print("[STOP] Retail Genie Service Stopped")
 
+class TimedJSONResponse(JSONResponse):
+    """JSON response whose encoding shows up as the serialization span"""
+
+    def render(self, content) -> bytes:
+        with span("serialization"):
+            return super().render(content)
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Retail-Genie-Prototype",
     description="AI-powered retail sales assistant with Deepseek",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=TimedJSONResponse
 )
 
+# Request IDs, per-endpoint latency histograms and Server-Timing breakdowns
+app.add_middleware(InstrumentationMiddleware)
+
+# Backpressure: a full inference queue answers fast instead of queueing unbounded
+@app.exception_handler(ExecutorSaturated)
+async def executor_saturated_handler(request: Request, exc: ExecutorSaturated):
+    return JSONResponse(
+        status_code=503,
+        content={"success": False, "detail": "Server busy, please retry"},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 # Pydantic request model
 class MessageRequest(BaseModel):
     user_message: str
     context: Optional[str] = ""
+    session_id: Optional[str] = None
+    latency_budget_ms: Optional[float] = None
 
 # Pydantic response model
 class MessageResponse(BaseModel):
@@ -72,23 +313,80 @@ class MessageResponse(BaseModel):
     response: str
     user_message: str
     model: str
+    session_id: Optional[str] = None
+    tier: Optional[str] = None
+    latency_ms: Optional[float] = None
+
+# Pydantic recommendation request model
+class RecommendRequest(BaseModel):
+    query: str
+    top_k: int = 5
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    category: Optional[str] = None
+
+    def filters(self) -> dict:
+        return {
+            "min_price": self.min_price,
+            "max_price": self.max_price,
+            "category": self.category
+        }
+
+# Pydantic batch recommendation request model
+class BatchRecommendRequest(BaseModel):
+    queries: List[RecommendRequest]
+
+# Pydantic catalog update models
+class ProductItem(BaseModel):
+    """A catalog product; fields other than _id are stored as sent"""
+    model_config = ConfigDict(extra="allow")
+    id: Union[int, str] = Field(alias="_id")
+
+    @field_validator("id")
+    @classmethod
+    def id_not_blank(cls, value):
+        if isinstance(value, str) and not value.strip():
+            raise ValueError("_id must not be empty")
+        return value
+
+class ProductUpsertRequest(BaseModel):
+    products: List[ProductItem]
+
+class ProductDeleteRequest(BaseModel):
+    ids: List[Union[int, str]]
 
 # Health check endpoint
 @app.get("/")
-def health_check():
+async def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
         "service": "Retail Genie Deepseek AI",
         "version": "1.0.0",
-        "ai_ready": HAS_DEEPSEEK
+        "ai_ready": HAS_DEEPSEEK,
+        "recommender_ready": recommender is not None
     }
 
+# Liveness probe - answers as soon as the process serves requests
+@app.get("/health/live")
+async def health_live():
+    """Process is up; says nothing about models"""
+    return {"status": "alive", "uptime_seconds": warmup.report()["uptime_seconds"]}
+
+# Readiness probe - 503 until every required component has warmed up
+@app.get("/health/ready")
+async def health_ready():
+    """Per-component warm-up progress and timings"""
+    report = warmup.report()
+    report["status"] = "ready" if report["ready"] else "warming_up"
+    return JSONResponse(status_code=200 if report["ready"] else 503, content=report)
+
 # Main AI message endpoint
 @app.post("/generate-message", response_model=MessageResponse)
-def generate_message(request: MessageRequest):
+async def generate_message(request: MessageRequest):
     """
-    Generate AI response using ABFRL Sales Agent (Deepseek)
+    Generate AI response from the best tier that fits the latency budget
+    (remote LLM, trained model, ABFRL rules agent, keyword fallback)
     """
     try:
         user_message = request.user_message
@@ -97,18 +395,21 @@ def generate_message(request: MessageRequest):
         if not user_message:
             raise ValueError("user_message is required")
         
-        # Always use Deepseek agent (it has intelligent fallbacks)
-        if deepseek_agent is None:
+        if generation_router is None:
             raise ValueError("Agent not initialized")
         
-        # Generate response using Deepseek agent
-        response = deepseek_agent.generate_response(user_message)
+        result = await generation_router.generate(
+            user_message, request.session_id, context, request.latency_budget_ms
+        )
         
         return MessageResponse(
             success=True,
-            response=response,
+            response=result.response,
             user_message=user_message,
-            model="deepseek_abfrl"
+            model=result.model,
+            session_id=request.session_id,
+            tier=result.tier,
+            latency_ms=result.latency_ms
         )
     
     except Exception as e:
@@ -118,32 +419,263 @@ def generate_message(request: MessageRequest):
             success=True,
             response="I'm having trouble processing that right now. Could you tell me what you're looking for? (Party wear, Wedding, Casual, etc.)",
             user_message=request.user_message if request else "error",
-            model="deepseek_abfrl_error"
+            model="deepseek_abfrl_error",
+            session_id=request.session_id if request else None
         )
 
 # Conversation endpoint
 @app.post("/chat")
-def chat(request: MessageRequest):
+async def chat(request: MessageRequest):
     """Chat endpoint - alias for generate-message"""
-    return generate_message(request)
+    return await generate_message(request)
+
+async def _get_generation_engine():
+    """Load the trained model and start the batched generation engine once"""
+    global generation_engine
+    async with _generation_engine_lock:
+        if generation_engine is None:
+            from models.trained_agent import get_trained_agent
+            from models.generation_engine import BatchedGenerationEngine
+            agent = await inference_executor.run(get_trained_agent, response_cache)
+            if agent is None:
+                return None
+            from utils.memory_report import print_memory_report
+            print_memory_report("trained model loaded")
+            generation_engine = BatchedGenerationEngine(
+                agent,
+                max_batch_size=int(os.getenv("GEN_MAX_BATCH", 8)),
+                max_wait_ms=float(os.getenv("GEN_BATCH_WINDOW_MS", 10)),
+                executor=inference_executor
+            )
+            await generation_engine.start()
+    return generation_engine
+
+# Trained model conversation endpoint (batched generation)
+@app.post("/chat/trained", response_model=MessageResponse)
+async def chat_trained(request: MessageRequest):
+    """Reply with the trained sales agent; concurrent requests share forward passes"""
+    if not request.user_message:
+        raise HTTPException(status_code=400, detail="user_message is required")
+
+    engine = await _get_generation_engine()
+    if engine is None:
+        raise HTTPException(status_code=503, detail="Trained model not available")
+
+    response = await engine.generate(request.user_message, request.session_id)
+    return MessageResponse(
+        success=True,
+        response=response,
+        user_message=request.user_message,
+        model="trained_sales_agent",
+        session_id=request.session_id
+    )
+
+# Streaming conversation endpoint (Server-Sent Events)
+@app.post("/chat/stream")
+async def chat_stream(request: MessageRequest):
+    """Stream the trained agent's reply token by token as Server-Sent Events"""
+    if not request.user_message:
+        raise HTTPException(status_code=400, detail="user_message is required")
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    cancel = threading.Event()
+
+    def produce():
+        model = "trained_sales_agent"
+        try:
+            from models.trained_agent import get_trained_agent
+            agent = get_trained_agent(response_cache)
+            if agent is not None:
+                chunks = agent.stream_response(
+                    request.user_message, cancel_event=cancel, session_id=request.session_id
+                )
+            else:
+                # No local model - send the rule-based reply as a single chunk
+                model = "deepseek_abfrl"
+                chunks = [deepseek_agent.generate_response(request.user_message, request.session_id)]
+            for chunk in chunks:
+                loop.call_soon_threadsafe(queue.put_nowait, ("token", chunk))
+        except Exception as e:
+            print(f"ERROR in /chat/stream: {str(e)}")
+            loop.call_soon_threadsafe(queue.put_nowait, ("error", str(e)))
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, ("done", model))
+
+    # Submitting here (not inside the stream) lets a full queue still answer 503;
+    # the copied context keeps the request ID and spans in the worker thread
+    loop.run_in_executor(inference_executor, contextvars.copy_context().run, produce)
+
+    async def events():
+        parts = []
+        try:
+            while True:
+                kind, value = await queue.get()
+                if kind == "token":
+                    parts.append(value)
+                    yield f"data: {json.dumps({'token': value})}\n\n"
+                elif kind == "error":
+                    yield f"event: error\ndata: {json.dumps({'detail': value})}\n\n"
+                else:
+                    yield f"event: done\ndata: {json.dumps({'response': ''.join(parts), 'model': value})}\n\n"
+                    break
+        finally:
+            # Client went away - stop generating
+            cancel.set()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # Clear history endpoint
 @app.post("/clear-history")
-def clear_history():
-    """Clear conversation history"""
+async def clear_history(session_id: Optional[str] = None):
+    """Clear conversation history for one session"""
     global deepseek_agent
     if deepseek_agent:
-        deepseek_agent.clear_history()
-    return {"status": "history_cleared"}
+        deepseek_agent.clear_history(session_id)
+    if generation_engine is not None and generation_engine.agent.kv_cache is not None:
+        generation_engine.agent.kv_cache.clear(session_id)
+    return {"status": "history_cleared", "session_id": session_id}
 
 # Get history endpoint
 @app.get("/history")
-def get_history():
-    """Get conversation history"""
+async def get_history(session_id: Optional[str] = None):
+    """Get conversation history for one session"""
     global deepseek_agent
     if deepseek_agent:
-        return {"history": deepseek_agent.get_history()}
-    return {"history": []}
+        return {"history": deepseek_agent.get_history(session_id), "session_id": session_id}
+    return {"history": [], "session_id": session_id}
+
+# Loaded model report endpoint
+@app.get("/models")
+async def get_models():
+    """Load time and memory footprint of shared embedding models"""
+    from utils.model_registry import get_registry_stats
+    return {"models": get_registry_stats()}
+
+# Cache statistics endpoint
+@app.get("/stats/cache")
+async def get_cache_stats():
+    """Hit/miss/eviction counters for in-process caches"""
+    stats = {}
+    if deepseek_agent is not None:
+        stats["sessions"] = deepseek_agent.sessions.stats()
+    if recommender is not None and recommender.engine.query_cache is not None:
+        stats["query_embeddings"] = recommender.engine.query_cache.stats()
+    if encode_batcher is not None:
+        stats["encode_batcher"] = encode_batcher.stats()
+    if response_cache is not None:
+        stats["responses"] = response_cache.stats()
+    return stats
+
+# Prometheus metrics endpoint
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Request latency histograms and hot-path stage timings (Prometheus text format)"""
+    return PlainTextResponse(metrics.prometheus(), media_type="text/plain; version=0.0.4")
+
+# Latency percentile endpoint
+@app.get("/stats/latency")
+async def get_latency_stats():
+    """p50/p95/p99 per endpoint and per stage"""
+    return metrics.latency_report()
+
+# Worker memory endpoint
+@app.get("/stats/memory")
+async def get_memory_stats():
+    """Resident vs shared memory of this worker, per mapped model file"""
+    from utils.memory_report import memory_report
+    return memory_report()
+
+# Inference executor metrics endpoint
+@app.get("/stats/executor")
+async def get_executor_stats():
+    """Queue depth, wait time and utilization of the inference executor"""
+    return inference_executor.stats() if inference_executor is not None else {}
+
+# Batched generation report endpoint
+@app.get("/stats/generation")
+async def get_generation_stats():
+    """Throughput versus latency of batched trained-agent generation"""
+    return generation_engine.report() if generation_engine is not None else {}
+
+# Generation tier routing endpoint
+@app.get("/stats/router")
+async def get_router_stats():
+    """Per-tier traffic, latency estimates and how often requests degraded"""
+    if generation_router is None:
+        return {}
+    stats = generation_router.stats()
+    if sales_agent is not None:
+        stats["remote_client"] = sales_agent.client.stats()
+    return stats
+
+# Product recommendation endpoint
+@app.post("/recommend")
+async def recommend(request: RecommendRequest):
+    """Get top-k product recommendations for a query"""
+    if recommender is None:
+        raise HTTPException(status_code=503, detail="Recommender not initialized")
+
+    # Concurrent requests share one batched encode
+    with span("encode_batched"):
+        query_vec = await encode_batcher.submit(request.query.lower())
+    results = await inference_executor.run(
+        recommender.recommend_by_vector, query_vec, request.top_k, request.filters()
+    )
+    return {
+        "success": True,
+        "results": results,
+        "count": len(results),
+        "query_used": request.query
+    }
+
+# Batched product recommendation endpoint
+@app.post("/recommend/batch")
+async def recommend_batch(request: BatchRecommendRequest):
+    """Get recommendations for many queries in one call (single batched encode)"""
+    if recommender is None:
+        raise HTTPException(status_code=503, detail="Recommender not initialized")
+
+    batch = await inference_executor.run(recommender.recommend_batch, [
+        {"query": q.query, "top_k": q.top_k, "filters": q.filters()}
+        for q in request.queries
+    ])
+    return {
+        "success": True,
+        "results": [
+            {"results": results, "count": len(results), "query_used": q.query}
+            for q, results in zip(request.queries, batch)
+        ],
+        "count": len(batch)
+    }
+
+# Catalog update endpoints - applied incrementally, no index rebuild
+@app.post("/products/upsert")
+async def upsert_products(request: ProductUpsertRequest):
+    """Add new products or replace existing ones by _id"""
+    if recommender is None:
+        raise HTTPException(status_code=503, detail="Recommender not initialized")
+
+    products = [product.model_dump(by_alias=True) for product in request.products]
+    try:
+        written = await inference_executor.run(recommender.upsert_products, products)
+    except ValueError as e:
+        # e.g. the same _id twice in one request
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, "upserted": written, "total": len(recommender.products)}
+
+@app.post("/products/delete")
+async def delete_products(request: ProductDeleteRequest):
+    """Remove products by _id"""
+    if recommender is None:
+        raise HTTPException(status_code=503, detail="Recommender not initialized")
+
+    removed = await inference_executor.run(recommender.delete_products, request.ids)
+    return {"success": True, "deleted": removed, "total": len(recommender.products)}
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,174 @@
+# cpu_profile.py - Opt-in CPU inference profile for the trained sales agent
+import os
+import time
+
+import torch
+
+def _env_flag(name, default=False):
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+def _env_int(name):
+    value = os.getenv(name)
+    return int(value) if value else None
+
+class CPUInferenceProfile:
+    """
+    CPU serving settings for a causal LM: int8 weights, pinned threads, graph capture
+
+    quantize applies dynamic int8 quantization to every nn.Linear (GPT-2's
+    Conv1D projections are converted to Linear first so they are included).
+    Thread counts default to the machine's cores split across WEB_CONCURRENCY
+    worker processes, so several workers on one box don't oversubscribe it.
+    """
+
+    def __init__(self, quantize=True, intra_op_threads=None, inter_op_threads=1,
+                 inference_mode=True, compile_graph=False):
+        self.quantize = quantize
+        self.intra_op_threads = intra_op_threads or self.default_threads()
+        self.inter_op_threads = inter_op_threads
+        self.inference_mode = inference_mode
+        self.compile_graph = compile_graph
+
+    @staticmethod
+    def default_threads():
+        """Cores per worker process"""
+        workers = max(1, int(os.getenv("WEB_CONCURRENCY", 1)))
+        return max(1, (os.cpu_count() or 1) // workers)
+
+    @classmethod
+    def from_env(cls):
+        """Profile from CPU_PROFILE* settings, or None when the profile is off"""
+        if not _env_flag("CPU_PROFILE"):
+            return None
+        return cls(
+            quantize=_env_flag("CPU_PROFILE_QUANTIZE", True),
+            intra_op_threads=_env_int("TORCH_THREADS"),
+            inter_op_threads=_env_int("TORCH_INTEROP_THREADS") or 1,
+            inference_mode=_env_flag("CPU_PROFILE_INFERENCE_MODE", True),
+            compile_graph=_env_flag("CPU_PROFILE_COMPILE", False),
+        )
+
+    def describe(self):
+        return {
+            "quantize": self.quantize,
+            "intra_op_threads": self.intra_op_threads,
+            "inter_op_threads": self.inter_op_threads,
+            "inference_mode": self.inference_mode,
+            "compile_graph": self.compile_graph,
+        }
+
+    def apply_threads(self):
+        """Pin torch's thread pools for this process"""
+        torch.set_num_threads(self.intra_op_threads)
+        try:
+            torch.set_num_interop_threads(self.inter_op_threads)
+        except RuntimeError:
+            # Only settable before the first parallel op; keep whatever is running
+            print(f"[WARNING] Inter-op threads already started ({torch.get_num_interop_threads()})")
+
+    def grad_context(self):
+        """Autograd-free context for decoding"""
+        return torch.inference_mode() if self.inference_mode else torch.no_grad()
+
+    def optimize(self, model):
+        """Return the model prepared for CPU serving"""
+        self.apply_threads()
+        model.eval()
+
+        if self.quantize:
+            _conv1d_to_linear(model)
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+        if self.compile_graph:
+            model = self._compile(model)
+        return model
+
+    def _compile(self, model):
+        """torch.compile the forward pass; stays eager if compilation fails"""
+        try:
+            compiled = torch.compile(model, dynamic=True)
+            # Compilation is lazy - run one step now so failures surface at load time
+            with self.grad_context():
+                compiled(input_ids=torch.zeros((1, 4), dtype=torch.long), use_cache=True)
+            return compiled
+        except Exception as e:
+            print(f"[WARNING] Graph compilation failed, running eager: {e}")
+            return model
+
+def _conv1d_to_linear(module):
+    """Swap GPT-2 Conv1D layers for equivalent nn.Linear so quantize_dynamic covers them"""
+    for name, child in module.named_children():
+        if type(child).__name__ == "Conv1D":
+            # Conv1D stores weight as (in, out); Linear expects (out, in)
+            linear = torch.nn.Linear(child.weight.shape[0], child.weight.shape[1])
+            linear.weight.data = child.weight.data.t().contiguous()
+            linear.bias.data = child.bias.data
+            setattr(module, name, linear)
+        else:
+            _conv1d_to_linear(child)
+
+def compare_with_baseline(model_path="trained_models/final_model", profile=None, prompts=None):
+    """
+    Score a CPU profile against the fp32 model on the training conversations
+
+    Both models are teacher-forced on every (customer, agent) pair, so the
+    comparison doesn't depend on sampling. Reports the agent-reply perplexity
+    of each, how often their next-token predictions agree, and forward-pass
+    latency.
+
+    Args:
+        profile: CPUInferenceProfile to evaluate (default: quantized profile)
+        prompts: (customer_message, agent_response) pairs (default: TRAINING_DATA)
+
+    Returns:
+        Dict with baseline/profile perplexity, top-1 agreement and speedup
+    """
+    from transformers import AutoTokenizer, AutoModelForCausalLM
+    from training_data import TRAINING_DATA
+
+    profile = profile or CPUInferenceProfile()
+    prompts = prompts or TRAINING_DATA
+
+    tokenizer = AutoTokenizer.from_pretrained(str(model_path))
+    baseline = AutoModelForCausalLM.from_pretrained(str(model_path)).eval()
+    optimized = profile.optimize(AutoModelForCausalLM.from_pretrained(str(model_path)))
+
+    totals = {"baseline_nll": 0.0, "profile_nll": 0.0, "baseline_seconds": 0.0, "profile_seconds": 0.0}
+    tokens = 0
+    agreed = 0
+    with torch.inference_mode():
+        for customer_message, agent_response in prompts:
+            prompt_ids = tokenizer.encode(f"Customer: {customer_message}\nAgent:")
+            reply_ids = tokenizer.encode(f" {agent_response}")
+            input_ids = torch.tensor([prompt_ids + reply_ids])
+            # Logits at position i predict token i + 1; score only the agent reply
+            targets = input_ids[0, len(prompt_ids):]
+            predicted = {}
+            for label, model in (("baseline", baseline), ("profile", optimized)):
+                started = time.perf_counter()
+                logits = model(input_ids=input_ids).logits[0, len(prompt_ids) - 1:-1]
+                totals[f"{label}_seconds"] += time.perf_counter() - started
+                totals[f"{label}_nll"] += float(torch.nn.functional.cross_entropy(logits.float(), targets, reduction="sum"))
+                predicted[label] = logits.argmax(-1)
+            agreed += int((predicted["baseline"] == predicted["profile"]).sum())
+            tokens += len(reply_ids)
+
+    tokens = max(tokens, 1)
+    return {
+        "profile": profile.describe(),
+        "conversations": len(prompts),
+        "reply_tokens": tokens,
+        "baseline_perplexity": round(float(torch.exp(torch.tensor(totals["baseline_nll"] / tokens))), 4),
+        "profile_perplexity": round(float(torch.exp(torch.tensor(totals["profile_nll"] / tokens))), 4),
+        "top1_agreement": round(agreed / tokens, 4),
+        "baseline_ms_per_conversation": round(totals["baseline_seconds"] / len(prompts) * 1000.0, 3),
+        "profile_ms_per_conversation": round(totals["profile_seconds"] / len(prompts) * 1000.0, 3),
+        "speedup": round(totals["baseline_seconds"] / max(totals["profile_seconds"], 1e-9), 3),
+    }
+
+if __name__ == "__main__":
+    import json
+    print(json.dumps(compare_with_baseline(profile=CPUInferenceProfile.from_env()), indent=2, ensure_ascii=False))
@@ -0,0 +1,142 @@
+# generation_engine.py - Batched multi-request generation for the trained sales agent
+import asyncio
+import threading
+import time
+from collections import deque
+from functools import partial
+
+import numpy as np
+
+from utils.instrumentation import span
+from utils.micro_batcher import MicroBatcher
+
+class BatchedGenerationEngine:
+    """
+    Runs concurrent TrainedSalesAgent requests through shared forward passes
+
+    Messages arriving within max_wait_ms of each other (up to max_batch_size)
+    are decoded together by agent.generate_batch, and each caller receives
+    its own reply. Messages close enough to a curated example (the agent's
+    reply index, looked up with one batched encode per window) or already in
+    its response cache never enter a generation batch. report() shows what
+    the window buys: replies and tokens per second of compute against
+    per-request latency percentiles. Messages with a session_id (when the
+    agent keeps per-session KV caches) are multi-turn and run on their own,
+    continuing their session's cached context. A caller that sets its
+    cancel_event stops its own row; a batch stops once all its rows have.
+    """
+
+    def __init__(self, agent, max_batch_size=8, max_wait_ms=10.0, executor=None,
+                 max_new_tokens=50, temperature=0.7, latency_window=1000):
+        self.agent = agent
+        self.executor = executor
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.batcher = MicroBatcher(
+            self._generate_batch,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+            lookup_fn=self._cached,
+            executor=executor,
+        )
+        reply_index = getattr(agent, "reply_index", None)
+        self.retriever = MicroBatcher(
+            reply_index.match_batch,
+            max_batch_size=max_batch_size * 4,
+            max_wait_ms=max_wait_ms,
+            lookup_fn=reply_index.match_cached,
+            executor=executor,
+        ) if reply_index is not None else None
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=latency_window)
+        self.requests = 0
+        self.generated_tokens = 0
+        self.compute_seconds = 0.0
+
+    async def start(self):
+        if self.retriever is not None:
+            await self.retriever.start()
+        await self.batcher.start()
+
+    async def stop(self):
+        if self.retriever is not None:
+            await self.retriever.stop()
+        await self.batcher.stop()
+
+    async def generate(self, customer_message: str, session_id=None, cancel_event=None) -> str:
+        """
+        Queue one message and wait for its reply
+
+        Setting cancel_event (a threading.Event) stops the generation of this
+        reply once the caller no longer waits for it.
+        """
+        started = time.perf_counter()
+        if session_id and getattr(self.agent, "kv_cache", None) is not None:
+            reply = await asyncio.get_running_loop().run_in_executor(self.executor, partial(
+                self.agent.generate_response, customer_message,
+                temperature=self.temperature, session_id=session_id, cancel_event=cancel_event
+            ))
+            with self._lock:
+                self._latencies.append(time.perf_counter() - started)
+            return reply
+
+        reply = None
+        if self.retriever is not None:
+            reply, _ = await self.retriever.submit(customer_message)
+        if reply is None:
+            reply = await self.batcher.submit((customer_message, cancel_event))
+        with self._lock:
+            self._latencies.append(time.perf_counter() - started)
+        return reply
+
+    def _cached(self, item):
+        return self.agent.cached_response(item[0])
+
+    def _generate_batch(self, items):
+        messages = [message for message, _ in items]
+        started = time.perf_counter()
+        with span("generation"):
+            replies, token_counts = self.agent.generate_batch(
+                messages,
+                max_new_tokens=self.max_new_tokens,
+                temperature=self.temperature,
+                with_token_counts=True,
+                cancel_events=[cancel_event for _, cancel_event in items],
+            )
+        with self._lock:
+            self.compute_seconds += time.perf_counter() - started
+            self.requests += len(messages)
+            self.generated_tokens += sum(token_counts)
+        return replies
+
+    def report(self):
+        """Throughput versus latency for the current batching settings"""
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000.0
+            compute = self.compute_seconds
+            requests = self.requests
+            tokens = self.generated_tokens
+
+        report = self.batcher.stats()
+        report.update({
+            "requests": requests,
+            "generated_tokens": tokens,
+            "replies_per_second": round(requests / compute, 3) if compute else 0.0,
+            "tokens_per_second": round(tokens / compute, 3) if compute else 0.0,
+            "avg_batch_ms": round(compute / report["batches"] * 1000.0, 3) if report["batches"] else 0.0,
+        })
+        if len(latencies):
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            report["latency_ms"] = {
+                "p50": round(float(p50), 3),
+                "p95": round(float(p95), 3),
+                "p99": round(float(p99), 3),
+                "max": round(float(latencies.max()), 3),
+            }
+        else:
+            report["latency_ms"] = {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+        if self.retriever is not None:
+            report["retrieval"] = self.agent.reply_index.stats()
+        if getattr(self.agent, "kv_cache", None) is not None:
+            report["kv_cache"] = self.agent.kv_cache.stats()
+        return report
@@ -0,0 +1,216 @@
+# generation_router.py - Latency-budgeted routing across the reply generators
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+
+class TierUnavailable(RuntimeError):
+    """A tier can't serve right now (model not loaded, upstream disabled)"""
+
+class RouteResult(NamedTuple):
+    response: str
+    tier: str
+    model: str
+    latency_ms: float
+    attempts: List[tuple]
+
+class GenerationTier:
+    """
+    One reply generator plus its live latency estimate
+
+    The estimate is the p95 of recent successful calls (timeouts count at
+    twice the time they were given, so a tier that keeps running over is
+    pushed out of budgets it can't meet). Until enough calls have been seen,
+    prior_ms stands in.
+    """
+
+    def __init__(self, name, generate, model=None, prior_ms=100.0, max_concurrency=32,
+                 enforces_deadline=False, window=200):
+        """
+        Args:
+            generate: async fn(message, session_id, context, timeout_seconds, cancel_event) -> reply;
+                cancel_event (a threading.Event) is set when the router stops waiting,
+                so work handed to a thread pool can stop early or not start at all
+            model: Model name reported to clients (default: the tier name)
+            max_concurrency: In-flight requests above which this tier sheds load
+            enforces_deadline: generate honours timeout_seconds itself and raises
+                TimeoutError (e.g. a deadline-aware HTTP client); the router's own
+                timer then only backs it up, so the tier sees and records its timeouts
+        """
+        self.name = name
+        self.generate = generate
+        self.model = model or name
+        self.prior_ms = prior_ms
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.enforces_deadline = enforces_deadline
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        # The prior is trusted for one probe interval before a budget-skipped tier is probed
+        self.last_attempt = time.monotonic()
+        self.counts = dict.fromkeys(
+            ("served", "attempted", "timeouts", "errors", "unavailable", "shed", "over_budget"), 0
+        )
+
+    def estimate_ms(self):
+        """Expected p95 latency, inflated by the current queue"""
+        with self._lock:
+            samples = list(self._latencies)
+        base = float(np.percentile(samples, 95)) if len(samples) >= 5 else self.prior_ms
+        return base * (1.0 + self.in_flight / self.max_concurrency)
+
+    def observe(self, elapsed_ms):
+        with self._lock:
+            self._latencies.append(elapsed_ms)
+
+    def count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def stats(self):
+        with self._lock:
+            samples = list(self._latencies)
+            stats = dict(self.counts)
+        stats.update({
+            "model": self.model,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "estimate_ms": round(self.estimate_ms(), 3),
+            "p50_ms": round(float(np.percentile(samples, 50)), 3) if samples else None,
+            "samples": len(samples),
+        })
+        return stats
+
+class GenerationRouter:
+    """
+    Serves each reply from the most capable tier that fits its latency budget
+
+    Tiers are tried most capable first. A tier is skipped when its latency
+    estimate doesn't fit the remaining budget, when it is already at
+    max_concurrency (load shedding), or when it can't serve; a tier that is
+    tried but runs over its share of the budget is cancelled and the next one
+    takes over. The last tier always answers. A tier skipped for budget is
+    still probed every probe_interval seconds so its estimate can recover.
+
+    With a SessionStore, the router records the customer turn before any
+    tier runs and the reply of the tier that answered, so tiers must not
+    record turns themselves.
+    """
+
+    TIMEOUT_PENALTY = 2.0
+    # Extra time given to tiers that enforce their own deadline before the router cancels them
+    DEADLINE_GRACE = 0.05
+
+    def __init__(self, tiers, default_budget_ms=800.0, reserve_ms=20.0, probe_interval=10.0, sessions=None):
+        """
+        Args:
+            tiers: GenerationTier list, most capable first; the last is the safety net
+            reserve_ms: Budget held back for the tiers below the one being tried
+            sessions: SessionStore to record each exchange in
+        """
+        if not tiers:
+            raise ValueError("GenerationRouter needs at least one tier")
+        self.tiers = list(tiers)
+        self.default_budget_ms = default_budget_ms
+        self.reserve_ms = reserve_ms
+        self.probe_interval = probe_interval
+        self.sessions = sessions
+
+    async def generate(self, message: str, session_id: Optional[str] = None, context: str = "",
+                       budget_ms: Optional[float] = None) -> RouteResult:
+        """Reply to one message within budget_ms (default_budget_ms if None)"""
+        budget_ms = self.default_budget_ms if budget_ms is None else budget_ms
+        started = time.perf_counter()
+        attempts = []
+        session = self.sessions.get(session_id) if self.sessions is not None else None
+        if session is not None:
+            session.add_turn("user", message)
+
+        for position, tier in enumerate(self.tiers):
+            last = position == len(self.tiers) - 1
+            remaining_ms = budget_ms - (time.perf_counter() - started) * 1000.0
+
+            if not last:
+                if tier.in_flight >= tier.max_concurrency:
+                    tier.count("shed")
+                    attempts.append((tier.name, "shed", 0.0))
+                    continue
+                probe_due = time.monotonic() - tier.last_attempt >= self.probe_interval
+                if tier.estimate_ms() > remaining_ms and not probe_due:
+                    tier.count("over_budget")
+                    attempts.append((tier.name, "over_budget", 0.0))
+                    continue
+
+            timeout = None
+            if not last:
+                if remaining_ms <= 0:
+                    tier.count("over_budget")
+                    attempts.append((tier.name, "over_budget", 0.0))
+                    continue
+                # Hold reserve_ms back for the tiers below, unless only the reserve is left
+                usable_ms = remaining_ms - self.reserve_ms
+                timeout = (usable_ms if usable_ms > 0 else remaining_ms) / 1000.0
+            tier.count("attempted")
+            tier.last_attempt = time.monotonic()
+            tier.in_flight += 1
+            call_started = time.perf_counter()
+            cancel_event = threading.Event()
+            try:
+                call = tier.generate(message, session_id, context, timeout, cancel_event)
+                if timeout is not None:
+                    call = asyncio.wait_for(
+                        call, timeout + self.DEADLINE_GRACE if tier.enforces_deadline else timeout
+                    )
+                reply = await call
+            except asyncio.TimeoutError:
+                cancel_event.set()
+                elapsed_ms = (time.perf_counter() - call_started) * 1000.0
+                tier.observe(elapsed_ms * self.TIMEOUT_PENALTY)
+                tier.count("timeouts")
+                attempts.append((tier.name, "timeout", round(elapsed_ms, 3)))
+                continue
+            except TierUnavailable:
+                tier.count("unavailable")
+                attempts.append((tier.name, "unavailable", 0.0))
+                continue
+            except asyncio.CancelledError:
+                # The request itself went away - stop the tier's pending work too
+                cancel_event.set()
+                raise
+            except Exception as e:
+                if last:
+                    raise
+                tier.count("errors")
+                attempts.append((tier.name, f"error: {type(e).__name__}", round((time.perf_counter() - call_started) * 1000.0, 3)))
+                continue
+            finally:
+                tier.in_flight -= 1
+
+            elapsed_ms = (time.perf_counter() - call_started) * 1000.0
+            tier.observe(elapsed_ms)
+            tier.count("served")
+            attempts.append((tier.name, "served", round(elapsed_ms, 3)))
+
+            if session is not None:
+                session.add_turn("assistant", reply)
+
+            return RouteResult(
+                response=reply,
+                tier=tier.name,
+                model=tier.model,
+                latency_ms=round((time.perf_counter() - started) * 1000.0, 3),
+                attempts=attempts,
+            )
+
+        raise TierUnavailable("No generation tier could serve the request")
+
+    def stats(self):
+        """Per-tier traffic, estimates and degradation counters"""
+        return {
+            "default_budget_ms": self.default_budget_ms,
+            "reserve_ms": self.reserve_ms,
+            "tiers": {tier.name: tier.stats() for tier in self.tiers},
+        }
@@ -1,86 +1,466 @@
 # recommender_model.py - Core recommendation logic
 import json
+import threading
+import numpy as np
 from utils.embeddings import EmbeddingEngine
+from utils.instrumentation import span
+
+# Compact the index once this fraction of rows are tombstoned
+COMPACT_DEAD_RATIO = 0.5
+
+class _IndexState:
+    """Immutable snapshot of the catalog index that queries read from"""
+    
+    def __init__(self, products, embeddings, index, prices, category_codes, alive, categories):
+        self.products = products
+        self.embeddings = embeddings
+        self.index = index
+        self.prices = prices
+        self.category_codes = category_codes
+        self.alive = alive
+        self.categories = categories
+        self.size = len(alive)
+        self.live_count = int(alive.sum())
+        self._category_masks = {}
+    
+    def category_mask(self, category):
+        """Boolean mask for a category, computed once per snapshot"""
+        mask = self._category_masks.get(category)
+        if mask is None:
+            code = self.categories.get(category)
+            if code is None:
+                mask = np.zeros(self.size, dtype=bool)
+            else:
+                mask = self.category_codes == code
+            self._category_masks[category] = mask
+        return mask
 
 class RecommenderModel:
     """AI-powered product recommendation engine"""
     
-    def __init__(self, products_json_path="products.json"):
-        """Initialize recommender with products"""
-        self.engine = EmbeddingEngine()
-        self.products = self._load_products(products_json_path)
-        self.engine.build_index(self.products)
+    def __init__(self, products_json_path="products.json", cache_dir=None,
+                 index_backend="exact", index_params=None, engine_options=None):
+        """
+        Initialize recommender with products
+
+        Args:
+            products_json_path: Catalog to index
+            cache_dir: Persists the embedding matrix between restarts
+            index_backend: "exact" or "ivf" (approximate, for large catalogs)
+            index_params: Backend knobs such as nlist / nprobe
+            engine_options: Extra EmbeddingEngine settings (e.g. query cache size / TTL)
+        """
+        self.engine = EmbeddingEngine(
+            cache_dir=cache_dir, index_backend=index_backend, index_params=index_params,
+            **(engine_options or {})
+        )
+        products = self._load_products(products_json_path)
+        self.engine.build_index(products)
+        self._write_lock = threading.Lock()
+        self._compacting = False
+        self._reset_index(products, self.engine.embeddings, self.engine.index)
     
     def _load_products(self, path):
-        """Load products from JSON file"""
+        """Load products from JSON file, keeping the last entry per _id"""
         try:
             with open(path, 'r') as f:
-                return json.load(f)
+                products = json.load(f)
         except Exception as e:
             print(f"[ERROR] Failed to load products: {e}")
             return []
+
+        # Updates and deletes address products by _id, so it must identify one row
+        by_id = {}
+        for product in products:
+            if self._has_id(product):
+                by_id.pop(product["_id"], None)
+                by_id[product["_id"]] = product
+        skipped = len(products) - len(by_id)
+        if skipped:
+            print(f"[WARNING] Skipped {skipped} products without a unique _id")
+        return list(by_id.values())
+    
+    @staticmethod
+    def _has_id(product):
+        product_id = product.get("_id")
+        return product_id is not None and str(product_id).strip() != ""
+    
+    @property
+    def products(self):
+        """Live products in the current index snapshot"""
+        state = self._state
+        if state.live_count == state.size:
+            return state.products[:state.size]
+        return [state.products[i] for i in np.flatnonzero(state.alive)]
+    
+    @staticmethod
+    def _price_of(product):
+        return float(product.get("price", 0) or 0)
+    
+    @staticmethod
+    def _category_code(product, categories):
+        """Map a product's category to a stable integer code"""
+        return categories.setdefault(str(product.get("category")), len(categories))
+    
+    def _reset_index(self, products, embeddings, index):
+        """Build row buffers and filter columns for a full catalog"""
+        self._products = list(products)
+        self._row_by_id = {p.get("_id"): row for row, p in enumerate(self._products)}
+        categories = {}
+        # May be a read-only memory map from the cache; copied on first append
+        if len(self._products):
+            self._embedding_buf = embeddings
+        else:
+            dim = self.engine.model.get_sentence_embedding_dimension()
+            self._embedding_buf = np.empty((0, dim), dtype=np.float32)
+            index = self.engine.create_index(self._embedding_buf)
+        self._index = index
+        self._price_buf = np.array([self._price_of(p) for p in self._products], dtype=np.float64)
+        self._code_buf = np.array(
+            [self._category_code(p, categories) for p in self._products], dtype=np.int32
+        )
+        self._publish(np.ones(len(self._products), dtype=bool), categories)
+    
+    def _publish(self, alive, categories):
+        """Atomically swap in a new snapshot covering the first len(alive) rows"""
+        size = len(alive)
+        state = _IndexState(
+            products=self._products,
+            embeddings=self._embedding_buf[:size],
+            index=self._index,
+            prices=self._price_buf[:size],
+            category_codes=self._code_buf[:size],
+            alive=alive,
+            categories=categories
+        )
+        # Single reference assignment - readers see the old or new snapshot, never a mix
+        self._state = state
+        self.engine.embeddings = state.embeddings
+        self.engine.index = state.index
+    
+    def _ensure_capacity(self, size, extra):
+        """Grow the row buffers (amortized doubling) so extra rows fit after size"""
+        needed = size + extra
+        capacity = len(self._embedding_buf)
+        if needed <= capacity and self._embedding_buf.flags.writeable:
+            return
+
+        capacity = max(needed, capacity * 2, 16)
+        embeddings = np.empty((capacity, self._embedding_buf.shape[1]), dtype=np.float32)
+        embeddings[:size] = self._embedding_buf[:size]
+        prices = np.empty(capacity, dtype=np.float64)
+        prices[:size] = self._price_buf[:size]
+        codes = np.empty(capacity, dtype=np.int32)
+        codes[:size] = self._code_buf[:size]
+
+        # Old snapshots keep referencing the old buffers
+        self._embedding_buf, self._price_buf, self._code_buf = embeddings, prices, codes
+    
+    def upsert_products(self, products):
+        """
+        Insert new products or replace existing ones (matched by _id)
+
+        Rows are appended past the published snapshot and replaced rows are
+        tombstoned, so in-flight queries never observe a partial update.
+
+        Returns:
+            Number of products written
+
+        Raises:
+            ValueError: A product has no _id, or two share one
+        """
+        if not products:
+            return 0
+
+        seen = set()
+        for product in products:
+            if not self._has_id(product):
+                raise ValueError("Every product needs a non-empty _id")
+            if product["_id"] in seen:
+                raise ValueError(f"Duplicate _id {product['_id']!r} in one update")
+            seen.add(product["_id"])
+
+        # Encode outside the lock so queries and other writers are not held up
+        vectors = self.engine.encode_products(products)
+
+        with self._write_lock:
+            state = self._state
+            size = state.size
+            categories = dict(state.categories)
+            alive = np.concatenate([state.alive, np.ones(len(products), dtype=bool)])
+            self._ensure_capacity(size, len(products))
+
+            for offset, product in enumerate(products):
+                row = size + offset
+                old_row = self._row_by_id.get(product.get("_id"))
+                if old_row is not None:
+                    alive[old_row] = False
+                self._row_by_id[product.get("_id")] = row
+                self._products.append(product)
+                self._embedding_buf[row] = vectors[offset]
+                self._price_buf[row] = self._price_of(product)
+                self._code_buf[row] = self._category_code(product, categories)
+
+            # Rows past the old snapshot size are invisible to in-flight searches
+            self._index.add(size, vectors)
+            self._publish(alive, categories)
+
+        self._maybe_compact()
+        return len(products)
+    
+    def delete_products(self, product_ids):
+        """
+        Remove products by _id
+
+        Returns:
+            Number of products removed
+        """
+        with self._write_lock:
+            state = self._state
+            alive = state.alive.copy()
+            removed = 0
+            for product_id in product_ids:
+                row = self._row_by_id.pop(product_id, None)
+                if row is not None:
+                    alive[row] = False
+                    removed += 1
+
+            if removed:
+                self._publish(alive, state.categories)
+
+        if removed:
+            self._maybe_compact()
+        return removed
+    
+    def _maybe_compact(self):
+        """
+        Rebuild the index once tombstones or unindexed appends make up too much of it
+
+        The compacted matrix and new index are built from a snapshot without
+        holding the write lock; updates made meanwhile are replayed onto them
+        when they are swapped in.
+        """
+        with self._write_lock:
+            state = self._state
+            dead = state.size - state.live_count
+            stale = dead and dead >= state.size * COMPACT_DEAD_RATIO
+            if self._compacting or not (stale or self._index.needs_rebuild()):
+                return
+            self._compacting = True
+
+        try:
+            live_rows = np.flatnonzero(state.alive)
+            size = len(live_rows)
+            products = [state.products[i] for i in live_rows]
+            row_by_id = {p.get("_id"): row for row, p in enumerate(products)}
+            # Headroom for rows written meanwhile, so the swap doesn't copy the matrix again
+            capacity = size + max(16, size // 8)
+            embeddings = np.empty((capacity, state.embeddings.shape[1]), dtype=np.float32)
+            embeddings[:size] = state.embeddings[live_rows]
+            prices = np.empty(capacity, dtype=np.float64)
+            prices[:size] = state.prices[live_rows]
+            codes = np.empty(capacity, dtype=np.int32)
+            codes[:size] = state.category_codes[live_rows]
+            # Row numbers change, so the index is rebuilt over the compacted matrix
+            index = self.engine.create_index(embeddings[:size])
+
+            with self._write_lock:
+                self._swap_compacted(state, live_rows, products, row_by_id, embeddings, prices, codes, index)
+        finally:
+            self._compacting = False
+    
+    def _swap_compacted(self, state, live_rows, products, row_by_id, embeddings, prices, codes, index):
+        """Publish a compaction of state plus the writes made since (caller holds the write lock)"""
+        current = self._state
+        tail = np.arange(state.size, current.size)
+        alive = np.concatenate([current.alive[live_rows], current.alive[tail]])
+
+        # Products deleted or replaced while compacting
+        for row in np.flatnonzero(~alive[:len(live_rows)]):
+            product_id = products[row].get("_id")
+            if row_by_id.get(product_id) == row:
+                del row_by_id[product_id]
+
+        # Products appended while compacting move up to follow the kept rows
+        tail_vectors = self._embedding_buf[tail]
+        tail_prices = self._price_buf[tail]
+        tail_codes = self._code_buf[tail]
+        self._products = products
+        self._embedding_buf, self._price_buf, self._code_buf = embeddings, prices, codes
+        self._ensure_capacity(len(live_rows), len(tail))
+        for offset, old_row in enumerate(tail):
+            row = len(live_rows) + offset
+            product = current.products[old_row]
+            self._products.append(product)
+            self._embedding_buf[row] = tail_vectors[offset]
+            self._price_buf[row] = tail_prices[offset]
+            self._code_buf[row] = tail_codes[offset]
+            if alive[row]:
+                row_by_id[product.get("_id")] = row
+        if len(tail):
+            index.add(len(live_rows), tail_vectors)
+
+        self._row_by_id = row_by_id
+        self._index = index
+        self._publish(alive, current.categories)
+    
+    def _candidate_mask(self, state, filters):
+        """Combine tombstones, category and price filters into one mask (None = no filter)"""
+        mask = None if state.live_count == state.size else state.alive
+
+        if filters.get("category"):
+            category_mask = state.category_mask(filters.get("category"))
+            mask = category_mask if mask is None else mask & category_mask
+
+        if filters.get("min_price"):
+            price_mask = state.prices >= filters.get("min_price")
+            mask = price_mask if mask is None else mask & price_mask
+
+        if filters.get("max_price"):
+            price_mask = state.prices <= filters.get("max_price")
+            mask = price_mask if mask is None else mask & price_mask
+
+        return mask
+    
+    @staticmethod
+    def _top_k_indices(similarities, candidates, top_k):
+        """Select the top-k candidate indices by score, best first (ties: earlier candidate first)"""
+        if candidates is not None:
+            scores = similarities[candidates]
+        else:
+            scores = similarities
+
+        if top_k <= 0 or len(scores) == 0:
+            return np.array([], dtype=np.intp)
+
+        if top_k < len(scores):
+            # Partial selection - only the k best are ordered
+            part = np.argpartition(-scores, top_k - 1)[:top_k]
+            # argpartition picks arbitrarily among scores tied with the k-th; take the earliest
+            kth = scores[part].min()
+            above = np.flatnonzero(scores > kth)
+            tied = np.flatnonzero(scores == kth)[:top_k - len(above)]
+            part = np.sort(np.concatenate([above, tied]))
+        else:
+            part = np.arange(len(scores))
+        order = part[np.argsort(-scores[part], kind="stable")]
+
+        return candidates[order] if candidates is not None else order
+    
+    def _format_product(self, product):
+        """Shape a product dict for API responses"""
+        return {
+            "id": product.get("_id"),
+            "name": product.get("name"),
+            "price": product.get("price"),
+            "category": product.get("category"),
+            "image": product.get("image"),
+            "description": product.get("description")
+        }
+    
+    def _rank(self, state, query_vec, hit, top_k, filters):
+        """Apply filters to one query's index hits and return formatted top-k products"""
+        rows, scores = hit
+        with span("filtering"):
+            mask = self._candidate_mask(state, filters)
+        filtered = any(filters.get(key) for key in ("category", "min_price", "max_price"))
+
+        top_indices = self._select(state, query_vec, rows, scores, mask, top_k, filtered)
+
+        results = [self._format_product(state.products[idx]) for idx in top_indices]
+
+        # Fallback: return top 3 if no results
+        if not results:
+            results = [
+                self._format_product(state.products[idx])
+                for idx in np.flatnonzero(state.alive)[:3]
+            ]
+
+        return results
+    
+    def _select(self, state, query_vec, rows, scores, mask, top_k, filtered=False):
+        """
+        Top-k row numbers among the index hits that pass the filter mask
+
+        With an approximate backend, a short result falls back to scoring the
+        filtered rows exactly only when filtered (a category or price filter
+        was given) - tombstones alone never trigger a full scan.
+        """
+        if rows is None:
+            # Exact backend: scores cover every row
+            candidates = np.flatnonzero(mask) if mask is not None else None
+            top_indices = self._top_k_indices(scores, candidates, top_k)
+        else:
+            # Approximate backend: only rows from the probed buckets were scored
+            if mask is not None:
+                keep = mask[rows]
+                rows, scores = rows[keep], scores[keep]
+            if len(rows) < top_k and filtered:
+                # Selective filter starved the probed buckets - score the filtered set exactly
+                rows = np.flatnonzero(mask)
+                scores = state.embeddings[rows] @ self.engine.normalize(query_vec)
+            top_indices = rows[self._top_k_indices(scores, None, top_k)]
+        return top_indices
     
     def recommend(self, query, top_k=5, filters=None):
         """
         Get top-k product recommendations based on query
-        
+
         Args:
             query: User search query
             top_k: Number of recommendations to return
             filters: Dict with optional min_price, max_price, category
-        
+
         Returns:
             List of recommended products
         """
-        filters = filters or {}
-        
+        if not self._state.live_count:
+            return []
+
         # Encode query
         query_vec = self.engine.encode(query.lower())
-        
-        # Get similarity scores
-        similarities = self.engine.get_similarities(query_vec)
-        
-        # Get top indices
-        top_indices = similarities.argsort()[::-1]
-        
-        results = []
-        for idx in top_indices:
-            product = self.products[idx]
-            
-            # Apply filters
-            if filters.get("category") and product.get("category") != filters.get("category"):
-                continue
-            
-            if filters.get("min_price") and product.get("price", 0) < filters.get("min_price"):
-                continue
-            
-            if filters.get("max_price") and product.get("price", 0) > filters.get("max_price"):
-                continue
-            
-            results.append({
-                "id": product.get("_id"),
-                "name": product.get("name"),
-                "price": product.get("price"),
-                "category": product.get("category"),
-                "image": product.get("image"),
-                "description": product.get("description")
-            })
-            
-            if len(results) >= top_k:
-                break
-        
-        # Fallback: return top 3 if no results
-        if not results:
-            results = [
-                {
-                    "id": p.get("_id"),
-                    "name": p.get("name"),
-                    "price": p.get("price"),
-                    "category": p.get("category"),
-                    "image": p.get("image"),
-                    "description": p.get("description")
-                }
-                for p in self.products[:3]
-            ]
-        
-        return results
+
+        return self.recommend_by_vector(query_vec, top_k, filters)
+    
+    def recommend_by_vector(self, query_vec, top_k=5, filters=None):
+        """Get top-k recommendations for an already encoded query"""
+        filters = filters or {}
+        state = self._state
+
+        if not state.live_count:
+            return []
+
+        # Search the index for candidate scores
+        with span("scoring"):
+            hit = self.engine.search(query_vec, state.embeddings, state.index)[0]
+
+        return self._rank(state, query_vec, hit, top_k, filters)
+    
+    def recommend_batch(self, queries):
+        """
+        Get recommendations for many queries with one batched encode
+
+        Args:
+            queries: List of dicts with query, optional top_k and filters
+
+        Returns:
+            List of result lists, one per query in input order
+        """
+        if not queries:
+            return []
+
+        state = self._state
+        if not state.live_count:
+            return [[] for _ in queries]
+
+        # Encode every query in a single forward pass
+        query_vecs = self.engine.encode_batch([q.get("query", "").lower() for q in queries])
+
+        # Search the whole batch at once
+        with span("scoring"):
+            hits = self.engine.search(query_vecs, state.embeddings, state.index)
+
+        return [
+            self._rank(state, query_vecs[i], hits[i], q.get("top_k", 5), q.get("filters") or {})
+            for i, q in enumerate(queries)
+        ]
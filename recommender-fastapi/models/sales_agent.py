@@ -1,8 +1,26 @@
 # AI Sales Agent - Uses Hugging Face Inference API for intelligent responses
-import requests
-import json
 import os
+import numpy as np
 from typing import List, Optional
+from utils.intent_engine import intent_engine
+from utils.http_client import CircuitBreaker, CircuitOpen, PooledJSONClient
+from utils.instrumentation import span
+from utils.query_cache import QueryEmbeddingCache
+
+# Local fallback intent keywords, highest priority first
+LOCAL_RESPONSE_INTENTS = [
+    ("greeting", ['hi', 'hello', 'hey', 'greet*']),
+    ("occasion", ['party', 'wedding', 'formal', 'occasion', 'event']),
+    ("casual", ['casual', 'everyday', 'comfort*', 'comfy', 'relax*']),
+    ("shoes", ['shoe', 'footwear', 'boot', 'sandal']),
+    ("price", ['pric*', 'cost', 'budget', 'afford*', 'expensive']),
+    ("help", ['help', 'assist*', 'guide', 'suggest*']),
+    ("new", ['new', 'latest', 'trending', 'popular', 'best']),
+    ("search", ['search', 'find', 'look*', 'show', 'product']),
+    ("thanks", ['thank*', 'appreciat*']),
+]
+
+intent_engine.register("sales_local", LOCAL_RESPONSE_INTENTS)
 
 class AISalesAgent:
     """
@@ -10,14 +28,33 @@ class AISalesAgent:
     Generates intelligent, contextual product recommendations and responses
     """
     
-    def __init__(self):
+    def __init__(self, api_url: Optional[str] = None, deadline: Optional[float] = None):
+        """
+        Args:
+            api_url: Inference endpoint (default: HF_API_URL or the hosted Mistral model);
+                point it at a local stand-in server for testing
+            deadline: Seconds one reply may spend upstream before the local fallback
+        """
         # Use free Hugging Face Inference API - no key needed for public models
         # Or set your own token via HUGGINGFACE_TOKEN environment variable
         self.hf_token = os.getenv('HUGGINGFACE_TOKEN', None)
         
         # Using Mistral-7B via Hugging Face (excellent for sales conversations)
         self.model_name = "mistralai/Mistral-7B-Instruct-v0.1"
-        self.api_url = f"https://api-inference.huggingface.co/models/{self.model_name}"
+        self.api_url = api_url or os.getenv("HF_API_URL") or f"https://api-inference.huggingface.co/models/{self.model_name}"
+        
+        # One pooled keep-alive client; the breaker skips the API while it is failing
+        headers = {"Authorization": f"Bearer {self.hf_token}"} if self.hf_token else {}
+        self.client = PooledJSONClient(
+            self.api_url,
+            headers=headers,
+            deadline=deadline if deadline is not None else float(os.getenv("HF_API_DEADLINE", 4)),
+            max_connections=int(os.getenv("HF_API_MAX_CONNECTIONS", 20)),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv("HF_API_FAILURE_THRESHOLD", 5)),
+                reset_timeout=float(os.getenv("HF_API_RESET_TIMEOUT", 30))
+            )
+        )
         
         # System prompt for sales agent
         self.system_prompt = """You are an expert retail sales agent for a fashion and clothing store. 
@@ -28,64 +65,82 @@ If customer asks about products, ALWAYS recommend something positive.
 Use emojis occasionally for friendliness.
 Never say "I don't know" - always offer helpful alternatives."""
         
-    def generate_response(self, user_message: str, context: str = "") -> str:
-        """
-        Generate intelligent sales response using Hugging Face API
-        Falls back to local generation if API fails
-        """
-        try:
-            headers = {}
-            if self.hf_token:
-                headers["Authorization"] = f"Bearer {self.hf_token}"
-            
-            # Construct the prompt
-            full_prompt = f"""{self.system_prompt}
+        # Product text -> normalized vector for rank_products, LRU-bounded like the query cache
+        self._embedding_cache = QueryEmbeddingCache(
+            max_bytes=int(float(os.getenv("QUERY_CACHE_MB", 8)) * 1024 * 1024)
+        )
+        
+    def _build_payload(self, user_message: str, context: str = "") -> dict:
+        """Inference API request body"""
+        # Construct the prompt
+        full_prompt = f"""{self.system_prompt}
 
 Customer: {user_message}
 {context}
 
 Sales Agent:"""
-            
-            payload = {
-                "inputs": full_prompt,
-                "parameters": {
-                    "max_new_tokens": 100,
-                    "temperature": 0.7,
-                    "top_p": 0.9,
-                }
+        
+        return {
+            "inputs": full_prompt,
+            "parameters": {
+                "max_new_tokens": 100,
+                "temperature": 0.7,
+                "top_p": 0.9,
             }
+        }
+    
+    @staticmethod
+    def _parse_generated(result) -> Optional[str]:
+        """Sales agent reply from an API result, or None if it has none"""
+        if isinstance(result, list) and len(result) > 0:
+            generated_text = result[0].get('generated_text', '')
+            # Extract only the sales agent response
+            if 'Sales Agent:' in generated_text:
+                response_text = generated_text.split('Sales Agent:')[-1].strip()
+            else:
+                response_text = generated_text.strip()
             
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                json=payload,
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                if isinstance(result, list) and len(result) > 0:
-                    generated_text = result[0].get('generated_text', '')
-                    # Extract only the sales agent response
-                    if 'Sales Agent:' in generated_text:
-                        response_text = generated_text.split('Sales Agent:')[-1].strip()
-                    else:
-                        response_text = generated_text.strip()
-                    
-                    return response_text[:200]  # Limit length
+            return response_text[:200] or None  # Limit length
+        return None
+    
+    def generate_response(self, user_message: str, context: str = "", deadline: Optional[float] = None) -> str:
+        """
+        Generate intelligent sales response using Hugging Face API
+        Falls back to local generation if the API fails, is too slow or the circuit is open
+        """
+        with span("generation"):
+            try:
+                reply = self._parse_generated(self.client.post_json(self._build_payload(user_message, context), deadline))
+                if reply:
+                    return reply
+            except CircuitOpen:
+                pass
+            except Exception as e:
+                print(f"[HF API Error] {str(e)}")
             
-        except Exception as e:
-            print(f"[HF API Error] {str(e)}")
+            # Fallback to local intelligent response
+            return self._generate_local_response(user_message, context)
+    
+    async def generate_remote(self, user_message: str, context: str = "", deadline: Optional[float] = None) -> str:
+        """
+        Reply from the inference API only - no local fallback
         
-        # Fallback to local intelligent response
-        return self._generate_local_response(user_message, context)
+        Raises:
+            CircuitOpen: The API is failing and is not being called
+            ValueError: The API answered without a usable reply
+        """
+        result = await self.client.apost_json(self._build_payload(user_message, context), deadline)
+        reply = self._parse_generated(result)
+        if not reply:
+            raise ValueError("Inference API returned no reply")
+        return reply
     
     def _generate_local_response(self, user_message: str, context: str = "") -> str:
         """Local fallback response generation with AI-like intelligence"""
-        msg_lower = user_message.lower()
+        # Smart detection based on keywords (single pass, whole words)
+        intent = intent_engine.classify("sales_local", user_message)
         
-        # Smart detection based on keywords
-        if any(word in msg_lower for word in ['hi', 'hello', 'hey', 'greet']):
+        if intent == "greeting":
             responses = [
                 "🎉 Welcome! I'm thrilled to help you find amazing fashion today! What style are you looking for?",
                 "👋 Hey there! Let's find the perfect outfit for you. What catches your interest?",
@@ -94,66 +149,92 @@ Sales Agent:"""
             import random
             return random.choice(responses)
         
-        if any(word in msg_lower for word in ['party', 'wedding', 'formal', 'occasion', 'event']):
+        if intent == "occasion":
             return "🎊 Perfect! For special occasions, we have stunning dress wear, elegant blazers, and sophisticated pieces. What's the event? I'll find you something gorgeous!"
         
-        if any(word in msg_lower for word in ['casual', 'everyday', 'comfort', 'relax']):
+        if intent == "casual":
             return "👕 Great choice! Our casual collection includes comfy tees, relaxed fits, and stylish basics. Want me to show you our best-sellers?"
         
-        if any(word in msg_lower for word in ['shoe', 'footwear', 'boot', 'sandal']):
+        if intent == "shoes":
             return "👞 Excellent! We have an amazing shoe collection - from elegant formal wear to comfy casual kicks. What style are you after?"
         
-        if any(word in msg_lower for word in ['price', 'cost', 'budget', 'afford', 'expensive']):
+        if intent == "price":
             return "💰 We have something for every budget! From amazing value basics at ₹500 to premium designer pieces. What's your price range? I'll find perfect options!"
         
-        if any(word in msg_lower for word in ['help', 'assist', 'guide', 'suggest']):
+        if intent == "help":
             return "🤝 I'm here to help! Tell me: What occasion? What style? What budget? I'll recommend perfect products for you!"
         
-        if any(word in msg_lower for word in ['new', 'latest', 'trending', 'popular', 'best']):
+        if intent == "new":
             return "🔥 Great timing! Our latest collection is selling fast! We have trending items in all categories. Want to see what's hot right now?"
         
-        if any(word in msg_lower for word in ['search', 'find', 'look', 'show', 'product']):
+        if intent == "search":
             return "🛍️ Absolutely! I'll help you find exactly what you're looking for. Tell me more about your style preference!"
         
-        if any(word in msg_lower for word in ['thank', 'thanks', 'appreciate']):
+        if intent == "thanks":
             return "😊 You're welcome! Remember, I'm here to help anytime. Let me know what you'd like to explore!"
         
         # Default positive response
         return "😊 That's interesting! I'd love to help you find the perfect items. Could you tell me more about what you're looking for? I have some amazing suggestions!"
     
-    def rank_products(self, query: str, products: List[dict]) -> List[dict]:
+    def rank_products(self, query: str, products: List[dict], with_scores: bool = False) -> List:
         """
         Intelligently rank products based on query relevance
-        Returns products sorted by relevance score
+        Returns products sorted by relevance score, or (product, score)
+        pairs when with_scores is True so callers can threshold on them
         """
         try:
-            # Use sentence-transformers for semantic similarity
-            from sentence_transformers import util, SentenceTransformer
+            # Use sentence-transformers for semantic similarity (shared model)
+            from utils.model_registry import get_embedding_model
             
-            model = SentenceTransformer('all-MiniLM-L6-v2')
+            model = get_embedding_model('all-MiniLM-L6-v2')
             
-            # Encode query and product names/descriptions
-            query_embedding = model.encode(query, convert_to_tensor=True)
+            # Encode the query plus every product not already cached in one batch
+            product_vecs = self._product_embeddings(model, products, query)
+            query_vec = product_vecs.pop()
             
-            scored_products = []
-            for product in products:
-                product_text = f"{product.get('name', '')} {product.get('category', '')} {product.get('description', '')}"
-                product_embedding = model.encode(product_text, convert_to_tensor=True)
-                
-                # Calculate similarity
-                similarity = util.pytorch_cos_sim(query_embedding, product_embedding)
-                score = float(similarity[0][0])
-                
-                scored_products.append((score, product))
+            # Score the query against all products in one operation
+            scores = np.stack(product_vecs) @ query_vec if products else np.empty(0)
+            order = np.argsort(-scores, kind="stable")
             
-            # Sort by score descending
-            scored_products.sort(key=lambda x: x[0], reverse=True)
-            return [p[1] for p in scored_products]
+            if with_scores:
+                return [(products[i], float(scores[i])) for i in order]
+            return [products[i] for i in order]
             
         except Exception as e:
             print(f"[Ranking Error] {str(e)}")
+            if with_scores:
+                return [(p, 0.0) for p in products]
             return products  # Return unsorted on error
     
+    def _product_embeddings(self, model, products: List[dict], query: str) -> List:
+        """
+        Normalized embeddings for products followed by the query, reusing
+        vectors already computed for the same product text
+        """
+        texts = [
+            f"{product.get('name', '')} {product.get('category', '')} {product.get('description', '')}"
+            for product in products
+        ]
+        vectors = [None] * len(products)
+        to_encode = []
+        for i, text in enumerate(texts):
+            # Keyed by text, so an edited product misses and its old vector ages out
+            cached = self._embedding_cache.get(text)
+            if cached is not None:
+                vectors[i] = cached
+            else:
+                to_encode.append(i)
+        
+        batch = [texts[i] for i in to_encode] + [query]
+        encoded = model.encode(batch, convert_to_numpy=True)
+        encoded = encoded / (np.linalg.norm(encoded, axis=1, keepdims=True) + 1e-10)
+        
+        for i, vec in zip(to_encode, encoded):
+            vectors[i] = self._embedding_cache.put(texts[i], vec)
+        
+        vectors.append(encoded[-1])
+        return vectors
+    
     def generate_product_description(self, product: dict) -> str:
         """Generate an AI sales pitch for a product"""
         try:
@@ -172,7 +253,7 @@ Sales Agent:"""
             import random
             return random.choice(pitches)
             
-        except Exception as e:
+        except Exception:
             return f"Great choice: {product.get('name', 'Item')} - ₹{product.get('price', 'N/A')}"
 
 # Initialize global agent
@@ -3,16 +3,77 @@ Trained Sales Agent Inference Engine
 Uses the trained model to generate responses
 """
 
-import torch
+import os
+import threading
+import time
 from pathlib import Path
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from utils.intent_engine import intent_engine
+from utils.query_cache import normalize_query
+from utils.instrumentation import span
+from utils.kv_cache_store import crop_past
+
+# torch / transformers are imported when a model is loaded, so the intent
+# tables and contextual fallbacks stay usable (and cheap to import) without them
+
+# Fallback reply keywords, highest priority first
+CONTEXTUAL_REPLY_INTENTS = [
+    ("party", ['party', 'celebrat*']),
+    ("wedding", ['wedding', 'bride', 'bridal']),
+    ("formal", ['office', 'formal']),
+    ("casual", ['casual']),
+    ("shoes", ['shoe', 'footwear']),
+    ("price", ['pric*', 'budget', 'under']),
+    ("help", ['help']),
+]
+
+# Customer intent keywords, highest priority first
+CUSTOMER_INTENTS = [
+    ("party_wear", ['party', 'celebrat*', 'event']),
+    ("wedding", ['wedding', 'bride', 'bridal', 'ceremony']),
+    ("formal", ['office', 'formal', 'work', 'corporate']),
+    ("casual", ['casual', 'everyday', 'comfort*']),
+    ("shoes", ['shoe', 'footwear', 'boot']),
+    ("price_inquiry", ['pric*', 'cost', 'budget', 'under', 'cheap*']),
+    ("help", ['help', 'guide', 'how', 'assist']),
+    ("purchase", ['buy', 'purchas*', 'checkout', 'cart']),
+]
+
+intent_engine.register("trained_reply", CONTEXTUAL_REPLY_INTENTS)
+intent_engine.register("trained_intent", CUSTOMER_INTENTS)
+
+# Generation stops as soon as the model starts a new line or the next turn
+STOP_MARKERS = ("\n", "Customer:")
+MAX_RESPONSE_CHARS = 200
+MAX_CONTEXT_TOKENS = 150
 
 class TrainedSalesAgent:
     """Sales agent using trained language model"""
     
-    def __init__(self, model_path="trained_models/final_model"):
+    def __init__(self, model_path="trained_models/final_model", cpu_profile=None, response_cache=None,
+                 shared_weights=False, reply_index=None, kv_cache=None):
+        """
+        Args:
+            model_path: Directory of the fine-tuned model and tokenizer
+            cpu_profile: Optional CPUInferenceProfile (int8 weights, thread pinning);
+                ignored when a GPU is available
+            response_cache: Optional ResponseCache; replies to repeated messages
+                are served from it without running the model
+            shared_weights: Map model.safetensors copy-on-write instead of holding a
+                private copy, so all workers on a box share one copy in the page cache
+            reply_index: Optional ReplyIndex; near-duplicates of curated examples
+                get the stored reply instead of a sampled one
+            kv_cache: Optional SessionKVCache enabling multi-turn replies for
+                calls that pass a session_id
+        """
+        import torch
+        from transformers import AutoTokenizer, AutoModelForCausalLM
+        
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.model_path = Path(model_path)
+        self.cpu_profile = cpu_profile if self.device.type == "cpu" else None
+        self.response_cache = response_cache
+        self.reply_index = reply_index
+        self.kv_cache = kv_cache
         
         print(f"[INIT] Loading trained model from {self.model_path}")
         print(f"[INIT] Device: {self.device}")
@@ -22,99 +83,378 @@ class TrainedSalesAgent:
             self.model = AutoModelForCausalLM.from_pretrained(str(self.model_path))
             self.model.to(self.device)
             self.model.eval()
+            if shared_weights:
+                self._map_shared_weights()
+            if self.cpu_profile is not None:
+                self.model = self.cpu_profile.optimize(self.model)
+                print(f"[OK] CPU inference profile applied: {self.cpu_profile.describe()}")
+            max_positions = getattr(self.model.config, "n_positions", None)
+            if self.kv_cache is not None and max_positions and self.kv_cache.window > max_positions:
+                print(f"[WARNING] KV cache window {self.kv_cache.window} exceeds the model's {max_positions} positions - capping")
+                self.kv_cache.window = max_positions
             print("[OK] Model loaded successfully")
         except Exception as e:
             print(f"[ERROR] Failed to load model: {e}")
             raise
     
-    def generate_response(self, customer_message: str, max_length=100, temperature=0.7) -> str:
-        """Generate sales agent response to customer message"""
+    def _map_shared_weights(self):
+        """Back the model's parameters with the checkpoint file itself (CPU only)"""
+        weights_file = self.model_path / "model.safetensors"
+        if self.device.type != "cpu" or not weights_file.exists():
+            print("[WARNING] Shared weights need a CPU device and model.safetensors - keeping a private copy")
+            return
+        
+        from utils.shared_weights import load_shared_weights
+        shared = load_shared_weights(self.model, weights_file)
+        print(f"[OK] Mapped {shared / 1e6:.0f} MB of weights from {weights_file}")
+        if self.cpu_profile is not None and self.cpu_profile.quantize:
+            # Quantized layers get private int8 copies; the embeddings stay shared
+            print("[INFO] CPU profile quantization keeps private int8 copies of the linear layers")
+    
+    def generate_response(self, customer_message: str, max_length=100, temperature=0.7, session_id=None,
+                          cancel_event=None) -> str:
+        """Generate sales agent response to customer message (in context of session_id's earlier turns)"""
         try:
-            # Format input for the model
-            prompt = f"Customer: {customer_message}\nAgent:"
-            
-            # Tokenize
-            inputs = self.tokenizer.encode(prompt, return_tensors="pt").to(self.device)
-            
-            # Generate with proper parameters
-            with torch.no_grad():
-                output_ids = self.model.generate(
-                    inputs,
-                    max_length=min(len(inputs[0]) + 50, 150),  # Don't generate too long
-                    temperature=max(0.5, temperature),  # Ensure some randomness
-                    top_p=0.9,
-                    top_k=40,
-                    do_sample=True,
-                    pad_token_id=self.tokenizer.eos_token_id,
-                )
-            
-            # Decode response
-            full_response = self.tokenizer.decode(output_ids[0], skip_special_tokens=True)
-            
-            # Extract only the agent's response (after "Agent:")
-            if "Agent:" in full_response:
-                response = full_response.split("Agent:")[-1].strip()
-            else:
-                response = full_response[len(prompt):].strip()
-            
-            # Clean up response
-            lines = response.split("\n")
-            response = lines[0] if lines else response
+            # Same decoding loop as streaming, so generation stops at the end of the agent turn
+            with span("generation"):
+                response = "".join(self.stream_response(
+                    customer_message, temperature=temperature, cancel_event=cancel_event, session_id=session_id
+                )).strip()
             
             # Ensure we have a response
             if not response or len(response) < 5:
                 # Use contextual fallback
                 return self._get_contextual_response(customer_message)
             
-            return response[:200].strip()
+            return response
             
         except Exception as e:
             print(f"[ERROR] Generation failed: {e}")
             return self._get_contextual_response(customer_message)
     
-    def _get_contextual_response(self, msg: str) -> str:
+    def stream_response(self, customer_message: str, max_new_tokens=50, temperature=0.7, cancel_event=None,
+                        session_id=None):
+        """
+        Yield the agent's reply incrementally as tokens are generated
+        
+        Decoding stops at the first newline or "Customer:" marker (the model
+        starting the next turn) or at MAX_RESPONSE_CHARS, instead of
+        generating a full window and trimming it afterwards. Setting
+        cancel_event (a threading.Event) stops generation early. A retrieved
+        or cached reply is yielded whole without running the model.
+        
+        With a session_id (and a kv_cache), the prompt is the session's
+        transcript plus the new turn, but the transcript's attention keys and
+        values are reused from the previous turn: only the last reply and the
+        new customer message run through the model, so a turn costs about the
+        same however long the conversation is.
+        """
+        context = None
+        if session_id and self.kv_cache is not None:
+            context = self.kv_cache.take(session_id)
+        prompt_ids = None
+        past_key_values = None
+        fed = False
+        final_reply = None
+        
+        try:
+            if context is not None:
+                prompt_ids, max_new_tokens = self._open_turn(context, customer_message, max_new_tokens)
+            
+            cached = self.retrieved_response(customer_message) or self.cached_response(customer_message)
+            if cached is not None:
+                final_reply = cached
+                yield cached
+                return
+            
+            import torch
+            
+            if context is None:
+                # Format input for the model
+                prompt = f"Customer: {customer_message}\nAgent:"
+                
+                # Tokenize
+                input_ids = self.tokenizer.encode(prompt, return_tensors="pt").to(self.device)
+                max_new_tokens = min(max_new_tokens, MAX_CONTEXT_TOKENS - input_ids.shape[1])
+            else:
+                # Earlier turns are in the cache; feed only what it doesn't cover yet
+                input_ids = torch.tensor([context.pending() + prompt_ids], device=self.device)
+                past_key_values = context.past
+                self.kv_cache.record_turn(context.cached_length, input_ids.shape[1])
+            
+            generated = []
+            emitted = 0
+            next_input = input_ids
+            
+            with self._grad_context():
+                for _ in range(max(0, max_new_tokens)):
+                    if cancel_event is not None and cancel_event.is_set():
+                        return
+                    
+                    outputs = self.model(next_input, past_key_values=past_key_values, use_cache=True)
+                    past_key_values = outputs.past_key_values
+                    fed = True
+                    token_id = self._sample_next_token(outputs.logits[:, -1, :], temperature)
+                    if token_id == self.tokenizer.eos_token_id:
+                        break
+                    
+                    generated.append(token_id)
+                    next_input = torch.tensor([[token_id]], device=self.device)
+                    
+                    text = self.tokenizer.decode(generated, skip_special_tokens=True)
+                    if text.endswith("\ufffd"):
+                        # Incomplete multi-byte character (e.g. emoji) - wait for the next token
+                        continue
+                    
+                    reply, finished = self._cut_at_stop_marker(text.lstrip())
+                    # Hold back a trailing partial "Customer:" so it is never emitted
+                    safe = len(reply) if finished else len(reply) - self._partial_marker_length(reply)
+                    if safe > emitted:
+                        yield reply[emitted:safe]
+                        emitted = safe
+                    if finished:
+                        final_reply = reply
+                        if context is None:
+                            self._remember_response(customer_message, reply)
+                        return
+            
+            if generated:
+                reply, _ = self._cut_at_stop_marker(self.tokenizer.decode(generated, skip_special_tokens=True).lstrip())
+                if len(reply) > emitted:
+                    yield reply[emitted:]
+                    emitted = len(reply)
+                final_reply = reply
+                if context is None:
+                    self._remember_response(customer_message, reply)
+            
+            if emitted == 0:
+                final_reply = self._get_contextual_response(customer_message)
+                yield final_reply
+        finally:
+            if context is not None:
+                self._close_turn(context, prompt_ids, final_reply, past_key_values if fed else None)
+    
+    def _open_turn(self, context, customer_message, max_new_tokens):
+        """Token ids of a session's new customer turn, trimming the transcript to the window"""
+        separator = "\n" if context.exchanges else ""
+        prompt_ids = self.tokenizer.encode(f"{separator}Customer: {customer_message}\nAgent:")
+        window = self.kv_cache.window
+        max_new_tokens = max(0, min(max_new_tokens, window - len(prompt_ids)))
+        
+        budget = window - len(prompt_ids) - max_new_tokens
+        if context.total_length() > budget:
+            # Trim well below the limit so the re-encode isn't repeated every turn
+            context.trim(budget - window // 4)
+            self.kv_cache.record_turn(0, 0, trimmed=True)
+        return prompt_ids, max_new_tokens
+    
+    def _close_turn(self, context, prompt_ids, reply, past):
+        """Record the finished exchange and hand the session's context back to the cache"""
+        if reply is None or prompt_ids is None:
+            # Cancelled or failed - forget this turn, keep the transcript's cache
+            if past is not None:
+                context.past = crop_past(past, context.cached_length)
+        else:
+            if past is not None:
+                # Everything up to "Agent:" was fed; the reply's tokens go in with the next turn
+                context.cached_length = context.total_length() + len(prompt_ids)
+                context.past = crop_past(past, context.cached_length)
+            context.exchanges.append(prompt_ids + self.tokenizer.encode(" " + reply))
+        self.kv_cache.put(context)
+    
+    def generate_batch(self, customer_messages, max_new_tokens=50, temperature=0.7, with_token_counts=False,
+                       cancel_events=None):
+        """
+        Generate replies for several customer messages in one decoding loop
+        
+        Prompts are left-padded to a common length so every row's next token
+        sits in the last position; the attention mask hides the padding and
+        position ids restart at each row's first real token. Rows that reach
+        a stop marker or EOS are frozen while the rest keep decoding, and the
+        loop ends once every row has finished. Messages are always generated;
+        callers check retrieved_response / cached_response first.
+        
+        Args:
+            customer_messages: List of customer messages
+            with_token_counts: Also return the number of tokens generated per row
+            cancel_events: Optional threading.Event (or None) per row; a set event
+                freezes that row, and its reply is neither used nor cached
+        
+        Returns:
+            Replies in input order (and token counts if requested)
+        """
+        import torch
+        
+        prompts = [f"Customer: {message}\nAgent:" for message in customer_messages]
+        
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.tokenizer.padding_side = "left"
+        encoded = self.tokenizer(prompts, return_tensors="pt", padding=True)
+        input_ids = encoded["input_ids"].to(self.device)
+        attention_mask = encoded["attention_mask"].to(self.device)
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+        max_new_tokens = min(max_new_tokens, MAX_CONTEXT_TOKENS - input_ids.shape[1])
+        
+        rows = len(prompts)
+        generated = [[] for _ in range(rows)]
+        replies = [None] * rows
+        cancel_events = cancel_events or [None] * rows
+        cancelled = [False] * rows
+        past_key_values = None
+        next_input = input_ids
+        
+        with self._grad_context():
+            for _ in range(max(0, max_new_tokens)):
+                outputs = self.model(
+                    input_ids=next_input,
+                    attention_mask=attention_mask,
+                    position_ids=position_ids,
+                    past_key_values=past_key_values,
+                    use_cache=True,
+                )
+                past_key_values = outputs.past_key_values
+                tokens = self._sample_next_tokens(outputs.logits[:, -1, :], temperature)
+                
+                for row, token_id in enumerate(tokens.tolist()):
+                    if replies[row] is not None:
+                        continue
+                    if cancel_events[row] is not None and cancel_events[row].is_set():
+                        cancelled[row] = True
+                        replies[row] = ""
+                        continue
+                    if token_id == self.tokenizer.eos_token_id:
+                        replies[row] = self.tokenizer.decode(generated[row], skip_special_tokens=True)
+                        continue
+                    generated[row].append(token_id)
+                    text = self.tokenizer.decode(generated[row], skip_special_tokens=True)
+                    if text.endswith("\ufffd"):
+                        continue
+                    reply, finished = self._cut_at_stop_marker(text.lstrip())
+                    if finished:
+                        replies[row] = reply
+                
+                if all(reply is not None for reply in replies):
+                    break
+                
+                # Finished rows keep decoding padding; their output is ignored
+                next_input = tokens.unsqueeze(-1)
+                attention_mask = torch.cat([attention_mask, attention_mask.new_ones((rows, 1))], dim=-1)
+                position_ids = position_ids[:, -1:] + 1
+        
+        results = []
+        for row, message in enumerate(customer_messages):
+            if cancelled[row]:
+                # Nobody is waiting for it
+                results.append("")
+                continue
+            reply = replies[row]
+            if reply is None:
+                reply = self.tokenizer.decode(generated[row], skip_special_tokens=True)
+            reply, _ = self._cut_at_stop_marker(reply.strip())
+            self._remember_response(message, reply)
+            results.append(reply if len(reply) >= 5 else self._get_contextual_response(message))
+        
+        if with_token_counts:
+            return results, [len(tokens) for tokens in generated]
+        return results
+    
+    def retrieved_response(self, customer_message: str):
+        """Curated reply to a near-duplicate of a known customer message, or None"""
+        if self.reply_index is None:
+            return None
+        reply, _ = self.reply_index.match(customer_message)
+        return reply
+    
+    def cached_response(self, customer_message: str):
+        """Previously generated reply to the same (normalized) message, or None"""
+        if self.response_cache is None:
+            return None
+        return self.response_cache.get("trained_model", normalize_query(customer_message))
+    
+    def _remember_response(self, customer_message: str, reply: str):
+        """Cache a complete model reply; too-short ones fall back and aren't kept"""
+        if self.response_cache is not None and len(reply.strip()) >= 5:
+            self.response_cache.put("trained_model", normalize_query(customer_message), reply.strip())
+    
+    def _grad_context(self):
+        """inference_mode under the CPU profile, otherwise no_grad"""
+        if self.cpu_profile is not None:
+            return self.cpu_profile.grad_context()
+        import torch
+        return torch.no_grad()
+    
+    @staticmethod
+    def _cut_at_stop_marker(reply: str):
+        """Trim reply at the end of the agent turn; returns (reply, finished)"""
+        cut = len(reply)
+        for marker in STOP_MARKERS:
+            index = reply.find(marker)
+            if index != -1:
+                cut = min(cut, index)
+        if cut < len(reply):
+            return reply[:cut].rstrip(), True
+        if len(reply) >= MAX_RESPONSE_CHARS:
+            return reply[:MAX_RESPONSE_CHARS].rstrip(), True
+        return reply, False
+    
+    @staticmethod
+    def _partial_marker_length(reply: str) -> int:
+        """Length of a trailing prefix of a stop marker (e.g. "Cust")"""
+        longest = 0
+        for marker in STOP_MARKERS:
+            for size in range(1, len(marker)):
+                if reply.endswith(marker[:size]):
+                    longest = max(longest, size)
+        return longest
+    
+    def _sample_next_token(self, logits, temperature, top_k=40, top_p=0.9) -> int:
+        """Temperature + top-k + nucleus sampling of one token id"""
+        return int(self._sample_next_tokens(logits, temperature, top_k, top_p)[0])
+    
+    def _sample_next_tokens(self, logits, temperature, top_k=40, top_p=0.9):
+        """Temperature + top-k + nucleus sampling, one token id per batch row"""
+        import torch
+        
+        logits = logits / max(0.5, temperature)  # Ensure some randomness
+        
+        top_values, top_indices = torch.topk(logits, min(top_k, logits.shape[-1]), dim=-1)
+        probs = torch.softmax(top_values, dim=-1)
+        
+        # Keep the smallest set of tokens whose probability mass reaches top_p
+        cumulative = torch.cumsum(probs, dim=-1)
+        keep = cumulative - probs < top_p
+        probs = probs * keep
+        probs = probs / probs.sum(dim=-1, keepdim=True)
+        
+        choice = torch.multinomial(probs, 1)
+        return top_indices.gather(-1, choice).squeeze(-1)
+    
+    @staticmethod
+    def _get_contextual_response(msg: str) -> str:
         """Fallback contextual response based on message"""
-        msg_lower = msg.lower()
+        intent = intent_engine.classify("trained_reply", msg)
         
-        if any(w in msg_lower for w in ['party', 'celebration']):
+        if intent == "party":
             return "🎉 Great! Our party wear collection is amazing. What's your style preference?"
-        elif any(w in msg_lower for w in ['wedding', 'bride']):
+        elif intent == "wedding":
             return "💍 Wonderful! Our wedding collection is beautiful. Traditional or modern style?"
-        elif any(w in msg_lower for w in ['office', 'formal']):
+        elif intent == "formal":
             return "💼 Professional wear - perfect! What's your preferred style?"
-        elif any(w in msg_lower for w in ['casual']):
+        elif intent == "casual":
             return "👕 Casual comfort! Let me show you our comfy options."
-        elif any(w in msg_lower for w in ['shoe', 'footwear']):
+        elif intent == "shoes":
             return "👟 Amazing shoe selection! What type are you looking for?"
-        elif any(w in msg_lower for w in ['price', 'budget', 'under']):
+        elif intent == "price":
             return "💰 Great! What's your budget? I'll find perfect options!"
-        elif any(w in msg_lower for w in ['help']):
+        elif intent == "help":
             return "🤝 I'm here to help! Tell me what you need and I'll find it!"
         else:
             return "✨ Absolutely! Tell me more about what you're looking for and I'll help!"
     
     def rank_customer_intent(self, customer_message: str) -> str:
         """Detect customer intent from message"""
-        msg_lower = customer_message.lower()
-        
-        if any(w in msg_lower for w in ['party', 'celebration', 'event']):
-            return "party_wear"
-        elif any(w in msg_lower for w in ['wedding', 'bride', 'ceremony']):
-            return "wedding"
-        elif any(w in msg_lower for w in ['office', 'formal', 'work', 'corporate']):
-            return "formal"
-        elif any(w in msg_lower for w in ['casual', 'everyday', 'comfort']):
-            return "casual"
-        elif any(w in msg_lower for w in ['shoe', 'footwear', 'boot']):
-            return "shoes"
-        elif any(w in msg_lower for w in ['price', 'cost', 'budget', 'under', 'cheap']):
-            return "price_inquiry"
-        elif any(w in msg_lower for w in ['help', 'guide', 'how', 'assist']):
-            return "help"
-        elif any(w in msg_lower for w in ['buy', 'purchase', 'checkout', 'cart']):
-            return "purchase"
-        else:
-            return "browse"
+        return intent_engine.classify("trained_intent", customer_message, default="browse")
     
     def get_contextual_response(self, customer_message: str) -> dict:
         """Generate response with context"""
@@ -127,16 +467,80 @@ class TrainedSalesAgent:
             "model": "trained_sales_agent"
         }
 
+def contextual_response(msg: str) -> str:
+    """Keyword-based fallback reply; needs no model (or torch) loaded"""
+    return TrainedSalesAgent._get_contextual_response(msg)
+
+def _reply_index_from_env():
+    """Retrieval fast path over TRAINING_DATA (skipped when the embedding model can't load)"""
+    try:
+        from utils.reply_index import ReplyIndex
+        reply_index = ReplyIndex.from_env()
+    except Exception as e:
+        print(f"[WARNING] Reply retrieval disabled: {e}")
+        return None
+    if reply_index is not None:
+        print(f"[OK] Reply index: {len(reply_index)} examples, threshold {reply_index.threshold}")
+    return reply_index
+
+_reply_index = None
+_reply_index_built = False
+_reply_index_lock = threading.Lock()
+
+def get_reply_index():
+    """Build the reply index on first use; later calls (and a disabled or failed build) reuse the result"""
+    global _reply_index, _reply_index_built
+    if _reply_index_built:
+        return _reply_index
+    with _reply_index_lock:
+        if not _reply_index_built:
+            _reply_index = _reply_index_from_env()
+            _reply_index_built = True
+    return _reply_index
+
+def _kv_cache_from_env():
+    """Per-session KV caches for multi-turn replies (off unless TRAINED_KV_CACHE_MB > 0)"""
+    max_mb = float(os.getenv("TRAINED_KV_CACHE_MB", 0))
+    if max_mb <= 0:
+        return None
+    from utils.kv_cache_store import SessionKVCache
+    return SessionKVCache(
+        window=int(os.getenv("TRAINED_KV_WINDOW", 512)),
+        max_bytes=int(max_mb * 1024 * 1024),
+        idle_ttl_seconds=float(os.getenv("SESSION_IDLE_TTL", 1800))
+    )
+
 # Global instance
 _agent = None
+_agent_lock = threading.Lock()
+# monotonic time of the last failed load; retried after TRAINED_LOAD_RETRY_SECONDS
+_load_failed_at = None
 
-def get_trained_agent():
-    """Get or create trained agent instance"""
-    global _agent
-    if _agent is None:
+def get_trained_agent(response_cache=None):
+    """Get or create trained agent instance (None while the model can't be loaded)"""
+    global _agent, _load_failed_at
+    if _agent is not None:
+        return _agent
+    with _agent_lock:
+        if _agent is not None:
+            return _agent
+        retry_after = float(os.getenv("TRAINED_LOAD_RETRY_SECONDS", 60))
+        if _load_failed_at is not None and time.monotonic() - _load_failed_at < retry_after:
+            return None
         try:
-            _agent = TrainedSalesAgent()
+            from models.cpu_profile import CPUInferenceProfile
+            agent = TrainedSalesAgent(
+                cpu_profile=CPUInferenceProfile.from_env(),
+                response_cache=response_cache,
+                shared_weights=os.getenv("SHARED_WEIGHTS", "false").lower() == "true",
+                kv_cache=_kv_cache_from_env()
+            )
         except Exception as e:
             print(f"[WARNING] Could not load trained model: {e}")
+            _load_failed_at = time.monotonic()
             return None
+        # Only worth an embedding pass once there is a model to serve it with
+        agent.reply_index = get_reply_index()
+        _load_failed_at = None
+        _agent = agent
     return _agent
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Hugging Face inference API
+Answers like the hosted text-generation endpoint, with optional slowness and
+failures, so AISalesAgent's pooling, deadline and circuit breaker can be
+exercised without network access:
+
+    python stand_in_inference_server.py --port 8765 --delay 0.2 --fail-rate 0.5
+    HF_API_URL=http://127.0.0.1:8765 uvicorn main:app
+"""
+
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def make_handler(delay, fail_rate, fail_status):
+    class StandInHandler(BaseHTTPRequestHandler):
+        # Keep-alive, like the real endpoint
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out as separate writes; don't let Nagle delay the body
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)) or 0)
+            if delay:
+                time.sleep(delay)
+
+            if random.random() < fail_rate:
+                payload = json.dumps({"error": "Model is currently loading"}).encode()
+                self.send_response(fail_status)
+            else:
+                prompt = json.loads(body or b"{}").get("inputs", "")
+                reply = "✨ Stand-in reply: we have great options for that! What's your budget?"
+                payload = json.dumps([{"generated_text": f"{prompt} {reply}"}]).encode()
+                self.send_response(200)
+
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            try:
+                self.end_headers()
+                self.wfile.write(payload)
+            except (BrokenPipeError, ConnectionResetError):
+                # Client gave up (deadline) before the reply was ready
+                self.close_connection = True
+
+        def log_message(self, format, *args):
+            pass
+
+    return StandInHandler
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Bursts of concurrent clients shouldn't overflow the default backlog of 5
+    request_queue_size = 128
+
+def serve(port=8765, delay=0.0, fail_rate=0.0, fail_status=503):
+    """Run the stand-in server until interrupted"""
+    server = StandInServer(("127.0.0.1", port), make_handler(delay, fail_rate, fail_status))
+    print(f"[OK] Stand-in inference API on http://127.0.0.1:{port} (delay {delay}s, fail rate {fail_rate})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the HF inference API")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before answering")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--fail-status", type=int, default=503, help="HTTP status for failed requests")
+    args = parser.parse_args()
+    serve(args.port, args.delay, args.fail_rate, args.fail_status)
@@ -0,0 +1,54 @@
+# conftest.py - Make the service modules (models/, utils/, training_data) importable from tests
+import sys
+import zlib
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+class HashingEncoder:
+    """Deterministic bag-of-words encoder with the SentenceTransformer calls the service uses"""
+
+    dim = 64
+
+    def __init__(self):
+        self.calls = 0
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, texts, convert_to_numpy=True, **kwargs):
+        self.calls += 1
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in str(text).lower().split():
+                vectors[row, zlib.crc32(word.encode("utf-8")) % self.dim] += 1.0
+        return vectors
+
+@pytest.fixture
+def embedding_model(monkeypatch):
+    """Name under which the model registry serves a HashingEncoder"""
+    from utils import model_registry
+
+    name = "tests/hashing-encoder"
+    monkeypatch.setitem(model_registry._models, name, HashingEncoder())
+    return name
+
+class FakeClock:
+    """Stand-in for a module's time import; monotonic() only moves when advanced"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+@pytest.fixture
+def clock():
+    """Patch it in with monkeypatch.setattr(module, "time", clock)"""
+    return FakeClock()
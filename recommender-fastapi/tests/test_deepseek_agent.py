@@ -0,0 +1,20 @@
+# test_deepseek_agent.py - DeepseekAgent reply cache keys
+from models.deepseek_agent import DeepseekAgent
+from utils.response_cache import ResponseCache
+
+def test_cached_default_reply_follows_message_count():
+    # "below" only matches the price_ceiling modifier, so the reply is the default one
+    cached = DeepseekAgent(response_cache=ResponseCache())
+    uncached = DeepseekAgent()
+
+    for _ in range(3):
+        expected = uncached.generate_response("below 3000", "s1")
+        assert cached.generate_response("below 3000", "s1") == expected
+
+def test_cache_is_shared_across_sessions_for_intent_replies():
+    cache = ResponseCache()
+    agent = DeepseekAgent(response_cache=cache)
+
+    first = agent.generate_response("show me party wear", "a")
+    assert agent.generate_response("party wear please", "b") == first
+    assert cache.stats()["hits"] == 1
@@ -0,0 +1,110 @@
+# test_generation_router.py - Tier selection, timeouts and breaker accounting in GenerationRouter
+import asyncio
+import threading
+
+import pytest
+
+from models.generation_router import GenerationRouter, GenerationTier, TierUnavailable
+from stand_in_inference_server import StandInServer, make_handler
+from utils.http_client import CircuitBreaker, CircuitOpen, PooledJSONClient
+from utils.session_store import SessionStore
+
+@pytest.fixture
+def slow_upstream():
+    """Stand-in inference API that answers after 0.5s"""
+    server = StandInServer(("127.0.0.1", 0), make_handler(delay=0.5, fail_rate=0.0, fail_status=503))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+def _router(client):
+    async def remote(message, session_id, context, timeout, cancel_event):
+        try:
+            return str(await client.apost_json({"inputs": message}, deadline=timeout))
+        except CircuitOpen:
+            raise TierUnavailable("circuit open")
+
+    async def fallback(message, session_id, context, timeout, cancel_event):
+        return "fallback"
+
+    tiers = [
+        GenerationTier("remote", remote, prior_ms=1.0, enforces_deadline=True),
+        GenerationTier("fallback", fallback, prior_ms=0.1),
+    ]
+    return GenerationRouter(tiers, default_budget_ms=150.0, reserve_ms=20.0)
+
+def test_router_timeouts_trip_the_upstream_breaker(slow_upstream):
+    async def scenario():
+        client = PooledJSONClient(slow_upstream, breaker=CircuitBreaker(failure_threshold=3, reset_timeout=60))
+        router = _router(client)
+        results = []
+        for _ in range(5):
+            # Keep probing the remote tier so every request reaches it while the circuit is closed
+            router.tiers[0].last_attempt = 0.0
+            results.append(await router.generate("hello"))
+        await client.aclose()
+        client.close()
+        return client, router, results
+
+    client, router, results = asyncio.run(scenario())
+
+    assert all(result.tier == "fallback" for result in results)
+    assert client.timeouts == 3
+    assert client.breaker.state == "open"
+    remote = router.tiers[0].stats()
+    assert remote["timeouts"] == 3
+    assert remote["unavailable"] == 2
+
+def test_over_budget_tier_is_cancelled_for_the_next_one():
+    async def slow(message, session_id, context, timeout, cancel_event):
+        await asyncio.sleep(1.0)
+        return "slow"
+
+    async def fast(message, session_id, context, timeout, cancel_event):
+        return "fast"
+
+    router = GenerationRouter(
+        [GenerationTier("slow", slow, prior_ms=1.0), GenerationTier("fast", fast)],
+        default_budget_ms=100.0,
+    )
+    router.tiers[0].last_attempt = 0.0
+    result = asyncio.run(router.generate("hi"))
+
+    assert result.tier == "fast"
+    assert result.latency_ms < 500
+    assert [attempt[1] for attempt in result.attempts] == ["timeout", "served"]
+
+def test_abandoned_tier_is_signalled_and_only_the_served_reply_is_recorded():
+    stopped = threading.Event()
+
+    def blocking_work(cancel_event):
+        # Thread pool work keeps running after its coroutine is cancelled
+        if cancel_event.wait(2.0):
+            stopped.set()
+        return "late"
+
+    async def slow(message, session_id, context, timeout, cancel_event):
+        return await asyncio.get_running_loop().run_in_executor(None, blocking_work, cancel_event)
+
+    async def fast(message, session_id, context, timeout, cancel_event):
+        return "fast"
+
+    sessions = SessionStore()
+    router = GenerationRouter(
+        [GenerationTier("slow", slow, prior_ms=1.0), GenerationTier("fast", fast)],
+        default_budget_ms=100.0,
+        sessions=sessions,
+    )
+    router.tiers[0].last_attempt = 0.0
+    result = asyncio.run(router.generate("hi", session_id="s1"))
+
+    assert result.tier == "fast"
+    assert stopped.wait(1.0)
+    session = sessions.get("s1")
+    assert session.history() == [
+        {"role": "user", "content": "hi"},
+        {"role": "assistant", "content": "fast"},
+    ]
+    assert session.message_count == 1
@@ -0,0 +1,156 @@
+# test_http_client.py - PooledJSONClient against the local stand-in inference server
+import json
+import threading
+import time
+
+import pytest
+
+from stand_in_inference_server import StandInServer, make_handler
+from utils.http_client import CircuitBreaker, CircuitOpen, PooledJSONClient, UpstreamError
+
+@pytest.fixture
+def upstream():
+    """Stand-in server whose health can be flipped mid-test; records requests and client ports"""
+    state = {"fail": False, "delay": 0.0, "trickle": 0.0, "requests": 0, "ports": set()}
+    base = make_handler(delay=0.0, fail_rate=0.0, fail_status=503)
+
+    class Handler(base):
+        def do_POST(self):
+            state["requests"] += 1
+            state["ports"].add(self.client_address[1])
+            if state["delay"]:
+                time.sleep(state["delay"])
+            if not state["fail"] and not state["trickle"]:
+                return super().do_POST()
+
+            self.rfile.read(int(self.headers.get("Content-Length", 0)) or 0)
+            payload = json.dumps([{"generated_text": "slow"}] if state["trickle"] else {"error": "down"}).encode()
+            self.send_response(200 if state["trickle"] else 503)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            try:
+                for byte in payload:
+                    self.wfile.write(bytes([byte]))
+                    self.wfile.flush()
+                    time.sleep(state["trickle"])
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True
+
+    server = StandInServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    state["url"] = f"http://127.0.0.1:{server.server_address[1]}"
+    yield state
+    server.shutdown()
+    server.server_close()
+
+def _client(upstream, **breaker):
+    return PooledJSONClient(upstream["url"], deadline=1.0, breaker=CircuitBreaker(**breaker))
+
+def test_breaker_opens_after_the_failure_threshold(upstream):
+    upstream["fail"] = True
+    client = _client(upstream, failure_threshold=3, reset_timeout=60)
+
+    for _ in range(3):
+        with pytest.raises(UpstreamError):
+            client.post_json({"inputs": "hi"})
+
+    assert client.breaker.state == "open"
+    assert client.breaker.opens == 1
+    client.close()
+
+def test_open_breaker_short_circuits_without_calling_upstream(upstream):
+    upstream["fail"] = True
+    client = _client(upstream, failure_threshold=2, reset_timeout=60)
+    for _ in range(2):
+        with pytest.raises(UpstreamError):
+            client.post_json({"inputs": "hi"})
+
+    for _ in range(3):
+        with pytest.raises(CircuitOpen):
+            client.post_json({"inputs": "hi"})
+
+    assert upstream["requests"] == 2
+    assert client.breaker.short_circuits == 3
+    client.close()
+
+def test_half_open_probe_closes_the_breaker_once_upstream_recovers(upstream):
+    upstream["fail"] = True
+    client = _client(upstream, failure_threshold=1, reset_timeout=0.2)
+    with pytest.raises(UpstreamError):
+        client.post_json({"inputs": "hi"})
+    with pytest.raises(CircuitOpen):
+        client.post_json({"inputs": "hi"})
+
+    upstream["fail"] = False
+    time.sleep(0.25)
+    assert client.post_json({"inputs": "hi"})[0]["generated_text"].startswith("hi")
+    assert client.breaker.state == "closed"
+    client.close()
+
+def test_failed_half_open_probe_reopens_the_breaker(upstream):
+    upstream["fail"] = True
+    client = _client(upstream, failure_threshold=1, reset_timeout=0.2)
+    with pytest.raises(UpstreamError):
+        client.post_json({"inputs": "hi"})
+
+    time.sleep(0.25)
+    with pytest.raises(UpstreamError):
+        client.post_json({"inputs": "hi"})
+    assert client.breaker.state == "open"
+    with pytest.raises(CircuitOpen):
+        client.post_json({"inputs": "hi"})
+    client.close()
+
+def test_delayed_response_times_out_at_the_deadline(upstream):
+    upstream["delay"] = 0.5
+    client = _client(upstream)
+
+    started = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        client.post_json({"inputs": "hi"}, deadline=0.1)
+
+    assert time.perf_counter() - started < 0.3
+    assert client.timeouts == 1
+    assert client.breaker.failures == 1
+    client.close()
+
+def test_trickled_response_still_times_out_at_the_deadline(upstream):
+    # Every byte arrives well within the read timeout; the whole body doesn't
+    upstream["trickle"] = 0.05
+    client = _client(upstream)
+
+    started = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        client.post_json({"inputs": "hi"}, deadline=0.2)
+
+    assert time.perf_counter() - started < 0.4
+    client.close()
+
+def test_async_deadline_matches_the_sync_one(upstream):
+    import asyncio
+
+    upstream["delay"] = 0.5
+    client = _client(upstream)
+
+    async def call():
+        try:
+            await client.apost_json({"inputs": "hi"}, deadline=0.1)
+        finally:
+            await client.aclose()
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(call())
+    assert client.timeouts == 1
+    client.close()
+
+def test_calls_reuse_one_pooled_connection(upstream):
+    client = _client(upstream)
+
+    for _ in range(5):
+        client.post_json({"inputs": "hi"})
+
+    assert upstream["requests"] == 5
+    assert len(upstream["ports"]) == 1
+    client.close()
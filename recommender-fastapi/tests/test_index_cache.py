@@ -0,0 +1,36 @@
+# test_index_cache.py - Saved embedding matrices are reused, and superseded ones pruned
+import numpy as np
+
+import utils.index_cache as index_cache
+from utils.index_cache import EmbeddingIndexCache
+
+def _save(cache, texts):
+    keys = [cache.row_key(text) for text in texts]
+    cache.save(keys, np.random.default_rng(len(texts)).normal(size=(len(texts), 4)))
+    return keys
+
+def _matrices(cache):
+    return sorted(path.name for path in cache.cache_dir.glob("*.npy"))
+
+def test_save_keeps_the_current_and_previous_matrix(tmp_path, monkeypatch):
+    monkeypatch.setattr(index_cache, "PRUNE_GRACE_SECONDS", 0)
+    cache = EmbeddingIndexCache(tmp_path, "model")
+
+    first = _save(cache, ["a"])
+    second = _save(cache, ["a", "b"])
+    third = _save(cache, ["a", "b", "c"])
+
+    assert len(_matrices(cache)) == 2
+    assert cache.load(first) is None
+    assert cache.load(second) is not None
+    assert cache.load(third).shape == (3, 4)
+    assert not (cache.cache_dir / f"{cache.catalog_key(first)}.keys.json").exists()
+    assert set(cache.known_rows()) == set(third)
+
+def test_recent_files_are_left_for_concurrent_writers(tmp_path):
+    cache = EmbeddingIndexCache(tmp_path, "model")
+
+    for count in range(1, 5):
+        _save(cache, [str(i) for i in range(count)])
+
+    assert len(_matrices(cache)) == 4
@@ -0,0 +1,84 @@
+# test_inference_executor.py - Backpressure and context propagation in InferenceExecutor
+import asyncio
+import contextvars
+import threading
+import time
+
+import pytest
+
+from utils import instrumentation
+from utils.inference_executor import ExecutorSaturated, InferenceExecutor
+from utils.instrumentation import span
+
+@pytest.fixture
+def saturated():
+    """One worker blocked on an event and one task waiting behind it"""
+    release = threading.Event()
+    executor = InferenceExecutor(max_workers=1, max_queue=1, retry_after=7)
+    running = [executor.submit(release.wait, 5.0) for _ in range(2)]
+    while executor.stats()["active"] < 1:
+        time.sleep(0.001)
+    yield executor
+    release.set()
+    for future in running:
+        future.result(timeout=5.0)
+    executor.shutdown()
+
+def test_full_queue_rejects_immediately(saturated):
+    with pytest.raises(ExecutorSaturated) as excinfo:
+        saturated.submit(print, "never runs")
+
+    assert excinfo.value.retry_after == 7
+    stats = saturated.stats()
+    assert (stats["active"], stats["queue_depth"], stats["rejected"]) == (1, 1, 1)
+
+def test_full_queue_answers_503_with_retry_after(saturated, monkeypatch):
+    pytest.importorskip("httpx")
+    pytest.importorskip("dotenv")
+    main = pytest.importorskip("main")
+    from fastapi.testclient import TestClient
+
+    class Catalog:
+        products = []
+
+        def delete_products(self, ids):
+            raise AssertionError("should have been rejected before running")
+
+    monkeypatch.setattr(main, "recommender", Catalog())
+    monkeypatch.setattr(main, "inference_executor", saturated)
+
+    response = TestClient(main.app).post("/products/delete", json={"ids": [1]})
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "7"
+    assert response.json()["success"] is False
+
+def test_run_carries_the_callers_context_into_the_worker():
+    tenant = contextvars.ContextVar("tenant", default=None)
+    executor = InferenceExecutor(max_workers=2)
+
+    def work():
+        with span("encode"):
+            return tenant.get(), threading.current_thread().name
+
+    async def request(name):
+        # Each request task has its own context, like the middleware sets up per request
+        tenant.set(name)
+        breakdown = {}
+        instrumentation._breakdown.set(breakdown)
+        value, thread = await executor.run(work)
+        return value, thread, breakdown
+
+    async def scenario():
+        return await asyncio.gather(request("a"), request("b"))
+
+    try:
+        results = asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+
+    assert [value for value, _, _ in results] == ["a", "b"]
+    assert all(thread.startswith("inference") for _, thread, _ in results)
+    # Spans timed on the worker land in the calling request's Server-Timing breakdown
+    assert all("encode" in breakdown for _, _, breakdown in results)
+    assert tenant.get() is None
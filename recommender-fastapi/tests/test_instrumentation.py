@@ -0,0 +1,111 @@
+# test_instrumentation.py - Request IDs, Server-Timing, Prometheus exposition and span overhead
+import asyncio
+import re
+import time
+
+import pytest
+
+from utils import instrumentation
+from utils.instrumentation import BUCKETS, InstrumentationMiddleware, Metrics, span
+
+@pytest.fixture
+def fresh_metrics(monkeypatch):
+    registry = Metrics()
+    monkeypatch.setattr(instrumentation, "metrics", registry)
+    return registry
+
+@pytest.fixture
+def client(fresh_metrics):
+    pytest.importorskip("httpx")
+    fastapi = pytest.importorskip("fastapi")
+    from fastapi.testclient import TestClient
+
+    app = fastapi.FastAPI()
+    app.add_middleware(InstrumentationMiddleware)
+
+    @app.get("/items/{item_id}")
+    def get_item(item_id: int):
+        with span("scoring"):
+            time.sleep(0.002)
+        with span("filtering"):
+            pass
+        return {"id": item_id, "request_id": instrumentation.current_request_id()}
+
+    return TestClient(app)
+
+def test_incoming_request_id_is_reused_and_echoed(client):
+    response = client.get("/items/1", headers={"X-Request-ID": "abc-123"})
+
+    assert response.headers["x-request-id"] == "abc-123"
+    assert response.json()["request_id"] == "abc-123"
+
+def test_missing_request_id_is_generated(client):
+    first = client.get("/items/1").headers["x-request-id"]
+    second = client.get("/items/1").headers["x-request-id"]
+
+    assert re.fullmatch(r"[0-9a-f]{32}", first)
+    assert first != second
+
+def test_server_timing_lists_each_span(client):
+    header = client.get("/items/1").headers["server-timing"]
+    durations = dict(re.fullmatch(r"(\w+);dur=([\d.]+)", part.strip()).groups() for part in header.split(","))
+
+    assert set(durations) == {"scoring", "filtering"}
+    assert float(durations["scoring"]) >= 2.0
+
+def test_prometheus_exposition_format(client, fresh_metrics):
+    for item_id in (1, 2, 3):
+        client.get(f"/items/{item_id}")
+    client.get("/items/not-a-number")
+    text = fresh_metrics.prometheus()
+    lines = text.splitlines()
+
+    assert text.endswith("\n")
+    sample = re.compile(r'[a-z_]+(\{([a-z_]+="[^"]*",?)+\})? \S+')
+    for line in lines:
+        assert line.startswith(("# HELP ", "# TYPE ")) or sample.fullmatch(line), line
+
+    # Requests are labelled by route template, not raw path, and counted per status
+    assert 'retail_genie_requests_total{method="GET",endpoint="/items/{item_id}",status="200"} 3' in lines
+    assert 'retail_genie_requests_total{method="GET",endpoint="/items/{item_id}",status="422"} 1' in lines
+
+    # Buckets are cumulative and +Inf equals the count
+    name = "retail_genie_stage_duration_seconds"
+    buckets = [line for line in lines if line.startswith(f'{name}_bucket{{stage="scoring"')]
+    counts = [int(line.rsplit(" ", 1)[1]) for line in buckets]
+    assert len(buckets) == len(BUCKETS) + 1 and buckets[-1].startswith(f'{name}_bucket{{stage="scoring",le="+Inf"}}')
+    assert counts == sorted(counts)
+    assert f'{name}_count{{stage="scoring"}} 3' in lines and counts[-1] == 3
+
+def test_instrumentation_overhead_stays_in_microseconds(fresh_metrics):
+    # Not a strict benchmark: the bounds are ~10x the measured cost, so only a regression trips them
+    async def app(scope, receive, send):
+        for stage in ("intent", "scoring", "serialization"):
+            with span(stage):
+                pass
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    async def receive():
+        return {"type": "http.request"}
+
+    async def send(message):
+        pass
+
+    async def per_request_seconds(handler, n=5000):
+        scope = {"type": "http", "method": "GET", "path": "/x", "headers": []}
+        started = time.perf_counter()
+        for _ in range(n):
+            await handler(dict(scope), receive, send)
+        return (time.perf_counter() - started) / n
+
+    async def measure():
+        bare = await per_request_seconds(app)
+        instrumented = await per_request_seconds(InstrumentationMiddleware(app))
+        return bare, instrumented
+
+    bare, instrumented = asyncio.run(measure())
+
+    assert bare < 100e-6
+    assert instrumented - bare < 100e-6
+    assert fresh_metrics.latency_report()["stages"]["scoring"]["count"] == 10000
@@ -0,0 +1,65 @@
+# test_intent_engine.py - Whole-word, plural and stem keyword matching in IntentEngine
+import pytest
+
+import models.deepseek_agent  # noqa: F401 - registers the "deepseek" table
+from utils.intent_engine import IntentEngine, intent_engine
+
+@pytest.fixture
+def engine():
+    engine = IntentEngine()
+    engine.register("t", [
+        ("greeting", ["hi", "hello"]),
+        ("party", ["party", "party wear"]),
+        ("shirt", ["shirt"]),
+        ("budget", ["cheap*", "under"]),
+    ])
+    return engine
+
+def test_keywords_match_whole_words_only(engine):
+    assert engine.classify("t", "hi there") == "greeting"
+    assert engine.classify("t", "show me this shirt") == "shirt"
+    assert engine.classify("t", "this") is None
+
+def test_plural_matches_the_singular_keyword(engine):
+    assert engine.classify("t", "any shirts?") == "shirt"
+    assert engine.classify("t", "parties") is None
+
+def test_stem_keyword_matches_inflections(engine):
+    assert engine.classify("t", "something cheaper") == "budget"
+    assert engine.classify("t", "the cheapest one") == "budget"
+    assert engine.classify("t", "che") is None
+
+def test_digits_are_split_from_words(engine):
+    assert engine.classify("t", "under3000") == "budget"
+
+def test_every_intent_is_returned_by_priority(engine):
+    matches = engine.match("t", "cheap party wear shirt, hello")
+
+    assert [m.intent for m in matches] == ["greeting", "party", "shirt", "budget"]
+    assert matches[1].keyword == "party"
+
+def test_stem_needs_enough_letters():
+    with pytest.raises(ValueError):
+        IntentEngine().register("t", [("x", ["ab*"])])
+
+def test_reregistering_a_table_replaces_its_keywords(engine):
+    engine.register("t", [("shirt", ["shirt"])])
+
+    assert engine.classify("t", "hello") is None
+    assert engine.classify("t", "shirt") == "shirt"
+
+@pytest.mark.parametrize("message, intent", [
+    ("show me cheaper options", "budget"),
+    ("something affordable", "budget"),
+    ("what is the pricing", "budget"),
+    ("under3000 please", "budget"),
+    ("₹2000 max", "budget"),
+    ("I'm ordering now", "checkout"),
+    ("purchasing two", "checkout"),
+    ("we are getting married", "wedding"),
+    ("comfortable clothes", "casual"),
+    ("hi", "greeting"),
+    ("this shirt", "shirt"),
+])
+def test_deepseek_table_regressions(message, intent):
+    assert intent_engine.classify("deepseek", message) == intent
@@ -0,0 +1,34 @@
+# test_kv_cache_store.py - Cropped session caches release the memory they no longer cover
+import pytest
+
+from utils.kv_cache_store import SessionContext, SessionKVCache, crop_past, past_nbytes
+
+torch = pytest.importorskip("torch")
+
+def _past(layers=2, length=64):
+    return tuple((torch.zeros(1, 2, length, 8), torch.zeros(1, 2, length, 8)) for _ in range(layers))
+
+def test_cropped_past_owns_only_the_kept_positions():
+    past = _past(length=64)
+    cropped = crop_past(past, 16)
+
+    assert cropped[0][0].shape[-2] == 16
+    assert past_nbytes(cropped) == past_nbytes(past) // 4
+    assert all(t.untyped_storage().nbytes() == t.numel() * t.element_size() for layer in cropped for t in layer)
+
+def test_views_are_charged_for_their_whole_buffer():
+    past = _past(length=64)
+    view = tuple(tuple(t[..., :16, :] for t in layer) for layer in past)
+
+    assert past_nbytes(view) == past_nbytes(past)
+
+def test_memory_ceiling_sees_the_cropped_size():
+    cache = SessionKVCache(max_bytes=10 * 1024 * 1024)
+    context = SessionContext("s1")
+    context.exchanges.append(list(range(16)))
+    context.past = crop_past(_past(length=64), 16)
+    context.cached_length = 16
+    cache.put(context)
+
+    assert cache.stats()["bytes"] == context.measure()
+    assert past_nbytes(context.past) == 2 * 2 * 2 * 16 * 8 * 4
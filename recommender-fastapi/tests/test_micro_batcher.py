@@ -0,0 +1,137 @@
+# test_micro_batcher.py - Batching, the max-wait flush, error propagation and shutdown in MicroBatcher
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils.micro_batcher import MicroBatcher
+
+def _run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 5.0))
+
+def test_concurrent_items_share_one_batch_and_get_their_own_results():
+    calls = []
+
+    def double(items):
+        calls.append(list(items))
+        return [item * 2 for item in items]
+
+    async def scenario():
+        batcher = MicroBatcher(double, max_batch_size=8, max_wait_ms=50)
+        await batcher.start()
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+        await batcher.stop()
+        return results, batcher.stats()
+
+    results, stats = _run(scenario())
+
+    assert results == [0, 2, 4, 6, 8]
+    assert calls == [[0, 1, 2, 3, 4]]
+    assert stats["batches"] == 1 and stats["largest_batch"] == 5
+
+def test_batches_are_capped_at_max_batch_size():
+    sizes = []
+
+    def echo(items):
+        sizes.append(len(items))
+        return items
+
+    async def scenario():
+        batcher = MicroBatcher(echo, max_batch_size=2, max_wait_ms=50)
+        await batcher.start()
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+        await batcher.stop()
+        return results
+
+    assert _run(scenario()) == [0, 1, 2, 3, 4]
+    assert sizes == [2, 2, 1]
+
+def test_partial_batch_is_flushed_after_max_wait():
+    async def scenario():
+        batcher = MicroBatcher(lambda items: items, max_batch_size=32, max_wait_ms=30)
+        await batcher.start()
+        started = time.perf_counter()
+        result = await batcher.submit("only")
+        elapsed = time.perf_counter() - started
+        await batcher.stop()
+        return result, elapsed
+
+    result, elapsed = _run(scenario())
+
+    assert result == "only"
+    assert 0.025 <= elapsed < 0.5
+
+def test_batch_errors_reach_every_caller():
+    def broken(items):
+        raise ValueError("model crashed")
+
+    async def scenario():
+        batcher = MicroBatcher(broken, max_wait_ms=20)
+        await batcher.start()
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True)
+        # The collector survives a failed batch
+        batcher.batch_fn = lambda items: items
+        after = await batcher.submit("ok")
+        await batcher.stop()
+        return results, after
+
+    results, after = _run(scenario())
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert after == "ok"
+
+def test_lookup_hits_skip_the_queue():
+    async def scenario():
+        batcher = MicroBatcher(lambda items: ["model"] * len(items), lookup_fn=lambda item: "cached" if item == 1 else None)
+        await batcher.start()
+        results = [await batcher.submit(1), await batcher.submit(2)]
+        await batcher.stop()
+        return results, batcher.stats()
+
+    results, stats = _run(scenario())
+
+    assert results == ["cached", "model"]
+    assert stats["fast_path_hits"] == 1
+
+def test_stop_fails_items_still_being_collected():
+    async def scenario():
+        batcher = MicroBatcher(lambda items: items, max_batch_size=32, max_wait_ms=5000)
+        await batcher.start()
+        waiting = asyncio.ensure_future(batcher.submit("stuck"))
+        await asyncio.sleep(0.05)
+        await batcher.stop()
+        return await asyncio.gather(waiting, return_exceptions=True)
+
+    [result] = _run(scenario())
+
+    assert isinstance(result, RuntimeError)
+
+def test_stop_fails_the_running_batch_and_the_queue():
+    release = threading.Event()
+
+    def blocked(items):
+        release.wait(5.0)
+        return items
+
+    async def scenario():
+        batcher = MicroBatcher(blocked, max_batch_size=1, max_wait_ms=0)
+        await batcher.start()
+        waiting = [asyncio.ensure_future(batcher.submit(i)) for i in range(3)]
+        await asyncio.sleep(0.05)
+        await batcher.stop()
+        results = await asyncio.gather(*waiting, return_exceptions=True)
+        release.set()
+        return results
+
+    results = _run(scenario())
+
+    assert len(results) == 3
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+def test_submit_before_start_is_rejected():
+    async def scenario():
+        await MicroBatcher(lambda items: items).submit(1)
+
+    with pytest.raises(RuntimeError):
+        _run(scenario())
@@ -0,0 +1,89 @@
+# test_packed_dataset.py - Packed blocks keep conversations whole and apart, and train a causal LM
+import numpy as np
+import pytest
+
+from utils.packed_dataset import (
+    PackedConversationDataset, PackedDataCollator, isolate_packed_conversations, pack_spans
+)
+
+def _conversations():
+    rows = [[5, 6, 7, 1], [8, 9, 1], [10, 11, 12, 13, 14, 1], [15, 1], [16, 17, 18, 1]]
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(row) for row in rows], out=offsets[1:])
+    return np.array([token for row in rows for token in row], dtype=np.uint16), offsets
+
+def _tiny_gpt2():
+    transformers = pytest.importorskip("transformers")
+    config = transformers.GPT2Config(n_layer=2, n_embd=32, n_head=2, vocab_size=100, n_positions=64)
+    return transformers.GPT2LMHeadModel(config).eval()
+
+def test_pack_spans_keeps_conversations_whole():
+    _, offsets = _conversations()
+    blocks = pack_spans(offsets, block_size=8)
+
+    assert sorted(span for block in blocks for span in block) == list(zip(offsets[:-1], offsets[1:]))
+    assert all(sum(end - start for start, end in block) <= 8 for block in blocks)
+
+def test_packed_items_record_each_conversation_length():
+    tokens, offsets = _conversations()
+    dataset = PackedConversationDataset(tokens, offsets, block_size=8, pack=True)
+
+    assert len(dataset) < len(offsets) - 1
+    for i in range(len(dataset)):
+        item = dataset[i]
+        assert sum(item["segment_lengths"]) == len(item["input_ids"]) <= 8
+
+def test_packed_conversation_gets_no_attention_from_the_next():
+    torch = pytest.importorskip("torch")
+    model = _tiny_gpt2()
+    assert isolate_packed_conversations(model)
+    first, second = [5, 6, 7, 1], [8, 9, 10, 1]
+    batch = PackedDataCollator(pad_token_id=1)([
+        {"input_ids": np.array(first + second), "segment_lengths": [len(first), len(second)]},
+        {"input_ids": np.array([11, 12, 1]), "segment_lengths": [3]},
+    ])
+
+    with torch.no_grad():
+        packed = model(**batch, output_attentions=True)
+        alone = model(input_ids=torch.tensor([second]))
+
+    # Tokens of the second conversation put exactly zero weight on the first
+    for attention in packed.attentions:
+        assert torch.all(attention[0, :, len(first):len(first) + len(second), :len(first)] == 0)
+    # ...so they see what they would see with the conversation on its own
+    assert torch.allclose(packed.logits[0, len(first):len(first) + len(second)], alone.logits[0], atol=1e-5)
+
+def test_segment_ids_need_an_isolating_model():
+    pytest.importorskip("torch")
+    tokens, offsets = _conversations()
+    dataset = PackedConversationDataset(tokens, offsets, block_size=8, pack=True)
+    batch = PackedDataCollator(pad_token_id=1)([dataset[i] for i in range(len(dataset))])
+
+    assert "segment_ids" in batch
+    with pytest.raises(TypeError):
+        _tiny_gpt2()(**batch)
+
+def test_trainer_step_accepts_the_collator(tmp_path):
+    transformers = pytest.importorskip("transformers")
+    pytest.importorskip("torch")
+    tokens, offsets = _conversations()
+    model = _tiny_gpt2()
+    assert isolate_packed_conversations(model)
+    args = transformers.TrainingArguments(
+        output_dir=str(tmp_path),
+        max_steps=1,
+        per_device_train_batch_size=2,
+        remove_unused_columns=False,
+        report_to=[],
+        use_cpu=True,
+    )
+    trainer = transformers.Trainer(
+        model=model,
+        args=args,
+        train_dataset=PackedConversationDataset(tokens, offsets, block_size=8, pack=True),
+        data_collator=PackedDataCollator(pad_token_id=1),
+    )
+    result = trainer.train()
+
+    assert result.global_step == 1
+    assert np.isfinite(result.training_loss)
@@ -0,0 +1,86 @@
+# test_query_cache.py - Memory budget, TTL and key normalization of the query embedding cache
+import numpy as np
+import pytest
+
+from utils import query_cache
+from utils.embeddings import EmbeddingEngine
+from utils.query_cache import QueryEmbeddingCache, normalize_query
+
+def _vector(value, dim=64):
+    return np.full(dim, value, dtype=np.float32)
+
+def _entry_size(key, dim=64):
+    return QueryEmbeddingCache._entry_bytes(key, _vector(0.0, dim))
+
+def test_byte_budget_evicts_least_recently_used():
+    cache = QueryEmbeddingCache(max_bytes=3 * _entry_size("q0"))
+    for i in range(3):
+        cache.put(f"q{i}", _vector(i))
+    cache.get("q0")
+
+    cache.put("q3", _vector(3))
+
+    assert cache.get("q1") is None
+    assert [cache.get(key)[0] for key in ("q0", "q2", "q3")] == [0, 2, 3]
+    assert cache.evictions == 1
+    assert cache.current_bytes <= cache.max_bytes
+
+def test_replacing_a_key_does_not_double_count_bytes():
+    cache = QueryEmbeddingCache(max_bytes=10 * _entry_size("q"))
+    cache.put("q", _vector(1))
+    size = cache.current_bytes
+
+    cache.put("q", _vector(2))
+
+    assert cache.current_bytes == size
+    assert cache.get("q")[0] == 2
+
+def test_entry_larger_than_the_budget_is_not_stored():
+    cache = QueryEmbeddingCache(max_bytes=_entry_size("q") - 1)
+
+    returned = cache.put("q", _vector(1))
+
+    assert returned[0] == 1
+    assert cache.stats()["entries"] == 0 and cache.current_bytes == 0
+
+def test_cached_vectors_are_read_only_copies():
+    cache = QueryEmbeddingCache()
+    original = _vector(1)
+    cache.put("q", original)
+    original[:] = 5
+
+    stored = cache.get("q")
+
+    assert stored[0] == 1
+    with pytest.raises(ValueError):
+        stored[0] = 2
+
+def test_entries_expire_after_the_ttl(clock, monkeypatch):
+    monkeypatch.setattr(query_cache, "time", clock)
+    cache = QueryEmbeddingCache(ttl_seconds=60)
+    cache.put("q", _vector(1))
+
+    clock.advance(59)
+    assert cache.get("q") is not None
+    clock.advance(2)
+    assert cache.get("q") is None
+
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"], stats["expirations"]) == (0, 0, 1)
+
+def test_normalize_query_collapses_case_and_whitespace():
+    assert normalize_query("  Linen\tSHIRT \n for  summer ") == "linen shirt for summer"
+
+def test_engine_serves_equivalent_queries_from_one_entry(embedding_model):
+    engine = EmbeddingEngine(model_name=embedding_model)
+    model = engine.model
+
+    first = engine.encode("Linen Shirt")
+    calls = model.calls
+    again = engine.encode("  linen   SHIRT ")
+    batch = engine.encode_batch(["LINEN shirt", "linen shirt", "wool coat"])
+
+    assert model.calls == calls + 1
+    assert np.array_equal(first, again)
+    assert np.array_equal(batch[0], first) and np.array_equal(batch[1], first)
+    assert engine.query_cache.stats()["entries"] == 2
@@ -0,0 +1,151 @@
+# test_recommender_model.py - Incremental catalog updates and compaction in RecommenderModel
+import json
+import threading
+
+import numpy as np
+import pytest
+
+from models.recommender_model import RecommenderModel
+
+def _product(product_id, name, category="shirts", price=1000):
+    return {"_id": product_id, "name": name, "description": f"{name} {category}", "category": category, "price": price}
+
+def _model(tmp_path, embedding_model, products, **kwargs):
+    path = tmp_path / "products.json"
+    path.write_text(json.dumps(products))
+    return RecommenderModel(str(path), engine_options={"model_name": embedding_model}, **kwargs)
+
+def _ids(model):
+    return sorted(p["_id"] for p in model.products)
+
+def test_products_without_a_unique_id_are_rejected(tmp_path, embedding_model):
+    model = _model(tmp_path, embedding_model, [_product(1, "linen shirt")])
+
+    with pytest.raises(ValueError):
+        model.upsert_products([{"name": "noid1"}, {"name": "noid2"}])
+    with pytest.raises(ValueError):
+        model.upsert_products([_product(2, "denim"), _product(2, "denim again")])
+    with pytest.raises(ValueError):
+        model.upsert_products([_product("", "blank")])
+    assert _ids(model) == [1]
+
+def test_catalog_file_keeps_one_deletable_row_per_id(tmp_path, embedding_model):
+    model = _model(tmp_path, embedding_model, [
+        _product(1, "old shirt"), _product(2, "jeans"), _product(1, "new shirt"), {"name": "no id"},
+    ])
+
+    assert _ids(model) == [1, 2]
+    assert [p["name"] for p in model.products if p["_id"] == 1] == ["new shirt"]
+    assert model.delete_products([1]) == 1
+    assert _ids(model) == [2]
+
+def test_upsert_replaces_by_id_and_delete_removes(tmp_path, embedding_model):
+    model = _model(tmp_path, embedding_model, [_product(i, f"item{i}") for i in range(4)])
+
+    assert model.upsert_products([_product(1, "silk saree", "sarees"), _product(9, "wool coat", "coats")]) == 2
+    assert _ids(model) == [0, 1, 2, 3, 9]
+    assert model.recommend("silk saree", top_k=1)[0]["id"] == 1
+    assert model.delete_products([9, 42]) == 1
+    assert _ids(model) == [0, 1, 2, 3]
+
+def test_compaction_lets_writes_through_and_keeps_them(tmp_path, embedding_model):
+    model = _model(tmp_path, embedding_model, [_product(i, f"item{i}") for i in range(8)])
+    build_index = model.engine.create_index
+    during = {}
+
+    def create_index(embeddings):
+        # Another writer arrives while the compacted index is being built
+        writer = threading.Thread(target=lambda: (
+            model.upsert_products([_product(100, "velvet blazer", "blazers")]),
+            model.delete_products([7]),
+        ))
+        writer.start()
+        writer.join(timeout=2.0)
+        during["blocked"] = writer.is_alive()
+        return build_index(embeddings)
+
+    model.engine.create_index = create_index
+    model.delete_products([0, 1, 2, 3])
+
+    assert during["blocked"] is False
+    # Compacted to the 4 rows alive at the snapshot plus the insert; the later delete is a tombstone
+    assert (model._state.size, model._state.live_count) == (5, 4)
+    assert _ids(model) == [4, 5, 6, 100]
+    assert model.recommend("velvet blazer", top_k=1)[0]["id"] == 100
+    assert model.delete_products([100]) == 1
+    assert _ids(model) == [4, 5, 6]
+
+def test_ivf_pending_rows_trigger_a_rebuild(tmp_path, embedding_model):
+    model = _model(
+        tmp_path, embedding_model, [_product(i, f"item{i}") for i in range(40)],
+        index_backend="ivf", index_params={"nlist": 4, "nprobe": 4, "max_pending_ratio": 0.25},
+    )
+
+    for i in range(40, 200):
+        model.upsert_products([_product(i, f"item{i}")])
+        index = model._state.index
+        assert len(index._pending[0]) <= index.built_rows * 0.25
+
+    assert model._state.index.built_rows > 40
+    assert len(model.products) == 200
+    assert np.all(model._state.alive)
+
+def test_tombstones_alone_never_fall_back_to_an_exact_scan(tmp_path, embedding_model):
+    model = _model(
+        tmp_path, embedding_model, [_product(i, f"item{i}", "shirts" if i % 2 else "jeans") for i in range(64)],
+        index_backend="ivf", index_params={"nlist": 8, "nprobe": 1},
+    )
+    model.delete_products([0])
+    state = model._state
+    query = model.engine.encode("item3 shirts")
+    rows, scores = model.engine.search(query, state.embeddings, state.index)[0]
+    few_rows, few_scores = rows[:2], scores[:2]
+
+    unfiltered = model._select(state, query, few_rows, few_scores, state.alive, top_k=10)
+    mask = state.alive & state.category_mask("shirts")
+    filtered = model._select(state, query, few_rows, few_scores, mask, top_k=10, filtered=True)
+
+    assert set(unfiltered.tolist()) <= set(few_rows.tolist())
+    assert len(filtered) == 10
+    assert all(state.products[row]["category"] == "shirts" for row in filtered)
+
+def _brute_force_top_k(scores, candidates, top_k):
+    candidates = np.arange(len(scores)) if candidates is None else candidates
+    order = np.argsort(-scores[candidates], kind="stable")
+    return candidates[order[:max(top_k, 0)]]
+
+@pytest.mark.parametrize("n, top_k", [(50, 5), (50, 1), (50, 49), (50, 50), (50, 80), (1, 3), (0, 5), (50, 0)])
+@pytest.mark.parametrize("ties", [False, True])
+@pytest.mark.parametrize("filtered", [False, True])
+def test_partial_top_k_matches_a_full_sort(n, top_k, ties, filtered):
+    rng = np.random.default_rng(n * 100 + top_k)
+    scores = rng.standard_normal(n).astype(np.float32)
+    if ties:
+        # Few distinct values, so the k-th score is shared across the cut
+        scores = np.round(scores * 2) / 2
+    candidates = np.flatnonzero(rng.random(n) < 0.6) if filtered else None
+
+    selected = RecommenderModel._top_k_indices(scores, candidates, top_k)
+
+    assert selected.tolist() == _brute_force_top_k(scores, candidates, top_k).tolist()
+
+def test_filtered_recommendations_match_a_full_sort(tmp_path, embedding_model):
+    categories = ["shirts", "jeans", "sarees"]
+    products = [
+        _product(i, f"item{i % 7} cotton", categories[i % 3], price=500 + (i * 37) % 2000)
+        for i in range(90)
+    ]
+    model = _model(tmp_path, embedding_model, products)
+    model.delete_products([3, 30, 33])
+    filters = {"category": "shirts", "min_price": 800, "max_price": 2200}
+
+    results = model.recommend("item3 cotton shirts", top_k=8, filters=filters)
+
+    state = model._state
+    scores = state.embeddings @ model.engine.normalize(model.engine.encode("item3 cotton shirts"))
+    keep = [
+        row for row, p in enumerate(state.products)
+        if state.alive[row] and p["category"] == "shirts" and 800 <= p["price"] <= 2200
+    ]
+    expected = _brute_force_top_k(scores, np.array(keep), 8)
+    assert [r["id"] for r in results] == [state.products[row]["_id"] for row in expected]
@@ -0,0 +1,53 @@
+# test_sales_agent.py - Product ranking and its bounded embedding cache in AISalesAgent
+import pytest
+
+from conftest import HashingEncoder
+from models.sales_agent import AISalesAgent
+from utils import model_registry
+
+@pytest.fixture
+def encoder(monkeypatch):
+    encoder = HashingEncoder()
+    monkeypatch.setitem(model_registry._models, "sentence-transformers/all-MiniLM-L6-v2", encoder)
+    return encoder
+
+def _products(n):
+    return [{"_id": i, "name": f"item{i}", "category": "shirts", "description": "cotton"} for i in range(n)]
+
+def test_rank_products_orders_by_relevance(encoder):
+    agent = AISalesAgent(api_url="http://127.0.0.1:9")
+    products = _products(5)
+
+    ranked = agent.rank_products("item3", products, with_scores=True)
+
+    assert ranked[0][0]["_id"] == 3
+    assert [score for _, score in ranked] == sorted((score for _, score in ranked), reverse=True)
+    agent.client.close()
+
+def test_known_products_are_not_re_encoded_unless_edited(encoder, monkeypatch):
+    agent = AISalesAgent(api_url="http://127.0.0.1:9")
+    products = _products(5)
+    batches = []
+    encode = encoder.encode
+    monkeypatch.setattr(encoder, "encode", lambda texts, **kwargs: batches.append(len(texts)) or encode(texts, **kwargs))
+
+    first = agent.rank_products("item3", products)
+    products[1] = dict(products[1], description="linen")
+    second = agent.rank_products("item3", products)
+
+    # Every product + query, then only the edited product + query
+    assert batches == [6, 2]
+    assert [p["_id"] for p in first] == [p["_id"] for p in second]
+    agent.client.close()
+
+def test_embedding_cache_stays_within_its_budget(encoder, monkeypatch):
+    monkeypatch.setenv("QUERY_CACHE_MB", "0.01")
+    agent = AISalesAgent(api_url="http://127.0.0.1:9")
+
+    for start in range(0, 400, 50):
+        agent.rank_products("cotton", _products(400)[start:start + 50])
+
+    stats = agent._embedding_cache.stats()
+    assert stats["bytes"] <= stats["max_bytes"] == int(0.01 * 1024 * 1024)
+    assert stats["evictions"] > 0
+    agent.client.close()
@@ -0,0 +1,76 @@
+# test_session_store.py - Turn cap, idle expiry and the memory ceiling of SessionStore
+from utils import session_store
+from utils.session_store import DEFAULT_SESSION_ID, SessionStore
+
+def test_turns_are_capped_and_bytes_track_what_is_kept():
+    store = SessionStore(max_turns=3)
+    session = store.get("s")
+    empty_bytes = store.current_bytes
+
+    for i in range(5):
+        session.add_turn("user" if i % 2 == 0 else "assistant", f"turn {i}")
+
+    assert [turn["content"] for turn in session.history()] == ["turn 2", "turn 3", "turn 4"]
+    assert session.history()[0]["role"] == "user"
+    assert session.message_count == 3
+    kept = sum(SessionStore._turn_bytes(f"turn {i}") for i in range(2, 5))
+    assert store.current_bytes == empty_bytes + kept == session.nbytes
+
+def test_idle_sessions_expire(clock, monkeypatch):
+    monkeypatch.setattr(session_store, "time", clock)
+    store = SessionStore(idle_ttl_seconds=60)
+    store.get("old").add_turn("user", "hello")
+    clock.advance(30)
+    store.get("recent")
+
+    clock.advance(40)
+    store.get("new")
+
+    assert store.peek("old") is None
+    assert store.peek("recent") is not None
+    assert store.stats()["idle_evictions"] == 1
+
+def test_using_a_session_keeps_it_alive(clock, monkeypatch):
+    monkeypatch.setattr(session_store, "time", clock)
+    store = SessionStore(idle_ttl_seconds=60)
+    store.get("s").add_turn("user", "hi")
+
+    for _ in range(3):
+        clock.advance(50)
+        store.get("s")
+
+    assert store.peek("s").history() == [{"role": "user", "content": "hi"}]
+
+def test_byte_ceiling_evicts_least_recently_used_sessions():
+    store = SessionStore(max_bytes=3 * session_store._SESSION_OVERHEAD_BYTES)
+    for session_id in ("a", "b", "c"):
+        store.get(session_id)
+    store.get("a")
+
+    store.get("d")
+
+    assert store.peek("b") is None
+    assert all(store.peek(session_id) is not None for session_id in ("a", "c", "d"))
+    assert store.stats()["lru_evictions"] == 1
+    assert store.current_bytes <= store.max_bytes
+
+def test_growing_session_evicts_others_but_never_itself():
+    store = SessionStore(max_turns=50, max_bytes=3 * session_store._SESSION_OVERHEAD_BYTES)
+    store.get("idle")
+    talker = store.get("talker")
+
+    for _ in range(20):
+        talker.add_turn("user", "x" * 100)
+
+    assert store.peek("idle") is None
+    assert store.peek("talker") is talker
+    assert len(talker.history()) == 20
+
+def test_cleared_session_stops_counting():
+    store = SessionStore()
+    store.get().add_turn("user", "hello")
+
+    store.clear(DEFAULT_SESSION_ID)
+
+    assert store.current_bytes == 0
+    assert store.get().history() == []
@@ -0,0 +1,73 @@
+# test_trained_agent.py - Loading the trained agent singleton once, and backing off after failures
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+import models.trained_agent as trained_agent
+
+@pytest.fixture
+def loader(monkeypatch):
+    """get_trained_agent with a stand-in model class and reply index; yields the call log"""
+    calls = {"loads": 0, "indexes": 0, "fail": False}
+
+    class StandInAgent:
+        def __init__(self, **kwargs):
+            calls["loads"] += 1
+            time.sleep(0.05)
+            if calls["fail"]:
+                raise OSError("no model files")
+            self.reply_index = kwargs.get("reply_index")
+
+    def reply_index():
+        calls["indexes"] += 1
+        return "index"
+
+    profile = types.SimpleNamespace(from_env=lambda: None)
+    monkeypatch.setitem(sys.modules, "models.cpu_profile", types.SimpleNamespace(CPUInferenceProfile=profile))
+    monkeypatch.setattr(trained_agent, "TrainedSalesAgent", StandInAgent)
+    monkeypatch.setattr(trained_agent, "_reply_index_from_env", reply_index)
+    monkeypatch.setattr(trained_agent, "_reply_index", None)
+    monkeypatch.setattr(trained_agent, "_reply_index_built", False)
+    monkeypatch.setattr(trained_agent, "_kv_cache_from_env", lambda: None)
+    monkeypatch.setattr(trained_agent, "_agent", None)
+    monkeypatch.setattr(trained_agent, "_load_failed_at", None)
+    yield calls
+
+def test_concurrent_first_calls_load_one_agent(loader):
+    agents = []
+    threads = [threading.Thread(target=lambda: agents.append(trained_agent.get_trained_agent())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert loader["loads"] == 1
+    assert loader["indexes"] == 1
+    assert len({id(agent) for agent in agents}) == 1
+    assert agents[0].reply_index == "index"
+
+def test_failed_load_is_not_retried_until_the_backoff_passes(loader, monkeypatch):
+    loader["fail"] = True
+    monkeypatch.setenv("TRAINED_LOAD_RETRY_SECONDS", "60")
+
+    assert trained_agent.get_trained_agent() is None
+    assert trained_agent.get_trained_agent() is None
+    assert loader["loads"] == 1
+    # No model, no embedding pass over the reply corpus
+    assert loader["indexes"] == 0
+
+    loader["fail"] = False
+    monkeypatch.setattr(trained_agent, "_load_failed_at", time.monotonic() - 61)
+    assert trained_agent.get_trained_agent() is not None
+    assert loader["loads"] == 2
+
+def test_disabled_reply_index_is_not_rebuilt(loader, monkeypatch):
+    builds = []
+    monkeypatch.setattr(trained_agent, "_reply_index_from_env", lambda: builds.append(1))
+
+    assert trained_agent.get_reply_index() is None
+    assert trained_agent.get_reply_index() is None
+    assert len(builds) == 1
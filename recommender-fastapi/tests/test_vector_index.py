@@ -0,0 +1,41 @@
+# test_vector_index.py - IVFIndex recall against ExactIndex at the default knobs
+import numpy as np
+
+from utils.vector_index import ExactIndex, IVFIndex
+
+def _clustered(rng, centers, count, noise):
+    vectors = centers[rng.integers(0, len(centers), count)] + noise * rng.normal(size=(count, centers.shape[1]))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+def _recall_at_k(index, queries, embeddings, k=10):
+    exact = ExactIndex(embeddings).search(queries, embeddings)
+    recalls, scanned = [], []
+    for (rows, scores), (_, exact_scores) in zip(index.search(queries, embeddings), exact):
+        truth = set(np.argsort(-exact_scores)[:k].tolist())
+        found = set(rows[np.argsort(-scores)[:k]].tolist())
+        recalls.append(len(truth & found) / k)
+        scanned.append(len(rows) / len(embeddings))
+    return float(np.mean(recalls)), float(np.mean(scanned))
+
+def test_ivf_defaults_recall_against_exact():
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(100, 64))
+    embeddings = _clustered(rng, centers, 10000, noise=1.5)
+    queries = _clustered(rng, centers, 200, noise=1.5)
+
+    recall, scanned = _recall_at_k(IVFIndex(embeddings), queries, embeddings)
+
+    assert recall >= 0.9
+    assert scanned <= 0.12
+
+def test_more_probes_raise_recall():
+    rng = np.random.default_rng(1)
+    centers = rng.normal(size=(100, 64))
+    embeddings = _clustered(rng, centers, 10000, noise=1.5)
+    queries = _clustered(rng, centers, 200, noise=1.5)
+
+    few, _ = _recall_at_k(IVFIndex(embeddings, nprobe=2), queries, embeddings)
+    many, _ = _recall_at_k(IVFIndex(embeddings, nprobe=32), queries, embeddings)
+
+    assert many > few
+    assert many >= 0.98
@@ -4,7 +4,6 @@ AI Sales Agent Model Training
 Trains a fine-tuned model for retail sales conversations using GPU acceleration
 """
 
-import torch
 import json
 import os
 import sys
@@ -16,21 +15,11 @@ if sys.platform == 'win32':
     sys.stdout.reconfigure(encoding='utf-8')
 
 from training_data import get_training_data
-from transformers import AutoTokenizer, AutoModelForCausalLM, TextDataset, DataCollatorForLanguageModeling
-from transformers import Trainer, TrainingArguments
 
 print("=" * 60)
 print("RETAIL GENIE - AI SALES AGENT TRAINER")
 print("=" * 60)
 
-# Check GPU availability
-print("\n[SYSTEM] Checking GPU availability...")
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-print(f"[OK] Device: {device}")
-if torch.cuda.is_available():
-    print(f"     GPU: {torch.cuda.get_device_name(0)}")
-    print(f"     VRAM: {torch.cuda.get_device_properties(0).total_memory / 1e9:.2f} GB")
-
 # Create training directory
 training_dir = Path("trained_models")
 training_dir.mkdir(exist_ok=True)
@@ -54,8 +43,24 @@ with open(train_file, "w", encoding="utf-8") as f:
 print(f"[OK] Training data saved: {train_file}")
 print(f"     Total conversations: {len(training_text)}")
 
+# torch and transformers are imported only once the training data is prepared
+import torch
+
+# Check GPU availability
+print("\n[SYSTEM] Checking GPU availability...")
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+print(f"[OK] Device: {device}")
+if torch.cuda.is_available():
+    print(f"     GPU: {torch.cuda.get_device_name(0)}")
+    print(f"     VRAM: {torch.cuda.get_device_properties(0).total_memory / 1e9:.2f} GB")
+
 # Load base model and tokenizer
 print("\n[MODEL] Loading base model...")
+from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import Trainer, TrainingArguments
+from utils.packed_dataset import (
+    PackedConversationDataset, PackedDataCollator, isolate_packed_conversations, load_or_tokenize
+)
 model_name = "distilgpt2"  # Small, fast, good for retail
 print(f"     Base model: {model_name}")
 print("     Note: DistilGPT2 is optimized for CPU/GPU and trains quickly")
@@ -81,16 +86,30 @@ print(f"[OK] Tokenizer configured with {len(tokenizer)} tokens")
 
 # Prepare dataset
 print("\n[TRAINING] Preparing dataset...")
-train_dataset = TextDataset(
-    tokenizer=tokenizer,
-    file_path=str(train_file),
-    block_size=128
+# Token ids are cached per (data, tokenizer) hash; whole conversations are packed into blocks
+block_size = int(os.getenv("TRAIN_BLOCK_SIZE", 128))
+tokens, offsets = load_or_tokenize(
+    training_text,
+    tokenizer,
+    cache_dir=training_dir / "token_cache",
+    workers=int(os.getenv("TRAIN_TOKENIZE_WORKERS", 0)) or None
 )
-
-data_collator = DataCollatorForLanguageModeling(
-    tokenizer=tokenizer,
-    mlm=False
+pack = os.getenv("TRAIN_PACK", "true").lower() == "true"
+# Packing is only safe when the model can keep packed conversations from attending to each other
+if pack and not isolate_packed_conversations(model):
+    print("[WARNING] Model can't isolate packed conversations - training one conversation per block")
+    pack = False
+train_dataset = PackedConversationDataset(
+    tokens,
+    offsets,
+    block_size=block_size,
+    pack=pack
 )
+dataset_stats = train_dataset.stats()
+print(f"[OK] {dataset_stats['blocks']} blocks of up to {block_size} tokens ({dataset_stats['fill_rate']:.0%} full)")
+
+# Pads each batch to its longest block; positions and attention restart at every packed conversation
+data_collator = PackedDataCollator(pad_token_id=tokenizer.eos_token_id)
 
 # Training arguments
 training_args = TrainingArguments(
@@ -106,6 +125,8 @@ training_args = TrainingArguments(
     no_cuda=not torch.cuda.is_available(),
     fp16=torch.cuda.is_available(),  # Mixed precision training for GPU
     gradient_accumulation_steps=2,
+    # The collator needs segment_lengths, which isn't a model argument
+    remove_unused_columns=False,
 )
 
 print(f"  Epochs: {training_args.num_train_epochs}")
@@ -150,7 +171,7 @@ try:
     with open(training_dir / "model_info.json", "w") as f:
         json.dump(model_info, f, indent=2)
     
-    print(f"[OK] Model info saved")
+    print("[OK] Model info saved")
     print(f"\n{'='*60}")
     print("TRAINING COMPLETE!")
     print(f"{'='*60}")
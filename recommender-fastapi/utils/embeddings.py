@@ -1,24 +1,91 @@
 # embeddings.py - Embedding utilities for product recommendations
-from sentence_transformers import SentenceTransformer
 import numpy as np
+from utils.index_cache import EmbeddingIndexCache
+from utils.instrumentation import span
+from utils.model_registry import get_embedding_model
+from utils.query_cache import QueryEmbeddingCache, normalize_query
+from utils.vector_index import create_vector_index
 
 class EmbeddingEngine:
     """Handles sentence embedding and similarity computations"""
     
-    def __init__(self, model_name="sentence-transformers/all-MiniLM-L6-v2"):
-        """Initialize the embedding model"""
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, model_name="sentence-transformers/all-MiniLM-L6-v2", cache_dir=None,
+                 index_backend="exact", index_params=None,
+                 query_cache_bytes=8 * 1024 * 1024, query_cache_ttl=None):
+        """
+        Initialize the embedding model
+
+        Args:
+            cache_dir: Enables the on-disk embedding index cache
+            index_backend: "exact" (brute force) or "ivf" (approximate)
+            index_params: Backend knobs, e.g. {"nlist": 256, "nprobe": 8} for ivf
+            query_cache_bytes: Memory budget of the query embedding LRU cache (0 disables)
+            query_cache_ttl: Optional max age in seconds of cached query embeddings
+        """
+        self.model_name = model_name
+        self.model = get_embedding_model(model_name)
         self.embeddings = None
         self.products = None
+        self.index = None
+        self.cache = EmbeddingIndexCache(cache_dir, model_name) if cache_dir else None
+        self.index_backend = index_backend
+        self.index_params = index_params or {}
+        self.query_cache = QueryEmbeddingCache(query_cache_bytes, query_cache_ttl) if query_cache_bytes else None
+    
+    @staticmethod
+    def product_text(product):
+        """Text that gets embedded for a product"""
+        return (str(product.get("name", "")) + " " + str(product.get("description", "")) + " " + str(product.get("category", ""))).strip()
     
     def build_index(self, products):
-        """Build embeddings for all products"""
+        """Build embeddings and the search index for all products"""
+        self._build_embeddings(products)
+        self.index = self.create_index(self.embeddings)
+    
+    def create_index(self, embeddings):
+        """Build the configured index backend over an embedding matrix"""
+        return create_vector_index(self.index_backend, embeddings, **self.index_params)
+    
+    def _build_embeddings(self, products):
+        """Compute (or load from cache) normalized embeddings for all products"""
         self.products = products
-        texts = [
-            (str(p.get("name", "")) + " " + str(p.get("description", "")) + " " + str(p.get("category", ""))).strip()
-            for p in products
-        ]
-        self.embeddings = self.model.encode(texts, convert_to_numpy=True)
+        texts = [self.product_text(p) for p in products]
+
+        if self.cache is None or not texts:
+            embeddings = self.model.encode(texts, convert_to_numpy=True)
+            # Normalize once so scoring is a plain dot product per query
+            self.embeddings = self.normalize(embeddings)
+            return
+
+        row_keys = [self.cache.row_key(text) for text in texts]
+        cached = self.cache.load(row_keys)
+        if cached is not None:
+            print(f"[OK] Loaded {len(row_keys)} product embeddings from cache")
+            self.embeddings = cached
+            return
+
+        # Reuse rows from the last saved matrix; encode only new or changed products
+        known = self.cache.known_rows()
+        missing = [i for i, key in enumerate(row_keys) if key not in known]
+        encoded = self.normalize(self.model.encode([texts[i] for i in missing], convert_to_numpy=True)) if missing else None
+        dim = encoded.shape[1] if encoded is not None else len(next(iter(known.values())))
+
+        matrix = np.empty((len(texts), dim), dtype=np.float32)
+        for i, key in enumerate(row_keys):
+            if key in known:
+                matrix[i] = known[key]
+        if missing:
+            matrix[missing] = encoded
+        print(f"[OK] Encoded {len(missing)} of {len(texts)} product embeddings (rest from cache)")
+
+        self.embeddings = self.cache.save(row_keys, matrix)
+    
+    @staticmethod
+    def normalize(vectors):
+        """L2-normalize vectors row-wise into a contiguous float32 array"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return np.ascontiguousarray(vectors / (norms + 1e-10), dtype=np.float32)
     
     def cosine_similarity(self, vec1, vec2):
         """Compute cosine similarity between two vectors"""
@@ -27,16 +94,81 @@ class EmbeddingEngine:
         norm2 = np.linalg.norm(vec2)
         return dot_product / (norm1 * norm2 + 1e-10)
     
-    def get_similarities(self, query_vec):
-        """Compute similarity scores for all products"""
-        if self.embeddings is None:
+    def get_similarities(self, query_vec, embeddings=None):
+        """
+        Compute similarity scores for all products
+
+        A single query vector returns shape (n_products,); a batch of
+        query vectors (n_queries, dim) returns a (n_queries, n_products) matrix.
+        Pass embeddings to score against a specific index snapshot.
+        """
+        if embeddings is None:
+            embeddings = self.embeddings
+        if embeddings is None:
             return []
-        similarities = []
-        for emb in self.embeddings:
-            sim = self.cosine_similarity(query_vec, emb)
-            similarities.append(sim)
-        return np.array(similarities)
+        queries = self.normalize(query_vec)
+        return queries @ embeddings.T
+    
+    def search(self, query_vecs, embeddings=None, index=None):
+        """
+        Search the index with one or more query vectors
+
+        Returns:
+            List of (rows, scores) per query; rows is None when scores cover every row
+        """
+        if embeddings is None:
+            embeddings = self.embeddings
+        if index is None:
+            index = self.index
+        queries = self.normalize(np.atleast_2d(query_vecs))
+        return index.search(queries, embeddings)
     
     def encode(self, text):
-        """Encode text into embedding vector"""
-        return self.model.encode([text], convert_to_numpy=True)[0]
+        """Encode text into embedding vector (served from the query cache when possible)"""
+        if self.query_cache is None:
+            with span("encode"):
+                return self.model.encode([text], convert_to_numpy=True)[0]
+
+        key = normalize_query(text)
+        vector = self.query_cache.get(key)
+        if vector is None:
+            with span("encode"):
+                vector = self.query_cache.put(key, self.model.encode([key], convert_to_numpy=True)[0])
+        return vector
+    
+    def encode_products(self, products):
+        """Encode and normalize product texts without touching the index"""
+        return self.normalize(self.model.encode([self.product_text(p) for p in products], convert_to_numpy=True))
+    
+    def cached(self, text):
+        """Cached embedding for a query, or None (no model call)"""
+        if self.query_cache is None:
+            return None
+        return self.query_cache.get(normalize_query(text))
+    
+    def encode_batch(self, texts, lookup=True):
+        """
+        Encode many texts in one forward pass, skipping cached queries
+
+        With lookup=False the cache is only filled, not consulted - for callers
+        that already checked it via cached().
+        """
+        texts = list(texts)
+        if self.query_cache is None or not texts:
+            with span("encode"):
+                return self.model.encode(texts, convert_to_numpy=True)
+
+        keys = [normalize_query(text) for text in texts]
+        vectors = {}
+        for key in keys:
+            if key not in vectors:
+                vectors[key] = self.query_cache.get(key) if lookup else None
+
+        missing = [key for key, vector in vectors.items() if vector is None]
+        if missing:
+            with span("encode"):
+                encoded = self.model.encode(missing, convert_to_numpy=True)
+            for key, vector in zip(missing, encoded):
+                vectors[key] = self.query_cache.put(key, vector)
+
+        return np.stack([vectors[key] for key in keys])
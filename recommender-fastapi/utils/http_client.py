@@ -0,0 +1,270 @@
+# http_client.py - Pooled, deadline-aware JSON client with a circuit breaker
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.instrumentation import current_request_id
+
+try:
+    import httpx
+    HAS_HTTPX = True
+except ImportError:
+    HAS_HTTPX = False
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+class CircuitOpen(RuntimeError):
+    """Raised instead of calling an upstream that is known to be failing"""
+
+class UpstreamError(RuntimeError):
+    """Upstream answered with an error status"""
+
+    def __init__(self, status_code):
+        super().__init__(f"Upstream returned HTTP {status_code}")
+        self.status_code = status_code
+
+class CircuitBreaker:
+    """
+    Fails fast after repeated upstream failures
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    are rejected without touching the network. Once reset_timeout seconds
+    have passed it goes half-open and lets a single probe through: success
+    closes the circuit, failure opens it for another reset_timeout.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = float(reset_timeout)
+        self.state = CLOSED
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.failures = 0
+        self.successes = 0
+        self.short_circuits = 0
+        self.opens = 0
+
+    def allow(self):
+        """Whether a call may go out now (claims the probe slot when half-open)"""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.short_circuits += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.successes += 1
+            self._consecutive_failures = 0
+            self._probe_in_flight = False
+            self.state = CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._consecutive_failures += 1
+            probe_failed = self.state == HALF_OPEN
+            self._probe_in_flight = False
+            if probe_failed or self._consecutive_failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.opens += 1
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """Give back a probe slot without a verdict (e.g. a non-retryable 4xx)"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout": self.reset_timeout,
+                "consecutive_failures": self._consecutive_failures,
+                "failures": self.failures,
+                "successes": self.successes,
+                "short_circuits": self.short_circuits,
+                "opens": self.opens,
+            }
+
+class PooledJSONClient:
+    """
+    Keep-alive JSON POST client for one upstream endpoint
+
+    Connections are pooled (requests.Session for threads, httpx.AsyncClient
+    for the event loop when httpx is installed), so repeated calls skip the
+    TCP/TLS handshake. Every call has a deadline budget enforced end to end
+    and raises TimeoutError once it is spent, however slowly the upstream
+    trickles its reply. Timeouts, connection errors, 429 and 5xx count as
+    breaker failures.
+    """
+
+    def __init__(self, url, headers=None, deadline=4.0, connect_timeout=1.0,
+                 max_connections=20, breaker=None):
+        self.url = url
+        self.headers = dict(headers or {})
+        self.deadline = deadline
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self.breaker = breaker or CircuitBreaker()
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections, max_retries=0)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        # Sync calls run here so the caller can stop waiting at the deadline
+        self._sync_pool = ThreadPoolExecutor(max_connections, thread_name_prefix="http-client")
+        self._async_client = None
+
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.timeouts = 0
+        self.total_seconds = 0.0
+
+    def _request_headers(self):
+        headers = dict(self.headers)
+        request_id = current_request_id()
+        if request_id:
+            headers["X-Request-ID"] = request_id
+        return headers
+
+    @staticmethod
+    def _is_failure_status(status_code):
+        return status_code == 429 or status_code >= 500
+
+    def _record(self, started, timed_out=False):
+        with self._lock:
+            self.calls += 1
+            self.total_seconds += time.perf_counter() - started
+            if timed_out:
+                self.timeouts += 1
+
+    def _finish(self, status_code):
+        """Breaker bookkeeping for an answered call; raises on error statuses"""
+        if status_code < 400:
+            self.breaker.record_success()
+            return
+        if self._is_failure_status(status_code):
+            self.breaker.record_failure()
+        else:
+            self.breaker.release()
+        raise UpstreamError(status_code)
+
+    def _post(self, payload, headers, budget, deadline_at):
+        """(status, raw body) of one POST; gives up reading once deadline_at passes"""
+        with self._session.post(
+            self.url,
+            json=payload,
+            headers=headers,
+            timeout=(min(self.connect_timeout, budget), budget),
+            stream=True,
+        ) as response:
+            body = bytearray()
+            for chunk in response.iter_content(chunk_size=16384):
+                body.extend(chunk)
+                if time.perf_counter() > deadline_at:
+                    # Abandoned by the caller already; free the worker and connection
+                    raise requests.Timeout(f"{self.url} exceeded {budget:.2f}s deadline")
+            return response.status_code, bytes(body)
+
+    def post_json(self, payload, deadline=None):
+        """POST payload and return the decoded JSON body (blocking, within the deadline budget)"""
+        if not self.breaker.allow():
+            raise CircuitOpen(self.url)
+
+        budget = self.deadline if deadline is None else deadline
+        started = time.perf_counter()
+        try:
+            future = self._sync_pool.submit(self._post, payload, self._request_headers(), budget, started + budget)
+            status_code, body = future.result(timeout=budget)
+        except (FutureTimeout, requests.Timeout):
+            self.breaker.record_failure()
+            self._record(started, timed_out=True)
+            raise TimeoutError(f"{self.url} exceeded {budget:.2f}s deadline")
+        except Exception:
+            self.breaker.record_failure()
+            self._record(started)
+            raise
+
+        self._record(started)
+        self._finish(status_code)
+        return json.loads(body)
+
+    def _get_async_client(self):
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                timeout=httpx.Timeout(self.deadline, connect=self.connect_timeout),
+            )
+        return self._async_client
+
+    async def apost_json(self, payload, deadline=None):
+        """POST payload from async code within the deadline budget"""
+        if not HAS_HTTPX:
+            # No async client available - run the pooled sync client on a thread
+            return await asyncio.to_thread(self.post_json, payload, deadline)
+
+        if not self.breaker.allow():
+            raise CircuitOpen(self.url)
+
+        budget = self.deadline if deadline is None else deadline
+        started = time.perf_counter()
+        # Building the client on first use (SSL context) spends the same budget
+        client = self._get_async_client()
+        try:
+            response = await asyncio.wait_for(
+                client.post(self.url, json=payload, headers=self._request_headers()),
+                timeout=budget - (time.perf_counter() - started),
+            )
+        except (asyncio.TimeoutError, httpx.TimeoutException):
+            self.breaker.record_failure()
+            self._record(started, timed_out=True)
+            raise TimeoutError(f"{self.url} exceeded {budget:.2f}s deadline")
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            self._record(started)
+            raise
+
+        self._record(started)
+        self._finish(response.status_code)
+        return response.json()
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    def close(self):
+        self._sync_pool.shutdown(wait=False)
+        self._session.close()
+
+    def stats(self):
+        """Call counts, timeouts, average latency and breaker state"""
+        with self._lock:
+            stats = {
+                "url": self.url,
+                "deadline": self.deadline,
+                "calls": self.calls,
+                "timeouts": self.timeouts,
+                "avg_ms": round(self.total_seconds / self.calls * 1000.0, 3) if self.calls else 0.0,
+            }
+        stats["breaker"] = self.breaker.stats()
+        return stats
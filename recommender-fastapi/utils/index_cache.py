@@ -0,0 +1,124 @@
+# index_cache.py - Persistent on-disk cache for product embedding matrices
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+import numpy as np
+
+# Files this recent may belong to another worker's save in progress; never pruned
+PRUNE_GRACE_SECONDS = 60
+
+class EmbeddingIndexCache:
+    """
+    Stores embedding matrices as memory-mappable .npy files
+
+    Each row is keyed by a hash of the model name and the product text, and
+    each matrix file by the hash of its ordered row keys. Workers that see the
+    same catalog map the same file read-only, so the OS page cache holds one copy.
+    Each save keeps its matrix and the one it superseded; older ones are deleted.
+    """
+
+    def __init__(self, cache_dir, model_name):
+        self.model_name = model_name
+        model_key = hashlib.sha1(model_name.encode("utf-8")).hexdigest()[:16]
+        self.cache_dir = Path(cache_dir) / model_key
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def row_key(self, text):
+        """Hash of model name + product text identifying one embedding row"""
+        return hashlib.sha1(f"{self.model_name}\x00{text}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def catalog_key(row_keys):
+        """Hash of the ordered row keys identifying one matrix file"""
+        return hashlib.sha1("\n".join(row_keys).encode("utf-8")).hexdigest()
+
+    def _paths(self, catalog_key):
+        return self.cache_dir / f"{catalog_key}.npy", self.cache_dir / f"{catalog_key}.keys.json"
+
+    def load(self, row_keys):
+        """Memory-map the cached matrix for exactly these rows, or return None"""
+        matrix_path, _ = self._paths(self.catalog_key(row_keys))
+        if not matrix_path.exists():
+            return None
+        try:
+            matrix = np.load(matrix_path, mmap_mode="r")
+        except Exception as e:
+            print(f"[WARNING] Ignoring unreadable embedding cache {matrix_path.name}: {e}")
+            return None
+        if matrix.shape[0] != len(row_keys):
+            return None
+        return matrix
+
+    def _latest_key(self):
+        """Catalog key of the most recently saved matrix, or None"""
+        try:
+            with open(self.cache_dir / "latest.json", "r") as f:
+                return json.load(f)["catalog_key"]
+        except Exception:
+            return None
+
+    def known_rows(self):
+        """Map row key -> embedding vector from the most recently saved matrix"""
+        catalog_key = self._latest_key()
+        if catalog_key is None:
+            return {}
+        try:
+            matrix_path, keys_path = self._paths(catalog_key)
+            with open(keys_path, "r") as f:
+                row_keys = json.load(f)
+            matrix = np.load(matrix_path, mmap_mode="r")
+        except Exception:
+            return {}
+        return {key: matrix[i] for i, key in enumerate(row_keys) if i < matrix.shape[0]}
+
+    def save(self, row_keys, matrix):
+        """Write the matrix atomically and return a read-only memory map of it"""
+        catalog_key = self.catalog_key(row_keys)
+        matrix_path, keys_path = self._paths(catalog_key)
+        previous_key = self._latest_key()
+
+        # Write to temp files and rename so concurrent workers never see partial files
+        suffix = f".{os.getpid()}.tmp"
+        tmp_keys = keys_path.with_name(keys_path.name + suffix)
+        with open(tmp_keys, "w") as f:
+            json.dump(list(row_keys), f)
+        os.replace(tmp_keys, keys_path)
+
+        tmp_matrix = matrix_path.with_name(matrix_path.name + suffix)
+        with open(tmp_matrix, "wb") as f:
+            np.save(f, np.ascontiguousarray(matrix, dtype=np.float32))
+        os.replace(tmp_matrix, matrix_path)
+
+        tmp_latest = self.cache_dir / f"latest.json{suffix}"
+        with open(tmp_latest, "w") as f:
+            json.dump({"catalog_key": catalog_key}, f)
+        os.replace(tmp_latest, self.cache_dir / "latest.json")
+
+        matrix = np.load(matrix_path, mmap_mode="r")
+        # Workers still running on the previous catalog may have it mapped
+        self.prune(keep=(catalog_key, previous_key))
+        return matrix
+
+    def prune(self, keep):
+        """Delete matrices (and their key lists) other than the catalog keys in keep; returns files removed"""
+        keep = {key for key in keep if key}
+        cutoff = time.time() - PRUNE_GRACE_SECONDS
+        removed = 0
+        for path in self.cache_dir.iterdir():
+            if path.name.endswith(".keys.json"):
+                catalog_key = path.name[:-len(".keys.json")]
+            elif path.suffix == ".npy":
+                catalog_key = path.stem
+            else:
+                continue
+            try:
+                if catalog_key in keep or path.stat().st_mtime > cutoff:
+                    continue
+                path.unlink()
+                removed += 1
+            except OSError:
+                # Already removed by another worker, or still open on a platform that forbids it
+                continue
+        return removed
@@ -0,0 +1,97 @@
+# inference_executor.py - Sized, bounded executor for CPU-bound inference
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+
+class ExecutorSaturated(RuntimeError):
+    """Raised when the inference queue is full; callers should back off"""
+
+    def __init__(self, retry_after):
+        super().__init__("Inference queue is full")
+        self.retry_after = retry_after
+
+class InferenceExecutor(Executor):
+    """
+    Thread pool with a bounded wait queue and load metrics
+
+    At most max_workers tasks run at once and at most max_queue wait behind
+    them; further submissions raise ExecutorSaturated immediately instead of
+    piling up latency. Usable directly with loop.run_in_executor.
+    """
+
+    def __init__(self, max_workers=2, max_queue=64, retry_after=1, name="inference"):
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self.retry_after = retry_after
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._started_at = time.monotonic()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            # Workers are full and max_queue tasks already wait behind them
+            if self.queued + self.active >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise ExecutorSaturated(self.retry_after)
+            self.queued += 1
+        submitted = time.perf_counter()
+
+        def task():
+            started = time.perf_counter()
+            with self._lock:
+                self.queued -= 1
+                self.active += 1
+                waited = started - submitted
+                self.wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    self.completed += 1
+                    self.busy_seconds += time.perf_counter() - started
+
+        try:
+            return self._pool.submit(task)
+        except Exception:
+            with self._lock:
+                self.queued -= 1
+            raise
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn on the pool from async code, in the caller's context (request ID, spans)"""
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self, functools.partial(context.run, fn, *args, **kwargs))
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        self._pool.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+    def stats(self):
+        """Queue depth, wait time and utilization"""
+        with self._lock:
+            elapsed = max(time.monotonic() - self._started_at, 1e-9)
+            started = self.completed + self.active
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queue_depth": self.queued,
+                "active": self.active,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(self.wait_seconds / started * 1000.0, 3) if started else 0.0,
+                "max_wait_ms": round(self.max_wait_seconds * 1000.0, 3),
+                "utilization": round(min(1.0, self.busy_seconds / (elapsed * self.max_workers)), 4),
+                "current_utilization": round(self.active / self.max_workers, 4),
+            }
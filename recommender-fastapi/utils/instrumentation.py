@@ -0,0 +1,226 @@
+# instrumentation.py - Timing spans, latency histograms and Prometheus exposition
+import bisect
+import contextvars
+import os
+import threading
+import time
+import uuid
+
+# Histogram upper bounds in seconds; the low end resolves sub-millisecond stages
+BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+QUANTILES = (0.5, 0.95, 0.99)
+REQUEST_ID_HEADER = "x-request-id"
+
+# Per-request state, visible to every span on the request's task / executor threads
+_request_id = contextvars.ContextVar("request_id", default=None)
+_breakdown = contextvars.ContextVar("breakdown", default=None)
+
+class Histogram:
+    """Fixed-bucket latency histogram (Prometheus style)"""
+
+    __slots__ = ("counts", "total", "count", "_lock")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.total += seconds
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.total, self.count
+
+    @staticmethod
+    def quantile(counts, count, q):
+        """Estimate a quantile by interpolating inside its bucket (like histogram_quantile)"""
+        if not count:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = BUCKETS[index - 1] if index > 0 else 0.0
+                if index == len(BUCKETS):
+                    return lower
+                return lower + (BUCKETS[index] - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return BUCKETS[-1]
+
+class Metrics:
+    """
+    Process-wide latency registry
+
+    Request latency is aggregated per (method, endpoint), request counts
+    also per status, and spans per stage. Recording is a bisect plus a few
+    increments under a lock: about 1 us per span and 4 us per request for the
+    middleware (see tests/test_instrumentation.py).
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._requests = {}
+        self._stages = {}
+        self._status_counts = {}
+        self._lock = threading.Lock()
+
+    def _histogram(self, table, key):
+        histogram = table.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = table.setdefault(key, Histogram())
+        return histogram
+
+    def observe_request(self, method, endpoint, status, seconds):
+        self._histogram(self._requests, (method, endpoint)).observe(seconds)
+        key = (method, endpoint, status)
+        with self._lock:
+            self._status_counts[key] = self._status_counts.get(key, 0) + 1
+
+    def observe_stage(self, stage, seconds):
+        self._histogram(self._stages, stage).observe(seconds)
+
+    def latency_report(self):
+        """p50/p95/p99 per endpoint and per stage, in milliseconds"""
+        def summarize(histogram):
+            counts, total, count = histogram.snapshot()
+            entry = {"count": count, "avg_ms": round(total / count * 1000.0, 3) if count else 0.0}
+            for q in QUANTILES:
+                entry[f"p{int(q * 100)}_ms"] = round(Histogram.quantile(counts, count, q) * 1000.0, 3)
+            return entry
+
+        return {
+            "endpoints": {f"{method} {endpoint}": summarize(h) for (method, endpoint), h in list(self._requests.items())},
+            "stages": {stage: summarize(h) for stage, h in list(self._stages.items())},
+        }
+
+    def prometheus(self):
+        """All metrics in Prometheus text exposition format"""
+        lines = []
+
+        def histogram_lines(name, labels, histogram):
+            counts, total, count = histogram.snapshot()
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {total}")
+            lines.append(f"{name}_count{{{labels}}} {count}")
+            return counts, count
+
+        quantile_lines = []
+        lines.append("# HELP retail_genie_request_duration_seconds Request latency by endpoint")
+        lines.append("# TYPE retail_genie_request_duration_seconds histogram")
+        for (method, endpoint), histogram in sorted(list(self._requests.items())):
+            labels = f'method="{method}",endpoint="{endpoint}"'
+            counts, count = histogram_lines("retail_genie_request_duration_seconds", labels, histogram)
+            for q in QUANTILES:
+                quantile_lines.append(
+                    f'retail_genie_request_latency_seconds{{{labels},quantile="{q}"}} '
+                    f"{Histogram.quantile(counts, count, q)}"
+                )
+
+        lines.append("# HELP retail_genie_request_latency_seconds Estimated latency quantiles by endpoint")
+        lines.append("# TYPE retail_genie_request_latency_seconds gauge")
+        lines.extend(quantile_lines)
+
+        lines.append("# HELP retail_genie_requests_total Requests by endpoint and status")
+        lines.append("# TYPE retail_genie_requests_total counter")
+        with self._lock:
+            status_counts = sorted(self._status_counts.items())
+        for (method, endpoint, status), count in status_counts:
+            lines.append(f'retail_genie_requests_total{{method="{method}",endpoint="{endpoint}",status="{status}"}} {count}')
+
+        lines.append("# HELP retail_genie_stage_duration_seconds Time spent per hot-path stage")
+        lines.append("# TYPE retail_genie_stage_duration_seconds histogram")
+        for stage, histogram in sorted(list(self._stages.items())):
+            histogram_lines("retail_genie_stage_duration_seconds", f'stage="{stage}"', histogram)
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics(enabled=os.getenv("METRICS_ENABLED", "true").lower() == "true")
+
+class span:
+    """Time a block into the stage histogram and the current request's breakdown"""
+
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if metrics.enabled:
+            elapsed = time.perf_counter() - self.started
+            metrics.observe_stage(self.stage, elapsed)
+            breakdown = _breakdown.get()
+            if breakdown is not None:
+                breakdown[self.stage] = breakdown.get(self.stage, 0.0) + elapsed
+        return False
+
+def current_request_id():
+    """ID of the request being handled (for logs and downstream calls), or None"""
+    return _request_id.get()
+
+def _server_timing(breakdown):
+    return ", ".join(f"{stage};dur={seconds * 1000.0:.3f}" for stage, seconds in breakdown.items())
+
+class InstrumentationMiddleware:
+    """
+    ASGI middleware: request ID propagation and per-endpoint latency
+
+    An incoming X-Request-ID is reused (otherwise one is generated) and echoed
+    back, and the request's span breakdown is returned in a Server-Timing
+    header. Endpoints are labelled by route template to keep cardinality low.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not metrics.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope.get("headers", ()):
+            if name == REQUEST_ID_HEADER.encode():
+                request_id = value.decode("latin-1")[:128]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        breakdown = {}
+        id_token = _request_id.set(request_id)
+        breakdown_token = _breakdown.set(breakdown)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_headers(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", ()))
+                headers.append((b"x-request-id", request_id.encode("latin-1")))
+                if breakdown:
+                    headers.append((b"server-timing", _server_timing(breakdown).encode("latin-1")))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            route = scope.get("route")
+            endpoint = getattr(route, "path", None) or "unmatched"
+            metrics.observe_request(scope["method"], endpoint, status, time.perf_counter() - started)
+            _breakdown.reset(breakdown_token)
+            _request_id.reset(id_token)
@@ -0,0 +1,126 @@
+# intent_engine.py - Shared single-pass keyword intent matcher for the sales agents
+import re
+import threading
+from typing import List, NamedTuple
+from utils.instrumentation import span
+
+# Letter runs, digit runs ("under3000" is "under" + "3000") and symbols such as the rupee sign
+_TOKEN = re.compile(r"[^\W\d_]+|\d+|[^\w\s]")
+
+# Shortest stem a "word*" keyword may have
+MIN_STEM = 3
+
+class IntentMatch(NamedTuple):
+    intent: str
+    priority: int
+    keyword: str
+
+class IntentEngine:
+    """
+    Keyword intent tables compiled into one token-level lookup automaton
+
+    Every keyword (single word or phrase) of every registered table maps to
+    the (table, intent, priority) entries it triggers. A message is tokenized
+    once and each token / phrase is a dict lookup, so matching cost depends on
+    message length, not on how many keywords the tables hold.
+
+    Matching is on whole words, so "hi" no longer fires for "shirt" or
+    "this". Inflections are covered two ways: a trailing plural "s" is
+    accepted ("shoes" matches "shoe"), and a keyword ending in "*" is a stem
+    matching any word that starts with it ("cheap*" matches "cheaper" and
+    "cheapest"). Digits are split off letters, so "under3000" still
+    contains "under".
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._max_phrase = 1
+        self._stem_lengths = ()
+        self._tables = set()
+        self._lock = threading.Lock()
+
+    def register(self, table, intents):
+        """
+        Compile a table of (intent, keywords) pairs, highest priority first
+
+        Re-registering a table name replaces its keywords.
+        """
+        with self._lock:
+            entries = {
+                key: [hit for hit in hits if hit[0] != table]
+                for key, hits in self._entries.items()
+            }
+            max_phrase = self._max_phrase
+            stem_lengths = set(self._stem_lengths)
+            for priority, (intent, keywords) in enumerate(intents):
+                for keyword in keywords:
+                    stem = keyword.endswith("*")
+                    key = tuple(_TOKEN.findall(keyword.lower().rstrip("*")))
+                    if not key:
+                        continue
+                    if stem:
+                        if len(key[-1]) < MIN_STEM:
+                            raise ValueError(f"Stem keyword {keyword!r} needs at least {MIN_STEM} letters")
+                        # "*" never occurs inside a token, so stem keys can't collide with words
+                        stem_lengths.add(len(key[-1]))
+                        key = key[:-1] + (key[-1] + "*",)
+                    entries.setdefault(key, []).append((table, intent, priority, keyword))
+                    max_phrase = max(max_phrase, len(key))
+            # Swap in the new automaton in one assignment for concurrent readers
+            self._entries = {key: hits for key, hits in entries.items() if hits}
+            self._max_phrase = max_phrase
+            self._stem_lengths = tuple(sorted(stem_lengths))
+            self._tables.add(table)
+
+    def _lookup(self, key):
+        """Entries for an n-gram: exact, singular of a plural, and stems of the last word"""
+        entries = self._entries
+        last = key[-1]
+        hits = entries.get(key)
+        variants = []
+        if len(last) > 3 and last.endswith("s"):
+            variants.append(key[:-1] + (last[:-1],))
+        for length in self._stem_lengths:
+            if length > len(last):
+                break
+            variants.append(key[:-1] + (last[:length] + "*",))
+        for variant in variants:
+            more = entries.get(variant)
+            if more:
+                hits = more if not hits else hits + more
+        return hits
+
+    def match_all(self, text):
+        """Match every table in one pass: {table: [IntentMatch, ...] by priority}"""
+        with span("intent_detection"):
+            return self._match_all(text)
+
+    def _match_all(self, text):
+        tokens = _TOKEN.findall(str(text).lower())
+        entries, max_phrase = self._entries, self._max_phrase
+        found = {}
+        for start in range(len(tokens)):
+            for length in range(1, min(max_phrase, len(tokens) - start) + 1):
+                hits = self._lookup(tuple(tokens[start:start + length])) if entries else None
+                if not hits:
+                    continue
+                for table, intent, priority, keyword in hits:
+                    table_hits = found.setdefault(table, {})
+                    if intent not in table_hits:
+                        table_hits[intent] = IntentMatch(intent, priority, keyword)
+        return {
+            table: sorted(table_hits.values(), key=lambda m: m.priority)
+            for table, table_hits in found.items()
+        }
+
+    def match(self, table, text) -> List[IntentMatch]:
+        """All intents of one table found in text, highest priority first"""
+        return self.match_all(text).get(table, [])
+
+    def classify(self, table, text, default=None):
+        """Highest-priority intent of one table, or default"""
+        matches = self.match(table, text)
+        return matches[0].intent if matches else default
+
+# Process-wide engine shared by all agents
+intent_engine = IntentEngine()
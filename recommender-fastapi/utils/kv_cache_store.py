@@ -0,0 +1,193 @@
+# kv_cache_store.py - Bounded per-session attention (KV) caches for multi-turn generation
+import threading
+import time
+from collections import OrderedDict
+
+# Rough bookkeeping cost of one cached token id / one session record
+_TOKEN_OVERHEAD_BYTES = 36
+_CONTEXT_OVERHEAD_BYTES = 400
+
+def _tensor_nbytes(t):
+    # A view keeps its whole base buffer alive, so count the buffer
+    storage = getattr(t, "untyped_storage", None)
+    return storage().nbytes() if storage is not None else t.numel() * t.element_size()
+
+def past_nbytes(past):
+    """Memory held by a model's past_key_values (DynamicCache or legacy tuples)"""
+    if past is None:
+        return 0
+    if hasattr(past, "to_legacy_cache"):
+        past = past.to_legacy_cache()
+    return sum(_tensor_nbytes(t) for layer in past for t in layer)
+
+def _crop_layers(layers, length):
+    return tuple(tuple(t[..., :length, :].clone() for t in layer) for layer in layers)
+
+def crop_past(past, length):
+    """
+    Keep the first length positions of past_key_values; None for an empty prefix
+
+    The kept positions are copied out: a slice would pin the full-length
+    buffers, which the cache's memory ceiling doesn't see.
+    """
+    if past is None or length <= 0:
+        return None
+    if hasattr(past, "to_legacy_cache"):
+        return type(past).from_legacy_cache(_crop_layers(past.to_legacy_cache(), length))
+    return _crop_layers(past, length)
+
+class SessionContext:
+    """
+    One session's transcript as token ids plus the KV cache covering its prefix
+
+    exchanges holds one token list per customer turn + agent reply. The
+    first cached_length tokens of the transcript are already in past; the
+    rest (typically the last reply) are fed together with the next turn.
+    """
+
+    __slots__ = ("session_id", "exchanges", "past", "cached_length", "nbytes", "last_seen")
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.exchanges = []
+        self.past = None
+        self.cached_length = 0
+        self.nbytes = _CONTEXT_OVERHEAD_BYTES
+        self.last_seen = time.monotonic()
+
+    def total_length(self):
+        return sum(len(exchange) for exchange in self.exchanges)
+
+    def pending(self):
+        """Transcript tokens not yet in the cache"""
+        tokens = [token for exchange in self.exchanges for token in exchange]
+        return tokens[self.cached_length:]
+
+    def trim(self, budget):
+        """
+        Drop the oldest exchanges until the transcript fits budget tokens
+
+        Absolute positions change, so the cache is discarded and the kept
+        exchanges are re-encoded with the next turn. Returns exchanges dropped.
+        """
+        dropped = 0
+        while self.exchanges and self.total_length() > budget:
+            self.exchanges.pop(0)
+            dropped += 1
+        self.past = None
+        self.cached_length = 0
+        return dropped
+
+    def measure(self):
+        self.nbytes = (
+            _CONTEXT_OVERHEAD_BYTES
+            + self.total_length() * _TOKEN_OVERHEAD_BYTES
+            + past_nbytes(self.past)
+        )
+        return self.nbytes
+
+class SessionKVCache:
+    """
+    Session-keyed SessionContexts with bounded memory
+
+    A turn take()s its session's context (so two concurrent turns of one
+    session never extend the same cache) and put()s it back when done.
+    Transcripts are limited to window tokens, sessions idle longer than
+    idle_ttl_seconds are dropped, and once the store exceeds max_bytes the
+    least recently used sessions are evicted.
+    """
+
+    def __init__(self, window=512, max_bytes=256 * 1024 * 1024, idle_ttl_seconds=1800):
+        self.window = window
+        self.max_bytes = max_bytes
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self._contexts = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.reused_tokens = 0
+        self.prefilled_tokens = 0
+        self.window_trims = 0
+        self.idle_evictions = 0
+        self.lru_evictions = 0
+
+    def _drop(self, session_id):
+        context = self._contexts.pop(session_id)
+        self.current_bytes -= context.nbytes
+
+    def _expire_idle(self, now):
+        """Drop idle contexts; the LRU order means they sit at the front"""
+        if not self.idle_ttl_seconds:
+            return
+        while self._contexts:
+            session_id, context = next(iter(self._contexts.items()))
+            if now - context.last_seen <= self.idle_ttl_seconds:
+                break
+            self._drop(session_id)
+            self.idle_evictions += 1
+
+    def take(self, session_id):
+        """Remove and return the session's context (a fresh one if there is none)"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire_idle(now)
+            context = self._contexts.get(session_id)
+            if context is None:
+                self.misses += 1
+                return SessionContext(session_id)
+            self._drop(session_id)
+            self.hits += 1
+        context.last_seen = now
+        return context
+
+    def put(self, context):
+        """Store a context after its turn, evicting LRU sessions past max_bytes"""
+        if context.measure() > self.max_bytes:
+            # Too big to keep its cache; the transcript is re-encoded next turn
+            context.past = None
+            context.cached_length = 0
+            context.measure()
+        with self._lock:
+            if context.session_id in self._contexts:
+                self._drop(context.session_id)
+            self._contexts[context.session_id] = context
+            self.current_bytes += context.nbytes
+            while self.current_bytes > self.max_bytes and len(self._contexts) > 1:
+                session_id = next(iter(self._contexts))
+                if session_id == context.session_id:
+                    break
+                self._drop(session_id)
+                self.lru_evictions += 1
+
+    def record_turn(self, reused, prefilled, trimmed=False):
+        """Account one model turn: cached tokens reused vs tokens run through the model"""
+        with self._lock:
+            self.reused_tokens += reused
+            self.prefilled_tokens += prefilled
+            self.window_trims += trimmed
+
+    def clear(self, session_id):
+        """Forget one session's context"""
+        with self._lock:
+            if session_id in self._contexts:
+                self._drop(session_id)
+
+    def stats(self):
+        """Occupancy, prefix reuse and eviction counters for monitoring"""
+        with self._lock:
+            processed = self.reused_tokens + self.prefilled_tokens
+            return {
+                "sessions": len(self._contexts),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "window": self.window,
+                "hits": self.hits,
+                "misses": self.misses,
+                "reused_tokens": self.reused_tokens,
+                "prefilled_tokens": self.prefilled_tokens,
+                "reuse_rate": round(self.reused_tokens / processed, 4) if processed else 0.0,
+                "window_trims": self.window_trims,
+                "idle_evictions": self.idle_evictions,
+                "lru_evictions": self.lru_evictions,
+            }
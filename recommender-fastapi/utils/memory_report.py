@@ -0,0 +1,82 @@
+# memory_report.py - Resident vs shared memory of this worker process
+import os
+import sys
+
+_SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+# Mapped files worth itemizing: model weights and embedding matrices
+_TRACKED_SUFFIXES = (".safetensors", ".npy")
+
+def _kb_to_mb(kb):
+    return round(kb / 1024.0, 2)
+
+def _parse_smaps(path, track_files=False):
+    """Sum smaps fields, overall and (optionally) per tracked mapped file"""
+    totals = dict.fromkeys(_SMAPS_FIELDS, 0)
+    files = {}
+    current = None
+    with open(path) as f:
+        for line in f:
+            parts = line.split(None, 5)
+            if not parts:
+                continue
+            if not parts[0].endswith(":"):
+                # Mapping header: address perms offset dev inode [path]
+                name = parts[5].strip() if len(parts) > 5 else None
+                current = None
+                if track_files and name and name.endswith(_TRACKED_SUFFIXES):
+                    current = files.setdefault(name, dict.fromkeys(_SMAPS_FIELDS, 0))
+                continue
+            field = parts[0][:-1]
+            if field in totals:
+                kb = int(parts[1])
+                totals[field] += kb
+                if current is not None:
+                    current[field] += kb
+    return totals, files
+
+def _summary(fields):
+    shared = fields["Shared_Clean"] + fields["Shared_Dirty"]
+    private = fields["Private_Clean"] + fields["Private_Dirty"]
+    return {
+        "rss_mb": _kb_to_mb(fields["Rss"]),
+        "shared_mb": _kb_to_mb(shared),
+        "private_mb": _kb_to_mb(private),
+        # Proportional share: shared pages split across the processes mapping them
+        "pss_mb": _kb_to_mb(fields["Pss"]),
+    }
+
+def memory_report():
+    """
+    Resident, shared and private memory of this process (Linux /proc)
+
+    Pages of memory-mapped weight / embedding files that other workers also
+    touched count as shared, so with shared loading the private figure is
+    what each extra worker really costs.
+    """
+    report = {"pid": os.getpid()}
+    if os.path.exists("/proc/self/smaps"):
+        totals, files = _parse_smaps("/proc/self/smaps", track_files=True)
+        report.update(_summary(totals))
+        report["mapped_files"] = {name: _summary(fields) for name, fields in files.items()}
+    elif sys.platform != "win32":
+        # No smaps (macOS) - only peak resident size is available
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        report["max_rss_mb"] = round(peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0, 2)
+    return report
+
+def print_memory_report(label="startup"):
+    """Log one line per process plus one per mapped model file"""
+    report = memory_report()
+    if "rss_mb" not in report:
+        if "max_rss_mb" in report:
+            print(f"[MEM] pid {report['pid']} ({label}): max rss {report['max_rss_mb']} MB")
+        return report
+    print(
+        f"[MEM] pid {report['pid']} ({label}): rss {report['rss_mb']} MB = "
+        f"shared {report['shared_mb']} MB + private {report['private_mb']} MB (pss {report['pss_mb']} MB)"
+    )
+    for name, usage in report["mapped_files"].items():
+        print(f"      {os.path.basename(name)}: resident {usage['rss_mb']} MB, shared {usage['shared_mb']} MB")
+    return report
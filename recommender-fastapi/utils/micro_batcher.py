@@ -0,0 +1,140 @@
+# micro_batcher.py - asyncio micro-batching in front of batched model calls
+import asyncio
+import time
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-item requests into batched calls
+
+    Items arriving within max_wait_ms of the first one (or until
+    max_batch_size is reached) are passed to batch_fn together on a worker
+    thread, and each caller gets back its own result. A larger window trades
+    per-request latency for fewer, bigger batches.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=32, max_wait_ms=3.0, lookup_fn=None, executor=None):
+        """
+        Args:
+            batch_fn: Called with a list of items, returns results in the same order
+            lookup_fn: Optional fast path (item -> result or None) checked before queueing
+            executor: Executor for batch_fn (None = the loop's default threadpool)
+        """
+        self.batch_fn = batch_fn
+        self.lookup_fn = lookup_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.executor = executor
+        self._queue = None
+        self._task = None
+        self.batches = 0
+        self.items = 0
+        self.fast_path_hits = 0
+        self.largest_batch = 0
+        self.total_queue_seconds = 0.0
+
+    async def start(self):
+        """Start the collector task on the running event loop"""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop collecting and fail every caller still waiting (in-flight batch and queue)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self._queue is not None and not self._queue.empty():
+            self._fail([self._queue.get_nowait()], RuntimeError("Batcher stopped"))
+
+    @staticmethod
+    def _fail(batch, error):
+        for _, future, _ in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    async def submit(self, item):
+        """Queue one item and wait for its result"""
+        if self.lookup_fn is not None:
+            result = self.lookup_fn(item)
+            if result is not None:
+                self.fast_path_hits += 1
+                return result
+
+        if self._task is None:
+            raise RuntimeError("Batcher not started")
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self, batch):
+        """
+        Wait for one item, then gather more until the window closes or the batch is full
+
+        Items go straight into batch, so a cancelled collector's caller still
+        sees (and can fail) what was already taken off the queue.
+        """
+        loop = asyncio.get_running_loop()
+        batch.append(await self._queue.get())
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            # Take whatever is already queued without yielding
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            remaining = deadline - loop.time()
+            if len(batch) >= self.max_batch_size or remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        batch = []
+        try:
+            while True:
+                batch = []
+                await self._collect(batch)
+                # Callers that gave up (cancelled) don't need a result
+                batch = [entry for entry in batch if not entry[1].done()]
+                if not batch:
+                    continue
+
+                started = time.perf_counter()
+                self.batches += 1
+                self.items += len(batch)
+                self.largest_batch = max(self.largest_batch, len(batch))
+                self.total_queue_seconds += sum(started - queued_at for _, _, queued_at in batch)
+
+                try:
+                    results = await loop.run_in_executor(self.executor, self.batch_fn, [item for item, _, _ in batch])
+                except Exception as e:
+                    self._fail(batch, e)
+                    continue
+
+                for (_, future, _), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+        except asyncio.CancelledError:
+            # Collected or running when stopped - nobody else will answer these callers
+            self._fail(batch, RuntimeError("Batcher stopped"))
+            raise
+
+    def stats(self):
+        """Batching effectiveness counters"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batches": self.batches,
+            "items": self.items,
+            "fast_path_hits": self.fast_path_hits,
+            "largest_batch": self.largest_batch,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "avg_queue_ms": round(self.total_queue_seconds / self.items * 1000.0, 3) if self.items else 0.0,
+        }
@@ -0,0 +1,69 @@
+# model_registry.py - Process-wide registry of shared embedding models
+import threading
+import time
+
+_models = {}
+_stats = {}
+_lock = threading.Lock()
+
+# When set, model weights are exported here once and memory-mapped by every worker
+_shared_weights_dir = None
+
+def enable_shared_weights(directory):
+    """Serve models loaded from now on from shared, memory-mapped weight files"""
+    global _shared_weights_dir
+    _shared_weights_dir = directory
+
+def _canonical_name(model_name):
+    """Treat 'all-MiniLM-L6-v2' and 'sentence-transformers/all-MiniLM-L6-v2' as one model"""
+    if "/" not in model_name:
+        return f"sentence-transformers/{model_name}"
+    return model_name
+
+def _model_bytes(model):
+    """Memory held by the model's parameters and buffers"""
+    try:
+        tensors = list(model.parameters()) + list(model.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    except Exception:
+        return None
+
+def get_embedding_model(model_name="sentence-transformers/all-MiniLM-L6-v2"):
+    """Get the shared SentenceTransformer for model_name, loading it on first use"""
+    name = _canonical_name(model_name)
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    with _lock:
+        # Another thread may have finished loading while we waited
+        model = _models.get(name)
+        if model is None:
+            from sentence_transformers import SentenceTransformer
+
+            started = time.perf_counter()
+            model = SentenceTransformer(name)
+            shared_bytes = _share_weights(name, model) if _shared_weights_dir else 0
+            load_seconds = time.perf_counter() - started
+            _stats[name] = {
+                "load_seconds": round(load_seconds, 3),
+                "memory_bytes": _model_bytes(model),
+                "shared_bytes": shared_bytes,
+            }
+            _models[name] = model
+            print(f"[OK] Loaded embedding model {name} in {load_seconds:.2f}s")
+    return model
+
+def _share_weights(name, model):
+    """Swap a freshly loaded model's weights for a mapping of the shared file"""
+    from utils.shared_weights import export_shared_weights, load_shared_weights, shared_weights_path
+    try:
+        path = export_shared_weights(model, shared_weights_path(_shared_weights_dir, name))
+        return load_shared_weights(model, path)
+    except Exception as e:
+        print(f"[WARNING] Could not share weights of {name}, keeping a private copy: {e}")
+        return 0
+
+def get_registry_stats():
+    """Load time and memory footprint of every model loaded so far"""
+    return {name: dict(stats) for name, stats in _stats.items()}
@@ -0,0 +1,307 @@
+# packed_dataset.py - Cached tokenization and conversation packing for causal LM training
+import bisect
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+# Below this many conversations a process pool costs more than it saves
+PARALLEL_MIN_TEXTS = 2000
+
+def tokenizer_fingerprint(tokenizer):
+    """Hash of everything that changes token ids: vocab, merges, added tokens"""
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None:
+        spec = backend.to_str()
+    else:
+        spec = json.dumps(sorted(tokenizer.get_vocab().items()), ensure_ascii=False)
+    extra = json.dumps([tokenizer.eos_token_id, len(tokenizer)])
+    return hashlib.sha1(f"{spec}\x00{extra}".encode("utf-8")).hexdigest()
+
+def dataset_key(texts, tokenizer, add_eos=True):
+    """Cache key for texts tokenized by tokenizer"""
+    digest = hashlib.sha1(tokenizer_fingerprint(tokenizer).encode("utf-8"))
+    digest.update(b"eos" if add_eos else b"raw")
+    for text in texts:
+        digest.update(b"\x00")
+        digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+_worker_tokenizer = None
+
+def _init_worker(tokenizer):
+    global _worker_tokenizer
+    # The pool already runs one tokenizer per core
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    _worker_tokenizer = tokenizer
+
+def _encode(tokenizer, texts):
+    return tokenizer(list(texts), add_special_tokens=False)["input_ids"]
+
+def _encode_in_worker(texts):
+    return _encode(_worker_tokenizer, texts)
+
+def tokenize_texts(texts, tokenizer, workers=None, chunk_size=1000, add_eos=True):
+    """
+    Tokenize texts into one flat token array plus row offsets
+
+    Large inputs are split into chunks and tokenized across worker
+    processes (fork start method only - spawning would re-run the calling
+    script); small ones are tokenized in-process.
+
+    Returns:
+        (tokens, offsets): row i is tokens[offsets[i]:offsets[i + 1]]
+    """
+    texts = list(texts)
+    workers = workers or os.cpu_count() or 1
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    parallel = (
+        workers > 1
+        and len(texts) >= PARALLEL_MIN_TEXTS
+        and "fork" in multiprocessing.get_all_start_methods()
+    )
+
+    if parallel:
+        context = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(tokenizer,)) as pool:
+            encoded = [row for chunk in pool.map(_encode_in_worker, chunks) for row in chunk]
+    else:
+        encoded = [row for chunk in chunks for row in _encode(tokenizer, chunk)]
+
+    if add_eos:
+        encoded = [row + [tokenizer.eos_token_id] for row in encoded]
+
+    lengths = np.fromiter((len(row) for row in encoded), dtype=np.int64, count=len(encoded))
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    dtype = np.uint16 if len(tokenizer) <= np.iinfo(np.uint16).max else np.uint32
+    tokens = np.fromiter((token for row in encoded for token in row), dtype=dtype, count=int(offsets[-1]))
+    return tokens, offsets
+
+def load_or_tokenize(texts, tokenizer, cache_dir, workers=None, add_eos=True):
+    """
+    Memory-mapped token array for texts, tokenizing only on a cache miss
+
+    Files are keyed by a hash of the tokenizer and the texts, so edited data
+    or a changed vocabulary gets its own entry and a rerun maps the old one.
+
+    Returns:
+        (tokens, offsets) as read-only memory maps
+    """
+    texts = list(texts)
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    key = dataset_key(texts, tokenizer, add_eos)
+    tokens_path = cache_dir / f"{key}.tokens.npy"
+    offsets_path = cache_dir / f"{key}.offsets.npy"
+
+    if tokens_path.exists() and offsets_path.exists():
+        try:
+            tokens = np.load(tokens_path, mmap_mode="r")
+            offsets = np.load(offsets_path, mmap_mode="r")
+            if len(offsets) == len(texts) + 1 and offsets[-1] == len(tokens):
+                print(f"[OK] Loaded {len(tokens):,} tokens for {len(texts):,} conversations from cache")
+                return tokens, offsets
+        except Exception as e:
+            print(f"[WARNING] Ignoring unreadable token cache {key[:12]}: {e}")
+
+    tokens, offsets = tokenize_texts(texts, tokenizer, workers=workers, add_eos=add_eos)
+    print(f"[OK] Tokenized {len(texts):,} conversations into {len(tokens):,} tokens")
+
+    # Write to temp files and rename so an interrupted run never leaves a partial cache
+    suffix = f".{os.getpid()}.tmp"
+    for path, array in ((offsets_path, offsets), (tokens_path, tokens)):
+        tmp_path = path.with_name(path.name + suffix)
+        with open(tmp_path, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, path)
+    return np.load(tokens_path, mmap_mode="r"), np.load(offsets_path, mmap_mode="r")
+
+def conversation_spans(offsets, block_size):
+    """(start, end) token span per conversation; longer than block_size ones are split"""
+    offsets = np.asarray(offsets)
+    spans = []
+    for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist()):
+        for piece in range(start, end, block_size):
+            spans.append((piece, min(piece + block_size, end)))
+    return spans
+
+def pack_spans(offsets, block_size):
+    """
+    Group whole conversations into blocks of at most block_size tokens
+
+    Best-fit decreasing: longest conversations first, each into the fullest
+    block that still has room. Only a conversation longer than a block is
+    split, into block_size pieces.
+
+    Returns:
+        List of blocks, each a list of (start, end) token spans
+    """
+    spans = sorted(conversation_spans(offsets, block_size), key=lambda span: span[0] - span[1])
+
+    blocks = []
+    # (remaining room, block index) of open blocks, kept sorted
+    room = []
+    for start, end in spans:
+        length = end - start
+        slot = bisect.bisect_left(room, (length, -1))
+        if slot == len(room):
+            blocks.append([(start, end)])
+            remaining, index = block_size - length, len(blocks) - 1
+        else:
+            remaining, index = room.pop(slot)
+            blocks[index].append((start, end))
+            remaining -= length
+        if remaining > 0:
+            bisect.insort(room, (remaining, index))
+    return blocks
+
+class PackedConversationDataset:
+    """
+    Map-style dataset of token blocks built from whole conversations
+
+    With pack=True several conversations share a block (see pack_spans);
+    otherwise each conversation is its own example. Items carry the token ids
+    and the length of each conversation in them, which PackedDataCollator
+    turns into per-conversation position ids, labels and segment ids.
+    """
+
+    def __init__(self, tokens, offsets, block_size=128, pack=True):
+        self.tokens = tokens
+        self.block_size = block_size
+        if pack:
+            self.blocks = pack_spans(offsets, block_size)
+        else:
+            self.blocks = [[span] for span in conversation_spans(offsets, block_size)]
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __getitem__(self, i):
+        spans = self.blocks[i]
+        return {
+            "input_ids": np.concatenate([self.tokens[start:end] for start, end in spans]).astype(np.int64),
+            "segment_lengths": [end - start for start, end in spans],
+        }
+
+    def stats(self):
+        """Block count and how full the blocks are"""
+        used = sum(end - start for block in self.blocks for start, end in block)
+        return {
+            "blocks": len(self.blocks),
+            "tokens": used,
+            "fill_rate": round(used / (len(self.blocks) * self.block_size), 4) if self.blocks else 0.0,
+        }
+
+class PackedDataCollator:
+    """
+    Pads a batch to its longest example (dynamic padding) and separates packed conversations
+
+    Position ids restart at every conversation and labels skip padding and
+    the first token of each conversation (it isn't predicted from the one
+    before). attention_mask is the plain 2D padding mask; batches holding
+    packed blocks also carry segment_ids (conversation index per token, -1
+    for padding), which a model prepared with isolate_packed_conversations
+    turns into a block-diagonal mask so no token attends across a
+    conversation boundary. A model without that hook rejects segment_ids
+    rather than silently training on mixed conversations.
+    """
+
+    def __init__(self, pad_token_id, pad_to_multiple_of=8):
+        self.pad_token_id = pad_token_id
+        self.pad_to_multiple_of = pad_to_multiple_of
+
+    def __call__(self, features):
+        import torch
+
+        width = max(len(feature["input_ids"]) for feature in features)
+        if self.pad_to_multiple_of:
+            width = -(-width // self.pad_to_multiple_of) * self.pad_to_multiple_of
+        rows = len(features)
+
+        input_ids = torch.full((rows, width), self.pad_token_id, dtype=torch.long)
+        labels = torch.full((rows, width), -100, dtype=torch.long)
+        position_ids = torch.zeros((rows, width), dtype=torch.long)
+        segments = torch.full((rows, width), -1, dtype=torch.long)
+
+        for row, feature in enumerate(features):
+            ids = torch.as_tensor(feature["input_ids"], dtype=torch.long)
+            input_ids[row, :len(ids)] = ids
+            labels[row, :len(ids)] = ids
+            cursor = 0
+            for segment, length in enumerate(feature["segment_lengths"]):
+                position_ids[row, cursor:cursor + length] = torch.arange(length)
+                segments[row, cursor:cursor + length] = segment
+                labels[row, cursor] = -100
+                cursor += length
+
+        batch = {
+            "input_ids": input_ids,
+            "attention_mask": (segments >= 0).long(),
+            "position_ids": position_ids,
+            "labels": labels,
+        }
+        if any(len(feature["segment_lengths"]) > 1 for feature in features):
+            batch["segment_ids"] = segments
+        return batch
+
+def segment_attention_bias(segment_ids, dtype):
+    """
+    Additive (batch, 1, seq, seq) attention bias keeping each conversation to itself
+
+    0 where query and key belong to the same conversation, the dtype's
+    minimum elsewhere. Padding positions attend only to themselves so no
+    softmax row is fully masked. Causality is left to the model.
+    """
+    import torch
+
+    same = (segment_ids[:, :, None] == segment_ids[:, None, :]) & (segment_ids[:, None, :] >= 0)
+    same |= torch.eye(segment_ids.shape[1], dtype=torch.bool, device=segment_ids.device)
+    bias = torch.zeros(same.shape, dtype=dtype, device=segment_ids.device)
+    bias.masked_fill_(~same, torch.finfo(dtype).min)
+    return bias[:, None]
+
+def isolate_packed_conversations(model):
+    """
+    Let a GPT-2 style model take the collator's segment_ids
+
+    Hooks pop segment_ids from the model call and hand every transformer
+    block a block-diagonal bias in place of its padding mask, so a packed
+    conversation sees the same attention pattern as it would alone (the
+    GPT-2 forward itself only accepts a 2D mask). Returns False, changing
+    nothing, when the model has no GPT-2 block list to hook.
+    """
+    blocks = getattr(getattr(model, "transformer", None), "h", None)
+    if blocks is None or not len(blocks):
+        return False
+
+    state = {"bias": None}
+
+    def take_segments(module, args, kwargs):
+        segment_ids = kwargs.pop("segment_ids", None)
+        state["bias"] = None if segment_ids is None else segment_attention_bias(segment_ids, model.dtype)
+        return args, kwargs
+
+    def use_bias(module, args, kwargs):
+        if state["bias"] is None:
+            return None
+        if "attention_mask" in kwargs or len(args) <= 2:
+            kwargs["attention_mask"] = state["bias"]
+        else:
+            # Gradient checkpointing passes block arguments positionally
+            args = args[:2] + (state["bias"],) + args[3:]
+        return args, kwargs
+
+    try:
+        model.register_forward_pre_hook(take_segments, with_kwargs=True)
+    except TypeError:
+        # torch < 2.0 can't rewrite keyword arguments from a hook
+        return False
+    for block in blocks:
+        block.register_forward_pre_hook(use_bias, with_kwargs=True)
+    return True
@@ -0,0 +1,100 @@
+# query_cache.py - Bounded, thread-safe LRU cache for query embeddings
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+# Rough per-entry bookkeeping cost (OrderedDict node, tuple, timestamp float)
+_ENTRY_OVERHEAD_BYTES = 200
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_query(text):
+    """Cache key for a query: lowercased with collapsed whitespace"""
+    return _WHITESPACE.sub(" ", str(text).strip().lower())
+
+class QueryEmbeddingCache:
+    """
+    LRU cache of query text -> embedding vector, bounded by memory
+
+    Entries older than ttl_seconds (if set) are treated as misses. Hit, miss
+    and eviction counters are kept for monitoring.
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024, ttl_seconds=None):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _entry_bytes(key, vector):
+        return sys.getsizeof(key) + vector.nbytes + _ENTRY_OVERHEAD_BYTES
+
+    def get(self, key):
+        """Return the cached vector for a normalized key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            vector, stored_at, size = entry
+            if self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.current_bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, key, vector):
+        """Store a vector (kept read-only) and evict least recently used entries"""
+        vector = vector.copy()
+        vector.flags.writeable = False
+        size = self._entry_bytes(key, vector)
+        if size > self.max_bytes:
+            return vector
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[2]
+            self._entries[key] = (vector, time.monotonic(), size)
+            self.current_bytes += size
+
+            while self.current_bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+        return vector
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """Counters and occupancy for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,160 @@
+# reply_index.py - Retrieval of curated agent replies for near-duplicate customer messages
+import json
+import os
+import threading
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+
+from utils.embeddings import EmbeddingEngine
+from utils.query_cache import normalize_query
+
+# Similarity histogram bucket width (cosine similarity, 0..1)
+SIMILARITY_BUCKET = 0.05
+
+def load_reply_corpus(path):
+    """
+    Read curated (customer, reply) pairs from a .json or .jsonl file
+
+    Each entry is either a [customer, reply] pair or an object with
+    "customer" and "reply" keys.
+    """
+    path = Path(path)
+    with open(path, "r", encoding="utf-8") as f:
+        if path.suffix == ".jsonl":
+            entries = [json.loads(line) for line in f if line.strip()]
+        else:
+            entries = json.load(f)
+
+    pairs = []
+    for entry in entries:
+        if isinstance(entry, dict):
+            entry = (entry.get("customer"), entry.get("reply"))
+        customer, reply = entry
+        if customer and reply:
+            pairs.append((str(customer), str(reply)))
+    return pairs
+
+class ReplyIndex:
+    """
+    Nearest-neighbour index over the customer side of curated conversations
+
+    A message whose closest stored customer message scores at least
+    threshold (cosine similarity) gets that example's reply as-is; anything
+    less similar is left to the model. Every decision feeds the hit rate and
+    a similarity histogram, so the threshold can be tuned against live traffic.
+    """
+
+    def __init__(self, pairs, threshold=0.85, model_name="sentence-transformers/all-MiniLM-L6-v2",
+                 query_cache_bytes=1024 * 1024, window=1000):
+        """
+        Args:
+            pairs: (customer_message, reply) examples
+            threshold: Minimum similarity for serving a stored reply
+            model_name: Sentence embedding model (shared with the recommender via the registry)
+            query_cache_bytes: Memory budget of the query embedding cache (repeats skip the encode)
+        """
+        self.threshold = threshold
+        self.replies = [reply for _, reply in pairs]
+        self.engine = EmbeddingEngine(model_name, query_cache_bytes=query_cache_bytes)
+        # Examples are normalized like incoming queries, so an exact repeat scores 1.0
+        self.embeddings = self.engine.normalize(self.engine.model.encode(
+            [normalize_query(customer) for customer, _ in pairs], convert_to_numpy=True
+        )) if pairs else None
+        self.index = self.engine.create_index(self.embeddings) if pairs else None
+
+        self._lock = threading.Lock()
+        self._similarities = deque(maxlen=window)
+        self._histogram = [0] * int(round(1.0 / SIMILARITY_BUCKET))
+        self.lookups = 0
+        self.hits = 0
+
+    @classmethod
+    def from_env(cls):
+        """TRAINING_DATA plus REPLY_CORPUS_PATH, or None when REPLY_INDEX is disabled"""
+        if os.getenv("REPLY_INDEX", "true").lower() != "true":
+            return None
+
+        from training_data import get_training_data
+        pairs = list(get_training_data())
+        corpus_path = os.getenv("REPLY_CORPUS_PATH")
+        if corpus_path:
+            pairs.extend(load_reply_corpus(corpus_path))
+        return cls(
+            pairs,
+            threshold=float(os.getenv("REPLY_INDEX_THRESHOLD", 0.85)),
+            model_name=os.getenv("MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2"),
+        )
+
+    def __len__(self):
+        return len(self.replies)
+
+    def _decide(self, query_vecs):
+        """(reply or None, similarity) per query vector, recorded in the stats"""
+        results = []
+        for rows, scores in self.engine.search(query_vecs, self.embeddings, self.index):
+            best = int(np.argmax(scores))
+            similarity = float(scores[best])
+            row = best if rows is None else int(rows[best])
+            results.append((self.replies[row] if similarity >= self.threshold else None, similarity))
+
+        with self._lock:
+            for reply, similarity in results:
+                self.lookups += 1
+                self.hits += reply is not None
+                self._similarities.append(similarity)
+                bucket = min(max(int(similarity / SIMILARITY_BUCKET), 0), len(self._histogram) - 1)
+                self._histogram[bucket] += 1
+        return results
+
+    def match(self, message):
+        """Stored reply for a near-duplicate message, else None; returns (reply, similarity)"""
+        return self.match_batch([message])[0]
+
+    def match_batch(self, messages):
+        """match() for many messages with one batched encode"""
+        if not messages:
+            return []
+        if self.embeddings is None:
+            return [(None, 0.0) for _ in messages]
+        return self._decide(self.engine.encode_batch(messages))
+
+    def match_cached(self, message):
+        """match() when the message's embedding is already cached, else None (no model call)"""
+        if self.embeddings is None:
+            return None
+        vector = self.engine.cached(message)
+        if vector is None:
+            return None
+        return self._decide(vector)[0]
+
+    def stats(self):
+        """Hit rate and the distribution of nearest-neighbour similarities"""
+        with self._lock:
+            similarities = np.array(self._similarities)
+            histogram = list(self._histogram)
+            lookups, hits = self.lookups, self.hits
+
+        distribution = {}
+        if len(similarities):
+            distribution = {
+                f"p{q}": round(float(np.percentile(similarities, q)), 4) for q in (10, 50, 90, 99)
+            }
+            # Misses within one bucket of the threshold - what lowering it would pick up
+            distribution["near_misses"] = int(np.sum(
+                (similarities < self.threshold) & (similarities >= self.threshold - SIMILARITY_BUCKET)
+            ))
+        return {
+            "entries": len(self.replies),
+            "threshold": self.threshold,
+            "lookups": lookups,
+            "hits": hits,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "similarity": distribution,
+            "histogram": {
+                f"{i * SIMILARITY_BUCKET:.2f}-{(i + 1) * SIMILARITY_BUCKET:.2f}": count
+                for i, count in enumerate(histogram) if count
+            },
+            "query_cache": self.engine.query_cache.stats() if self.engine.query_cache is not None else None,
+        }
@@ -0,0 +1,84 @@
+# response_cache.py - LRU + TTL cache for deterministic agent replies
+import threading
+import time
+from collections import OrderedDict
+
+# Agent paths whose replies may be served from the cache
+RESPONSE_CACHE_PATHS = ("deepseek", "trained_model")
+
+class ResponseCache:
+    """
+    Shared reply cache keyed on (agent path, normalized message or intent, profile fields)
+
+    Only paths listed in cacheable_paths are looked up or stored, so a path
+    whose replies depend on more than its key can be switched off without
+    touching the agent. Entries older than ttl_seconds (if set) are misses;
+    beyond max_entries the least recently used are evicted.
+    """
+
+    def __init__(self, max_entries=4096, ttl_seconds=None, cacheable_paths=RESPONSE_CACHE_PATHS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.cacheable_paths = frozenset(cacheable_paths)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def enabled(self, path):
+        """Whether replies of this agent path are cacheable"""
+        return path in self.cacheable_paths
+
+    def get(self, path, key):
+        """Cached reply for (path, key), or None"""
+        if path not in self.cacheable_paths:
+            return None
+        with self._lock:
+            entry = self._entries.get((path, key))
+            if entry is None:
+                self.misses += 1
+                return None
+
+            reply, stored_at = entry
+            if self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[(path, key)]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end((path, key))
+            self.hits += 1
+            return reply
+
+    def put(self, path, key, reply):
+        """Store a reply and evict least recently used entries"""
+        if path not in self.cacheable_paths or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries.pop((path, key), None)
+            self._entries[(path, key)] = (reply, time.monotonic())
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Counters and occupancy for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "cacheable_paths": sorted(self.cacheable_paths),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
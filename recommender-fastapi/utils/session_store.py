@@ -0,0 +1,143 @@
+# session_store.py - Bounded per-session conversation state
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+
+# Rough bookkeeping cost of one stored turn / one session record
+_TURN_OVERHEAD_BYTES = 72
+_SESSION_OVERHEAD_BYTES = 600
+
+DEFAULT_SESSION_ID = "default"
+
+class SessionState:
+    """Compact conversation record for one customer session"""
+
+    __slots__ = ("session_id", "turns", "profile", "message_count", "last_seen", "nbytes", "_store")
+
+    def __init__(self, session_id, max_turns, store):
+        self.session_id = session_id
+        # (is_user, content) pairs; the oldest fall off once max_turns is reached
+        self.turns = deque(maxlen=max_turns)
+        self.profile = {"preferences": [], "budget": None, "occasion": None}
+        self.message_count = 0
+        self.last_seen = time.monotonic()
+        self.nbytes = _SESSION_OVERHEAD_BYTES
+        self._store = store
+
+    def add_turn(self, role, content):
+        """Append a user or assistant turn"""
+        self._store._record_turn(self, role == "user", content)
+
+    def history(self):
+        """Turns as role/content dicts (API format)"""
+        return [
+            {"role": "user" if is_user else "assistant", "content": content}
+            for is_user, content in self.turns
+        ]
+
+class SessionStore:
+    """
+    Session-keyed conversation state with bounded memory
+
+    Each session keeps at most max_turns turns, sessions idle longer than
+    idle_ttl_seconds are dropped, and once the store exceeds max_bytes the
+    least recently used sessions are evicted.
+    """
+
+    def __init__(self, max_turns=20, idle_ttl_seconds=1800, max_bytes=64 * 1024 * 1024):
+        self.max_turns = max_turns
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_bytes = max_bytes
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.idle_evictions = 0
+        self.lru_evictions = 0
+
+    @staticmethod
+    def _turn_bytes(content):
+        return sys.getsizeof(content) + _TURN_OVERHEAD_BYTES
+
+    def _drop(self, session_id):
+        session = self._sessions.pop(session_id)
+        self.current_bytes -= session.nbytes
+
+    def _expire_idle(self, now):
+        """Drop idle sessions; the LRU order means they sit at the front"""
+        if not self.idle_ttl_seconds:
+            return
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_seen <= self.idle_ttl_seconds:
+                break
+            self._drop(session_id)
+            self.idle_evictions += 1
+
+    def _enforce_ceiling(self, keep):
+        """Evict least recently used sessions (never keep) until under max_bytes"""
+        while self.current_bytes > self.max_bytes and len(self._sessions) > 1:
+            session_id = next(iter(self._sessions))
+            if session_id == keep:
+                break
+            self._drop(session_id)
+            self.lru_evictions += 1
+
+    def get(self, session_id=None):
+        """Get or create the state for a session and mark it recently used"""
+        session_id = session_id or DEFAULT_SESSION_ID
+        now = time.monotonic()
+        with self._lock:
+            self._expire_idle(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = SessionState(session_id, self.max_turns, self)
+                self._sessions[session_id] = session
+                self.current_bytes += session.nbytes
+                self._enforce_ceiling(keep=session_id)
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_seen = now
+            return session
+
+    def peek(self, session_id=None):
+        """Existing state for a session without creating one, or None"""
+        with self._lock:
+            return self._sessions.get(session_id or DEFAULT_SESSION_ID)
+
+    def clear(self, session_id=None):
+        """Forget one session's history and profile"""
+        with self._lock:
+            if (session_id or DEFAULT_SESSION_ID) in self._sessions:
+                self._drop(session_id or DEFAULT_SESSION_ID)
+
+    def _record_turn(self, session, is_user, content):
+        with self._lock:
+            if len(session.turns) == session.turns.maxlen:
+                _, oldest = session.turns[0]
+                delta = -self._turn_bytes(oldest)
+            else:
+                delta = 0
+            session.turns.append((is_user, content))
+            delta += self._turn_bytes(content)
+            if is_user:
+                session.message_count += 1
+
+            session.nbytes += delta
+            # Only sessions still in the store count toward the ceiling
+            if self._sessions.get(session.session_id) is session:
+                self.current_bytes += delta
+                self._enforce_ceiling(keep=session.session_id)
+
+    def stats(self):
+        """Occupancy and eviction counters for monitoring"""
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "max_turns": self.max_turns,
+                "idle_ttl_seconds": self.idle_ttl_seconds,
+                "idle_evictions": self.idle_evictions,
+                "lru_evictions": self.lru_evictions,
+            }
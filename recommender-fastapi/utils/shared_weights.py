@@ -0,0 +1,104 @@
+# shared_weights.py - Map model weights from safetensors files shared by all workers
+import json
+import mmap
+import os
+import re
+import struct
+import tempfile
+
+import torch
+
+_DTYPES = {
+    "F64": torch.float64, "F32": torch.float32, "F16": torch.float16, "BF16": torch.bfloat16,
+    "I64": torch.int64, "I32": torch.int32, "I16": torch.int16, "I8": torch.int8,
+    "U8": torch.uint8, "BOOL": torch.bool,
+}
+
+def map_safetensors(path):
+    """
+    Tensors of a safetensors file backed directly by a memory map
+
+    The file is mapped copy-on-write: every process mapping it reads the same
+    page-cache pages, and a page is only duplicated if a process writes to it
+    (inference never does). Nothing is read until a tensor is touched.
+
+    Returns:
+        {name: tensor}
+    """
+    with open(path, "rb") as f:
+        header_size = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_size))
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    data_start = 8 + header_size
+    tensors = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        dtype = _DTYPES[info["dtype"]]
+        start, end = info["data_offsets"]
+        count = (end - start) // torch.empty((), dtype=dtype).element_size()
+        # frombuffer keeps the mmap alive for as long as the tensor exists
+        tensor = torch.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + start) if count else torch.empty(0, dtype=dtype)
+        tensors[name] = tensor.view(info["shape"])
+    return tensors
+
+def load_shared_weights(module, path):
+    """
+    Point a module's parameters at the mapped tensors of a safetensors file
+
+    The module's own copies are released, so its weights live in the shared
+    page cache instead of this process's private memory.
+
+    Returns:
+        Number of bytes now backed by the shared file
+    """
+    tensors = map_safetensors(path)
+    own_keys = set(module.state_dict().keys())
+    mapped = {name: tensor for name, tensor in tensors.items() if name in own_keys}
+    missing = own_keys - set(mapped)
+
+    module.load_state_dict(mapped, strict=False, assign=True)
+    if hasattr(module, "tie_weights"):
+        # Tied output embeddings are not stored separately in the file
+        module.tie_weights()
+
+    if missing:
+        print(f"[INFO] {len(missing)} tensors not in {os.path.basename(str(path))} stay private (tied or buffers)")
+    return sum(t.numel() * t.element_size() for t in mapped.values())
+
+def export_shared_weights(module, path):
+    """
+    Write a module's state dict as safetensors once, for other workers to map
+
+    The first worker to get here writes the file atomically; the rest (and
+    later restarts) find it already in place.
+    """
+    if os.path.exists(path):
+        return path
+
+    from safetensors.torch import save_file
+
+    state, seen = {}, {}
+    for name, tensor in module.state_dict().items():
+        # safetensors refuses aliased tensors; store each storage once
+        if tensor.data_ptr() in seen:
+            continue
+        seen[tensor.data_ptr()] = name
+        state[name] = tensor.detach().cpu().contiguous()
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    os.close(fd)
+    try:
+        save_file(state, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+def shared_weights_path(directory, model_name):
+    """File name for an exported model inside the shared weights directory"""
+    return os.path.join(directory, re.sub(r"[^\w.-]+", "__", model_name) + ".safetensors")
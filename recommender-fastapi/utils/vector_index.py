@@ -0,0 +1,140 @@
+# vector_index.py - Pluggable nearest-neighbour index backends for EmbeddingEngine
+import numpy as np
+
+class ExactIndex:
+    """Brute-force index - scores every row with one matrix product"""
+
+    name = "exact"
+
+    def __init__(self, embeddings):
+        pass
+
+    def add(self, start_row, vectors):
+        """Nothing to maintain - new rows are scored straight from the matrix"""
+        pass
+
+    def needs_rebuild(self):
+        """Never - there is no structure to go stale"""
+        return False
+
+    def search(self, queries, embeddings):
+        """
+        Score normalized queries (n_queries, dim) against the matrix
+
+        Returns:
+            List of (rows, scores) per query; rows is None when scores cover every row
+        """
+        scores = queries @ embeddings.T
+        return [(None, scores[i]) for i in range(len(queries))]
+
+class IVFIndex:
+    """
+    Inverted-file index: rows are bucketed under k-means centroids and a query
+    only scores the rows in its nprobe closest buckets
+
+    Knobs:
+        nlist: number of buckets (default ~sqrt(n_rows)); more = faster, lower recall
+        nprobe: buckets scanned per query; more = higher recall, slower. The
+            defaults reach ~0.93 recall@10 against ExactIndex while scoring ~8%
+            of the rows on 10k noisy clustered vectors (tests/test_vector_index.py)
+        train_iters / train_sample: k-means effort at build time
+        max_pending_ratio: rows added since the build, as a fraction of the rows
+            built with, past which the owner should rebuild the index
+    """
+
+    name = "ivf"
+
+    def __init__(self, embeddings, nlist=None, nprobe=8, train_iters=10, train_sample=50000, seed=0,
+                 max_pending_ratio=0.25):
+        n_rows = len(embeddings)
+        self.built_rows = n_rows
+        self.max_pending_ratio = max_pending_ratio
+        self.nprobe = max(1, int(nprobe))
+        self.nlist = int(nlist) if nlist else max(1, int(np.sqrt(n_rows)))
+        self.nlist = max(1, min(self.nlist, n_rows))
+        self.centroids = self._train(np.asarray(embeddings, dtype=np.float32), train_iters, train_sample, seed)
+
+        assignments = self._assign(embeddings)
+        # CSR layout: rows of bucket b are list_rows[offsets[b]:offsets[b + 1]]
+        self.list_rows = np.argsort(assignments, kind="stable").astype(np.int64)
+        self.offsets = np.searchsorted(assignments[self.list_rows], np.arange(self.nlist + 1))
+        # Rows added after build live in a small side list until the next rebuild
+        self._pending = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32))
+
+    def _train(self, embeddings, train_iters, train_sample, seed):
+        """Spherical k-means over a sample of the (normalized) rows"""
+        if len(embeddings) == 0:
+            return np.zeros((1, embeddings.shape[1] if embeddings.ndim == 2 else 0), dtype=np.float32)
+
+        rng = np.random.default_rng(seed)
+        if len(embeddings) > train_sample:
+            sample = embeddings[rng.choice(len(embeddings), train_sample, replace=False)]
+        else:
+            sample = embeddings
+        centroids = sample[rng.choice(len(sample), self.nlist, replace=False)].copy()
+
+        for _ in range(max(1, train_iters)):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=self.nlist)
+            empty = counts == 0
+            # Re-seed empty buckets so every list stays useful
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = (sums / (norms + 1e-10)).astype(np.float32)
+
+        return np.ascontiguousarray(centroids)
+
+    def _assign(self, vectors):
+        if len(vectors) == 0:
+            return np.empty(0, dtype=np.int32)
+        return np.argmax(np.asarray(vectors, dtype=np.float32) @ self.centroids.T, axis=1).astype(np.int32)
+
+    def add(self, start_row, vectors):
+        """Bucket newly appended rows under their nearest existing centroid"""
+        rows, buckets = self._pending
+        new_rows = np.arange(start_row, start_row + len(vectors), dtype=np.int64)
+        # Swap the tuple in one assignment so concurrent searches see a consistent pair
+        self._pending = (np.concatenate([rows, new_rows]), np.concatenate([buckets, self._assign(vectors)]))
+
+    def needs_rebuild(self):
+        """Whether the side list of added rows outgrew max_pending_ratio (it is scanned linearly)"""
+        return len(self._pending[0]) > self.built_rows * self.max_pending_ratio
+
+    def search(self, queries, embeddings):
+        """
+        Score normalized queries against rows in their nprobe nearest buckets
+
+        Returns:
+            List of (rows, scores) per query
+        """
+        n_rows = len(embeddings)
+        nprobe = min(self.nprobe, self.nlist)
+        coarse = queries @ self.centroids.T
+        probes = np.argpartition(-coarse, nprobe - 1, axis=1)[:, :nprobe]
+        pending_rows, pending_buckets = self._pending
+
+        results = []
+        for query, probe in zip(queries, probes):
+            parts = [self.list_rows[self.offsets[b]:self.offsets[b + 1]] for b in probe]
+            if len(pending_rows):
+                parts.append(pending_rows[np.isin(pending_buckets, probe)])
+            rows = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+            # Rows past this snapshot's size were appended by a later update
+            rows = rows[rows < n_rows]
+            results.append((rows, embeddings[rows] @ query))
+        return results
+
+INDEX_BACKENDS = {
+    ExactIndex.name: ExactIndex,
+    IVFIndex.name: IVFIndex,
+}
+
+def create_vector_index(backend, embeddings, **params):
+    """Build an index backend by name ("exact" or "ivf")"""
+    try:
+        index_cls = INDEX_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown index backend '{backend}' (choose from {', '.join(INDEX_BACKENDS)})")
+    return index_cls(embeddings, **params)
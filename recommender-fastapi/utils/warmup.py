@@ -0,0 +1,89 @@
+# warmup.py - Background warm-up progress for the readiness probe
+import threading
+import time
+from contextlib import contextmanager
+
+PENDING, RUNNING, READY, FAILED, SKIPPED = "pending", "running", "ready", "failed", "skipped"
+
+class WarmupTracker:
+    """
+    Per-component warm-up state and timings
+
+    The service answers liveness checks as soon as it starts; it reports
+    ready once every required component has finished warming up. Optional
+    components show their progress but never hold readiness back.
+    """
+
+    def __init__(self):
+        self._components = {}
+        self._lock = threading.Lock()
+        self._started_at = time.monotonic()
+
+    def register(self, name, required=True):
+        """Declare a component before warm-up starts"""
+        with self._lock:
+            self._components[name] = {
+                "status": PENDING,
+                "required": required,
+                "seconds": None,
+                "error": None,
+                "_started": None,
+            }
+
+    def _set(self, name, **fields):
+        with self._lock:
+            self._components.setdefault(name, {
+                "status": PENDING, "required": False, "seconds": None, "error": None, "_started": None,
+            }).update(fields)
+
+    def start(self, name):
+        self._set(name, status=RUNNING, _started=time.monotonic())
+
+    def finish(self, name, status=READY, error=None):
+        with self._lock:
+            component = self._components[name]
+            started = component["_started"]
+            component.update(
+                status=status,
+                error=error,
+                seconds=round(time.monotonic() - started, 3) if started is not None else None,
+            )
+
+    def skip(self, name, reason=None):
+        """Component not available in this deployment; doesn't block readiness"""
+        self._set(name, status=SKIPPED, required=False, error=reason)
+
+    @contextmanager
+    def track(self, name):
+        """Time a warm-up step; exceptions mark the component failed and propagate"""
+        self.start(name)
+        try:
+            yield
+        except Exception as e:
+            self.finish(name, FAILED, str(e))
+            raise
+        self.finish(name)
+
+    def status(self, name):
+        with self._lock:
+            component = self._components.get(name)
+            return component["status"] if component else None
+
+    def report(self):
+        """Readiness, overall progress and per-component status / timings"""
+        with self._lock:
+            now = time.monotonic()
+            components = {}
+            for name, component in self._components.items():
+                entry = {key: value for key, value in component.items() if not key.startswith("_")}
+                if component["status"] == RUNNING:
+                    entry["seconds"] = round(now - component["_started"], 3)
+                components[name] = entry
+            done = sum(1 for c in self._components.values() if c["status"] in (READY, FAILED, SKIPPED))
+            ready = all(c["status"] == READY for c in self._components.values() if c["required"])
+            return {
+                "ready": ready,
+                "uptime_seconds": round(now - self._started_at, 3),
+                "progress": f"{done}/{len(self._components)}",
+                "components": components,
+            }